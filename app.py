@@ -1,7 +1,9 @@
 import streamlit as st
 from init_db import init_db
 from background_tasks import BackgroundTaskManager
-from ui_pages import render_sidebar, render_case_manager, render_test_runner, render_history, render_stats
+from profiling import maybe_flush_ui
+from ui_pages import render_sidebar, render_case_manager, render_test_runner, render_history, render_stats, render_log_viewer, \
+    render_throughput_profiler, render_regression_tracker
 
 
 @st.cache_resource
@@ -30,3 +32,12 @@ elif menu == "历史记录":
     render_history()
 elif menu == "统计分析":
     render_stats()
+elif menu == "运行日志":
+    render_log_viewer(task_mgr)
+elif menu == "吞吐测试":
+    render_throughput_profiler(task_mgr)
+elif menu == "回归对比":
+    render_regression_tracker()
+
+# 开启 PROFILING 时定期保存页面渲染的耗时汇总
+maybe_flush_ui()
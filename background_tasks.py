@@ -1,8 +1,30 @@
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from database import update_eval_scores, get_connection, get_eval_record_by_id
-from llm_client import call_llm, call_all_evaluators, call_evaluator
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, CancelledError
+from database import (update_eval_scores, get_connection, get_eval_record_by_id, get_eval_records_by_ids,
+                      get_fingerprint_counts, count_filtered_records, iter_filtered_records, create_rescore_job,
+                      update_rescore_job, get_rescore_job, save_run_environment)
+from llm_client import (call_llm, call_evaluator, call_evaluator_batch, evaluate_response, JUDGE_SKIPPED_REASON,
+                        get_active_judge_levels, get_local_judges)
+from server_props import props_cache, is_local_endpoint
+from prompt_builder import order_cases_by_prefix, get_case_prompt, effective_case_hash, compute_run_fingerprint
+from preflight import preflight_case
+from eval_pipeline import EvalPipeline
+from job_progress import JobProgress
+from event_log import log_event, debug, format_event
+from cancellation import CancellationToken, TaskCancelled
+from generation_budget import resolve_generation_budget, TRUNCATION_REASONS
+from endpoint_scheduler import get_provider_limits
+from warmup import warm_up_model, cold_start_detector
+from throughput_profiler import run_throughput_sweep
+from server_telemetry import TelemetrySampler
+from run_environment import collect_environment, describe_environment, get_server_sampling
+import profiling
+from openai import BadRequestError
+from config_utils import get_setting
+import config
 
 
 def get_safe_result(res, key, default):
@@ -22,59 +44,164 @@ def is_local_model(api_base):
     if not api_base:
         return True  # 无 API 地址时默认使用本地配置
     
-    local_keywords = ['localhost', '127.0.0.1', '10.', '192.168.', '0.0.0.0']
-    return any(kw in api_base for kw in local_keywords)
+    return is_local_endpoint(api_base)
+
+
+def existing_eval_results(record):
+    """
+    从评测记录中取出现有的各评委评分，用于部分评委重新评分时合并
+    映射：1=gem, 2=opus, 3=gpt, 4=top2, 5=top（top2 已禁用，登记了本地评委接管时才参与合并）
+    """
+    level_mapping = {
+        'gem': 'eval_score_1',
+        'opus': 'eval_score_2',
+        'gpt': 'eval_score_3',
+        'top': 'eval_score_5'
+    }
+    if 'top2' in get_active_judge_levels():
+        level_mapping['top2'] = 'eval_score_4'
+
+    eval_results = {}
+    for level, db_field in level_mapping.items():
+        eval_results[level] = {
+            "score": record.get(db_field) or 0,
+            "reasoning": record.get(db_field.replace('eval_score_', 'eval_comment_')) or ""
+        }
+        # 保留早停面板中未调用评委的标记
+        if eval_results[level]["reasoning"] == JUDGE_SKIPPED_REASON:
+            eval_results[level]["skipped"] = True
+    return eval_results
 
 
 class BackgroundTaskManager:
     def __init__(self):
         self.is_running = False
-        self.progress = 0.0
         self.status = "空闲"
-        self.logs = []
-        self.current_case = ""
-        self.total_cases = 0
-        self.completed_cases = 0
-        self.failed_cases = 0  # 新增失败计数器
+        self._log_lines = deque(maxlen=500)  # 当前任务的日志行，完整的历史事件见 event_log
+        # 用例/评分计数、正在执行的用例和吞吐统计（线程安全），页面通过 get_progress_snapshot() 读取
+        self.job = JobProgress()
         self.thread = None
         self.stop_requested = False
+        self.cancel_token = CancellationToken()  # 每次运行新建，停止时中止正在进行的请求
+        self.run_id = None  # 当前测试任务的持久化 ID（写入评测记录和遥测采样）
+        self.env_fingerprint = None  # 当前测试任务的运行环境指纹
+        self.sampling_params = {}  # 计入运行指纹的采样参数（未指定温度时为服务端默认采样设置）
         self.eval_executor = ThreadPoolExecutor(max_workers=3)
-        self.llm_executor = ThreadPoolExecutor(max_workers=5)  # 用于并发调用 LLM
-        self.pending_evals = 0
-        self.completed_evals = 0
+        self.llm_executor = ThreadPoolExecutor(max_workers=5)  # 用于并发调用 LLM（大小随服务商并发流上限调整）
+        self._llm_workers = 5
         self.log_lock = threading.Lock()  # 添加日志锁，防止并发写入冲突
+        # 自动评分流水线：生成完成的记录进入有界队列，由评分线程并发处理
+        self.auto_evaluate = False
+        self.eval_pipeline = EvalPipeline(self._evaluate_pipeline_item)
+        # 批量重新评分任务（与测试任务互相独立）
+        self.rescore_thread = None
+        self.rescore_running = False
+        self.rescore_stop_requested = False
+        self.rescore_progress = {}
+        # 端点吞吐测试（与测试任务互斥，避免相互干扰测量结果）
+        self.profile_thread = None
+        self.profile_running = False
+        self.profile_cancel_token = CancellationToken()
+        self.profile_progress = {}
+
+    def add_log(self, msg, level=None, **fields):
+        """
+        记录任务日志：写入结构化事件日志（带任务 ID 和可选的 case/model/record_id/duration_ms），
+        并保留格式化后的日志行供页面显示；未指定级别时根据消息前缀推断
+        """
+        if level is None:
+            level = "ERROR" if "❌" in msg else "WARNING" if "⚠️" in msg else "INFO"
+        event = log_event(level, msg, source="task", job_id=self.job.job_id, **fields)
+
+        # 使用锁保护日志写入，防止并发冲突（deque 超出 500 条时自动丢弃最旧的）
+        with self.log_lock:
+            self._log_lines.append(format_event(event))
 
-    def add_log(self, msg):
-        timestamp = time.strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {msg}"
-        
-        # 使用锁保护日志写入，防止并发冲突
+    @property
+    def logs(self):
         with self.log_lock:
-            self.logs.append(log_entry)
-            # 增加日志缓冲区大小到 500 条
-            if len(self.logs) > 500:
-                self.logs.pop(0)
+            return list(self._log_lines)
+
+    def clear_logs(self):
+        with self.log_lock:
+            self._log_lines.clear()
+
+    # 兼容旧的属性读取方式（侧边栏等页面直接读取这些属性）
+    @property
+    def progress(self):
+        return self.job.progress
+
+    @property
+    def current_case(self):
+        return self.job.current_case
+
+    @property
+    def total_cases(self):
+        return self.job.total
+
+    @property
+    def completed_cases(self):
+        return self.job.completed
 
-    def async_evaluate_and_save(self, case, local_res, record_id):
+    @property
+    def failed_cases(self):
+        return self.job.failed
+
+    @property
+    def pending_evals(self):
+        return self.job.pending_evals
+
+    @property
+    def completed_evals(self):
+        return self.job.completed_evals
+
+    def add_pending_evals(self, count=1):
+        self.job.add_pending_evals(count)
+
+    def add_completed_evals(self, count=1):
+        self.job.add_completed_evals(count)
+
+    def get_progress_snapshot(self):
+        """返回当前任务的进度快照（计数、吞吐、ETA、正在执行的用例），附带运行状态"""
+        snapshot = self.job.snapshot()
+        snapshot.update({"is_running": self.is_running, "status": self.status})
+        return snapshot
+
+    def async_evaluate_and_save(self, case, local_res, record_id, cancel_token=None):
         try:
             self.add_log(f"[异步评分] 开始评分用例：{case['title']}")
-            eval_results = call_all_evaluators(case['prompt'], case['reference_answer'], local_res['content'])
+            eval_results = evaluate_response(case['prompt'], case['reference_answer'], local_res['content'],
+                                             cancel_token)
 
-            any_fail = any("评委调用在" in get_safe_result(res, 'reasoning', "") for res in eval_results.values())
+            if any(get_safe_result(res, 'cancelled', False) for res in eval_results.values()):
+                # 任务已停止：不写入部分评分，记录保持 "待评分"
+                self.add_log(f"[异步评分] ⏹️ 用例 '{case['title']}' 评分已取消", record_id=record_id)
+                return False
+
+            any_fail = any(get_safe_result(res, 'failed', False) for res in eval_results.values())
 
             if any_fail:
                 self.add_log(f"[异步评分] ⚠️ 用例 '{case['title']}' 部分评分失败")
             else:
-                scores_str = ", ".join([f"{k}: {get_safe_result(v, 'score', 0)}" for k, v in eval_results.items()])
+                scores_str = ", ".join([f"{k}: {get_safe_result(v, 'score', 0)}" for k, v in eval_results.items()
+                                        if not get_safe_result(v, 'skipped', False)])
                 self.add_log(f"[异步评分] 用例 '{case['title']}' 评分完成：{scores_str}")
 
             update_eval_scores(record_id, eval_results)
             self.add_log(f"[异步评分] ✅ 用例 '{case['title']}' 评分已更新到数据库")
+            return not any_fail
 
         except Exception as e:
             self.add_log(f"[异步评分] ❌ 用例 '{case['title']}' 评分失败：{str(e)}")
+            return False
         finally:
-            self.completed_evals += 1
+            self.add_completed_evals()
+
+    def _evaluate_pipeline_item(self, item):
+        """评分流水线的处理函数：item 为 (case, local_res, record_id, cancel_token, job_id)"""
+        case, local_res, record_id, cancel_token, job_id = item
+        with profiling.job_scope(job_id):
+            return self.async_evaluate_and_save(case, local_res, record_id, cancel_token)
 
     def async_re_evaluate(self, record_id, case_title, prompt, reference_answer, local_response, target_levels=None):
         try:
@@ -83,44 +210,30 @@ class BackgroundTaskManager:
             
             # 如果没有指定目标级别，则评分全部
             if not target_levels:
-                eval_results = call_all_evaluators(prompt, reference_answer, local_response)
+                eval_results = evaluate_response(prompt, reference_answer, local_response)
             else:
                 # 获取现有评分记录以合并
-                existing_record = get_eval_record_by_id(record_id)
-                eval_results = {}
-                
-                # 初始化现有值（使用新的字段名）
-                # 映射：1=gem, 2=opus, 3=gpt, 4=top2, 5=top
-                level_mapping = {
-                    'gem': 'eval_score_1',
-                    'opus': 'eval_score_2',
-                    'gpt': 'eval_score_3',
-                    'top': 'eval_score_5'
-                }
-                
-                for level, db_field in level_mapping.items():
-                    eval_results[level] = {
-                        "score": existing_record.get(db_field, 0),
-                        "reasoning": existing_record.get(db_field.replace('eval_score_', 'eval_comment_'), "")
-                    }
+                eval_results = existing_eval_results(get_eval_record_by_id(record_id))
                 
                 # 仅针对指定级别并行调用评委
                 from concurrent.futures import ThreadPoolExecutor as EvalExecutor
                 with EvalExecutor(max_workers=len(target_levels)) as executor:
-                    futures = {level: executor.submit(call_evaluator, prompt, reference_answer, local_response, level) 
+                    futures = {level: executor.submit(profiling.bind_job(call_evaluator), prompt, reference_answer,
+                                                      local_response, level)
                                for level in target_levels}
                     for level, future in futures.items():
                         try:
                             eval_results[level] = future.result()
                         except Exception as e:
-                            eval_results[level] = {"score": 0, "reasoning": f"评委调用失败：{str(e)}"}
+                            eval_results[level] = {"score": 0, "reasoning": f"评委调用失败：{str(e)}", "failed": True}
 
-            any_fail = any("评委调用在" in get_safe_result(res, 'reasoning', "") for res in eval_results.values())
+            any_fail = any(get_safe_result(res, 'failed', False) for res in eval_results.values())
 
             if any_fail:
                 self.add_log(f"[重新评分] ⚠️ 记录 {record_id} 部分评分失败")
             else:
-                scores_str = ", ".join([f"{k}: {get_safe_result(v, 'score', 0)}" for k, v in eval_results.items()])
+                scores_str = ", ".join([f"{k}: {get_safe_result(v, 'score', 0)}" for k, v in eval_results.items()
+                                        if not get_safe_result(v, 'skipped', False)])
                 self.add_log(f"[重新评分] 记录 {record_id} 评分完成：{scores_str}")
 
             update_eval_scores(record_id, eval_results)
@@ -129,27 +242,259 @@ class BackgroundTaskManager:
         except Exception as e:
             self.add_log(f"[重新评分] ❌ 记录 {record_id} 评分失败：{str(e)}")
         finally:
-            self.completed_evals += 1
+            self.add_completed_evals()
 
     def submit_re_evaluate(self, record_id, case_title, prompt, reference_answer, local_response, target_levels=None):
-        self.pending_evals += 1
+        self.add_pending_evals()
         self.eval_executor.submit(self.async_re_evaluate, record_id, case_title, prompt, reference_answer, local_response, target_levels)
         levels_str = ", ".join(target_levels) if target_levels else "全部"
         self.add_log(f"🔄 已提交记录 {record_id} ({case_title}) 到异步重新评分队列 (目标：{levels_str})")
 
-    def process_single_case(self, case, api_base, api_key, model_id):
-        """处理单个测试用例（在独立线程中执行）"""
-        self.current_case = case['title']
-        self.status = f"正在处理：{self.current_case}"
-        
+    def async_batch_evaluate(self, records, target_levels=None, cancel_token=None):
+        """
+        批量评分同一用例下的多条记录：每位评委一次请求评完全部候选回答
+        records: 同一 case_id 的记录字典列表（包含 prompt、reference_answer、local_response）
+        cancel_token: 取消时关闭评委连接，评分被取消的记录保持原样、不写入部分评分
+        """
+        record_ids = [record['id'] for record in records]
+        levels = target_levels or get_active_judge_levels()
+        try:
+            first = records[0]
+            self.add_log(f"[批量评分] 开始评分用例 '{first['case_title']}' 的 {len(records)} 条记录 (评委：{', '.join(levels)})")
+            responses = [record['local_response'] or "" for record in records]
+
+            with ThreadPoolExecutor(max_workers=len(levels)) as executor:
+                futures = {level: executor.submit(profiling.bind_job(call_evaluator_batch), first['prompt'],
+                                                  first['reference_answer'], responses, level, cancel_token)
+                           for level in levels}
+                batch_results = {}
+                for level, future in futures.items():
+                    try:
+                        batch_results[level] = future.result()
+                    except Exception as e:
+                        batch_results[level] = [{"score": 0, "reasoning": f"评委调用失败：{str(e)}", "failed": True}] * len(records)
+
+            any_fail = False
+            for index, record in enumerate(records):
+                eval_results = existing_eval_results(record) if target_levels else {}
+                for level in levels:
+                    eval_results[level] = batch_results[level][index]
+                    any_fail = any_fail or get_safe_result(eval_results[level], 'failed', False)
+                if any(get_safe_result(eval_results[level], 'cancelled', False) for level in levels):
+                    any_fail = True
+                    continue
+                update_eval_scores(record['id'], eval_results)
+
+            self.add_log(f"[批量评分] ✅ 记录 {record_ids} 评分已更新到数据库")
+            return not any_fail
+
+        except Exception as e:
+            self.add_log(f"[批量评分] ❌ 记录 {record_ids} 评分失败：{str(e)}")
+            return False
+        finally:
+            self.add_completed_evals(len(records))
+
+    def submit_batch_evaluate(self, record_ids, target_levels=None):
+        """
+        将记录按用例分组后提交批量评分：同一用例的不同模型回答合并到一次评委请求中，
+        每批最多 EVALUATOR_BATCH_SIZE 条
+        """
+        batch_size = max(1, get_setting("EVALUATOR_BATCH_SIZE", 4))
+        by_case = {}
+        for record in get_eval_records_by_ids(record_ids):
+            by_case.setdefault(record['case_id'], []).append(record)
+
+        for case_records in by_case.values():
+            for start in range(0, len(case_records), batch_size):
+                chunk = case_records[start:start + batch_size]
+                self.add_pending_evals(len(chunk))
+                self.eval_executor.submit(self.async_batch_evaluate, chunk, target_levels)
+        self.add_log(f"🔄 已提交 {len(record_ids)} 条记录到批量评分队列 (共 {len(by_case)} 个用例，每批最多 {batch_size} 条)")
+
+    def run_rescore_job(self, job_id):
+        """
+        执行（或从检查点继续）批量重新评分任务：按记录 ID 分块读取检查点之后的记录，
+        同一用例的记录合并为批量评委请求，每块处理完成后保存检查点
+        """
+        job = get_rescore_job(job_id)
+        if job is None:
+            self.add_log(f"[批量重评] ❌ 任务 {job_id} 不存在")
+            self.rescore_running = False
+            return
+
+        filters = job['filters']
+        target_levels = job['target_levels'] or None
+        batch_size = max(1, get_setting("EVALUATOR_BATCH_SIZE", 4))
+        workers = max(1, get_setting("EVAL_PIPELINE_WORKERS", 4))
+        chunk_size = max(1, get_setting("RESCORE_CHUNK_SIZE", 200))
+        processed, failed, last_id = job['processed'] or 0, job['failed'] or 0, job['last_record_id'] or 0
+
+        self.rescore_stop_requested = False
+        self.rescore_progress = {"job_id": job_id, "total": job['total'], "processed": processed, "failed": failed}
+        update_rescore_job(job_id, status='running')
+        levels_str = ", ".join(target_levels) if target_levels else "全部"
+        self.add_log(f"[批量重评] 任务 {job_id} 开始：共 {job['total']} 条，已完成 {processed} 条，从记录 ID {last_id} 之后继续 (评委：{levels_str})")
+
+        status = 'completed'
+        profiling.begin_job(f"rescore-{job_id}")
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for chunk in iter_filtered_records(filters, last_id, chunk_size):
+                    if self.rescore_stop_requested:
+                        status = 'stopped'
+                        break
+
+                    by_case = {}
+                    for record in chunk:
+                        by_case.setdefault(record['case_id'], []).append(record)
+                    batches = [case_records[start:start + batch_size] for case_records in by_case.values()
+                               for start in range(0, len(case_records), batch_size)]
+
+                    self.add_pending_evals(len(chunk))
+                    results = executor.map(profiling.bind_job(lambda batch: self.async_batch_evaluate(batch, target_levels)),
+                                           batches)
+                    for batch, success in zip(batches, results):
+                        if not success:
+                            failed += len(batch)
+
+                    # 整块完成后再保存检查点，中断时最多重做一块
+                    processed += len(chunk)
+                    last_id = chunk[-1]['id']
+                    update_rescore_job(job_id, processed=processed, failed=failed, last_record_id=last_id)
+                    self.rescore_progress.update({"processed": processed, "failed": failed})
+                    self.add_log(f"[批量重评] 任务 {job_id} 进度：{processed}/{job['total']} (失败 {failed})")
+        except Exception as e:
+            status = 'failed'
+            self.add_log(f"[批量重评] ❌ 任务 {job_id} 异常中断：{str(e)}")
+        finally:
+            profiling.end_job(f"rescore-{job_id}")
+            update_rescore_job(job_id, status=status)
+            self.rescore_progress["status"] = status
+            self.rescore_running = False
+
+        if status == 'completed':
+            self.add_log(f"[批量重评] 🎉 任务 {job_id} 完成：共处理 {processed} 条，失败 {failed} 条")
+        elif status == 'stopped':
+            self.add_log(f"[批量重评] 🛑 任务 {job_id} 已停止，检查点：记录 ID {last_id}")
+
+    def start_rescore_job(self, filters, target_levels=None):
+        """
+        按筛选条件创建并启动批量重新评分任务
+
+        Returns:
+            int: 任务 ID；已有批量重评任务在运行时返回 None
+        """
+        if self.rescore_running:
+            return None
+        if target_levels and filters.get("only_failed") and not filters.get("judge_levels"):
+            filters = dict(filters, judge_levels=list(target_levels))
+        total = count_filtered_records(filters)
+        job_id = create_rescore_job(filters, target_levels, total)
+        self.resume_rescore_job(job_id)
+        return job_id
+
+    def resume_rescore_job(self, job_id):
+        """从检查点继续（或启动）指定的批量重新评分任务"""
+        if self.rescore_running:
+            return False
+        self.rescore_running = True
+        self.rescore_thread = threading.Thread(target=self.run_rescore_job, args=(job_id,), daemon=True)
+        self.rescore_thread.start()
+        return True
+
+    def stop_rescore_job(self):
+        """请求停止批量重新评分（当前块完成并保存检查点后停止）"""
+        self.rescore_stop_requested = True
+
+    def run_throughput_profile(self, api_base, api_key, model_id, concurrency_levels, prompt_lengths, max_tokens):
+        """执行端点吞吐测试（并发数 × 提示词长度扫描），结果保存到 throughput_profiles 表"""
+        self.profile_progress = {"completed": 0, "total": 0, "points": [], "status": "running", "run_id": None}
+        self.add_log(f"[吞吐测试] 开始：{model_id or '本地默认模型'} @ {api_base or '本地默认地址'}")
+
+        def on_point(point, index, total):
+            self.profile_progress.update({"completed": index, "total": total})
+            self.profile_progress["points"].append(point)
+            if point.get("skipped"):
+                self.add_log(f"[吞吐测试] 跳过 并发 {point['concurrency']} / 提示词 {point['prompt_tokens_target']}：{point['error']}")
+            else:
+                self.add_log(f"[吞吐测试] {index}/{total} 并发 {point['concurrency']} / 提示词 {point['prompt_tokens_target']}："
+                             f"聚合 {point['aggregate_tps']:.1f} t/s，单流 {point['per_stream_tps']:.1f} t/s，"
+                             f"TTFT p50 {point['ttft_ms_p50']:.0f} ms")
+
+        try:
+            run_id = run_throughput_sweep(api_base, api_key, model_id, concurrency_levels, prompt_lengths, max_tokens,
+                                          cancel_token=self.profile_cancel_token, on_point=on_point)
+            self.profile_progress["run_id"] = run_id
+            self.profile_progress["status"] = "stopped" if self.profile_cancel_token.cancelled else "completed"
+            self.add_log(f"[吞吐测试] 🎉 完成 (run_id: {run_id})")
+        except Exception as e:
+            self.profile_progress["status"] = "failed"
+            self.add_log(f"[吞吐测试] ❌ 异常中断：{str(e)}")
+        finally:
+            self.profile_running = False
+
+    def start_throughput_profile(self, api_base=None, api_key=None, model_id=None, concurrency_levels=None,
+                                 prompt_lengths=None, max_tokens=None):
+        """
+        启动端点吞吐测试
+
+        Returns:
+            bool: False 表示已有吞吐测试或测试任务在运行
+        """
+        if self.profile_running or self.is_running:
+            return False
+        self.profile_running = True
+        self.profile_cancel_token = CancellationToken()
+        self.profile_thread = threading.Thread(
+            target=self.run_throughput_profile,
+            args=(api_base, api_key, model_id, concurrency_levels, prompt_lengths, max_tokens),
+            daemon=True
+        )
+        self.profile_thread.start()
+        return True
+
+    def stop_throughput_profile(self):
+        """停止吞吐测试（中止正在进行的请求）"""
+        self.profile_cancel_token.cancel("吞吐测试已停止")
+
+    def get_run_fingerprint(self, case, model_id, temperature=None, max_tokens=None, full_prompt=None):
+        """
+        计算用例在指定模型下的 (用例内容哈希, 运行指纹)，采样参数取自当前任务的 sampling_params，
+        max_tokens 为生成预算解析出的生成长度上限（会改变输出，计入指纹；不限制时不计入），
+        full_prompt 为实际发送的提示词（预检截断后与完整用例不同，哈希随之不同）
+        """
+        case_hash = effective_case_hash(case, full_prompt)
+        effective_model = model_id or config.LOCAL_MODEL_ID
+        sampling_params = dict(self.sampling_params, max_tokens=int(max_tokens)) if max_tokens else self.sampling_params
+        return case_hash, compute_run_fingerprint(case_hash, effective_model, temperature, sampling_params)
+
+    def process_single_case(self, case, api_base, api_key, model_id, slot_id=None, full_prompt=None,
+                            temperature=None, sample_index=0, prompt_tokens=None, prefix_reused=False):
+        """
+        处理单个测试用例（在独立线程中执行），prompt_tokens 为预检得到的提示词 token 数，
+        prefix_reused 表示服务端可能已缓存该提示词的前缀（冷启动检测不把它的预读速度作为参考样本）
+        """
         # 显示模型信息和测试用例信息
         model_display = model_id if model_id else "local"
-        self.add_log(f">>> 开始测试用例：{self.current_case}")
+        task_id = self.job.start_task(case['title'], model=model_display, sample_index=sample_index)
+        self.status = f"正在处理：{case['title']}"
+        self.add_log(f">>> 开始测试用例：{case['title']}", case=case['title'], model=model_display)
         self.add_log(f"    模型：{model_display}")
         self.add_log(f"    API: {api_base if api_base else '本地服务'}")
 
         local_res = None
+        generation_start = time.time()
         try:
+            # 提示词按用例缓存，同一用例被多个模型运行时只组装一次（预检截断时使用截断后的提示词）
+            if full_prompt is None:
+                full_prompt = get_case_prompt(case)['prompt']
+
+            # 按模型/用例解析生成预算（max_tokens、墙钟上限、首字超时），开启自适应超时时参考历史延迟，
+            # 首字超时随提示词长度放宽（未预检时按约 3 个字符一个 token 估算）
+            budget = resolve_generation_budget(model_id or config.LOCAL_MODEL_ID, case,
+                                               prompt_tokens or len(full_prompt) // 3)
+            debug(f"生成预算: {budget}", case=case['title'], model=model_display)
+
             # 添加重试逻辑：如果失败则尝试等待 10 秒后重试一次
             max_retries = 1
             for attempt in range(max_retries + 1):
@@ -159,22 +504,55 @@ class BackgroundTaskManager:
                     else:
                         self.add_log("正在请求 LLM...")
                     
-                    local_res = call_llm(case['source_code'], case['prompt'], api_base, api_key, model_id)
+                    local_res = call_llm(case['source_code'], case['prompt'], api_base, api_key, model_id,
+                                         slot_id=slot_id, full_prompt=full_prompt, temperature=temperature,
+                                         cancel_token=self.cancel_token, max_tokens=budget['max_tokens'],
+                                         deadline_s=budget['deadline_s'],
+                                         first_token_timeout_s=budget['first_token_timeout_s'])
                     break  # 成功则跳出循环
+                except (BadRequestError, TaskCancelled):
+                    raise  # 请求本身有误（如超出上下文）或任务已停止，重试没有意义
                 except Exception as e:
+                    if self.cancel_token.cancelled:
+                        raise TaskCancelled(self.cancel_token.reason)
                     if attempt < max_retries:
                         self.add_log(f"⚠️ 请求失败：{str(e)}。等待 10 秒后再次尝试...")
-                        time.sleep(10)
+                        if self.cancel_token.wait(10):
+                            raise TaskCancelled(self.cancel_token.reason)
                     else:
                         raise e  # 最后一次尝试还是失败，抛出异常
 
-            self.add_log(f"本地模型响应成功 ({local_res['completion_tokens']} tokens)")
-            self.add_log(f"    实际模型：{local_res['model_name']}")
+            cancelled = local_res.get('finish_reason') == "cancelled"
+            if cancelled and not local_res['content']:
+                raise TaskCancelled(self.cancel_token.reason)
 
+            self.eval_pipeline.record_generation(time.time() - generation_start)
+            self.add_log(f"本地模型响应成功 ({local_res['completion_tokens']} tokens)", case=case['title'],
+                         model=local_res['model_name'], duration_ms=round(local_res['duration_ms'], 1))
+            self.add_log(f"    实际模型：{local_res['model_name']}")
+            # 本地模型的首字延迟异常（包含模型加载时间）时标记记录，不计入速度统计
+            cold_start = False
+            if not cancelled and is_local_model(api_base):
+                cold_start, cold_reason = cold_start_detector.check(api_base or config.LOCAL_MODEL_URL,
+                                                                    local_res['model_name'], local_res,
+                                                                    prefix_reused)
+                if cold_start:
+                    self.add_log(f"🧊 检测到模型加载：{cold_reason}，该记录不计入速度统计", level="WARNING",
+                                 case=case['title'], model=local_res['model_name'])
+            if local_res.get('finish_reason') in TRUNCATION_REASONS:
+                self.add_log(f"✂️ 生成被截断：{TRUNCATION_REASONS[local_res['finish_reason']]}", level="WARNING",
+                             case=case['title'], model=local_res['model_name'])
+
+            case_hash, run_fingerprint = self.get_run_fingerprint(case, model_id, temperature, budget['max_tokens'],
+                                                                  full_prompt)
+            if cancelled:
+                # 部分输出不算一次完整运行，不写运行指纹，"仅运行缺失" 时会重新生成
+                run_fingerprint = None
             record_data = {
                 "case_id": case['id'],
                 "model_name": local_res['model_name'],
-                "temperature": 0.0,
+                "temperature": temperature,  # None 表示使用服务端默认温度
+                "sample_index": sample_index,
                 "local_response": local_res['content'],
                 "chain_of_thought": local_res['chain_of_thought'],
                 "prompt_tokens": local_res['prompt_tokens'],
@@ -183,8 +561,16 @@ class BackgroundTaskManager:
                 "tokens_per_second": local_res['tps'],
                 "prompt_tps": local_res.get('prompt_tps', 0),
                 "max_context": local_res.get('max_context', 0),
+                "case_hash": case_hash,
+                "run_fingerprint": run_fingerprint,
+                "finish_reason": local_res.get('finish_reason', ''),
+                "ttft_ms": local_res.get('ttft_ms', 0),
+                "cold_start": 1 if cold_start else 0,
+                "job_id": self.run_id,
+                "started_at": local_res.get('started_at'),
+                "env_fingerprint": self.env_fingerprint,
                 "eval_score": 0,
-                "eval_comment": "待评分",
+                "eval_comment": "已取消（部分输出）" if cancelled else "待评分",
                 "eval_score_1": 0,
                 "eval_comment_1": "待评分",
                 "eval_score_2": 0,
@@ -197,121 +583,331 @@ class BackgroundTaskManager:
                 "eval_comment_5": "待评分"
             }
 
+            self.job.update_task(task_id, "保存中")
             from database import save_eval_record
             record_id = save_eval_record(record_data)
 
-            self.add_log(f"✅ 用例 '{self.current_case}' 本地测试完成，已保存 (记录 ID: {record_id})")
-
-            self.pending_evals += 1
-            # self.eval_executor.submit(self.async_evaluate_and_save, case, local_res, record_id)
-            self.add_log(f"🚀 已提交用例 '{self.current_case}' 到异步评分队列 (已禁用自动评分)")
+            if cancelled:
+                # 被取消的生成保存部分输出，不提交评分
+                self.add_log(f"⏹️ 用例 '{case['title']}' 已取消，部分输出已保存 (记录 ID: {record_id})",
+                             case=case['title'], model=local_res['model_name'], record_id=record_id)
+                return False
+
+            self.add_log(f"✅ 用例 '{case['title']}' 本地测试完成，已保存 (记录 ID: {record_id})", case=case['title'],
+                         model=local_res['model_name'], record_id=record_id)
+
+            if self.auto_evaluate:
+                # 队列已满时在这里等待评分线程腾出位置（背压）
+                self.job.update_task(task_id, "等待评分队列")
+                self.add_pending_evals()
+                item = (case, local_res, record_id, self.cancel_token, self.run_id)
+                if self.eval_pipeline.submit(item, should_abort=self.cancel_token.is_cancelled):
+                    self.add_log(f"🚀 已提交用例 '{case['title']}' 到异步评分队列")
+                else:
+                    self.add_pending_evals(-1)
+                    self.add_log(f"⏹️ 任务已停止，用例 '{case['title']}' 未提交评分")
 
+        except TaskCancelled:
+            self.add_log(f"⏹️ 用例 '{case['title']}' 已取消", case=case['title'], model=model_display)
+            return False
         except Exception as e:
-            self.add_log(f"❌ 执行失败：{str(e)}")
+            self.add_log(f"❌ 执行失败：{str(e)}", case=case['title'], model=model_display)
+            if local_res is None:
+                self.eval_pipeline.record_generation(time.time() - generation_start, success=False)
             return False
-        
+        finally:
+            self.job.finish_task(task_id,
+                                 local_res['prompt_tokens'] if local_res else 0,
+                                 local_res['completion_tokens'] if local_res else 0)
+
         return True
 
-    def run_batch_test(self, selected_cases, api_base=None, api_key=None, model_id=None):
-        print(f"\n[DEBUG] BackgroundTaskManager.run_batch_test started with {len(selected_cases)} cases")
-        print(f"[DEBUG] Params: base={api_base}, model={model_id}")
+    def run_batch_test(self, selected_cases, api_base=None, api_key=None, model_id=None, only_missing=False,
+                       samples_per_case=1, temperature=None, auto_evaluate=None):
+        debug(f"BackgroundTaskManager.run_batch_test started with {len(selected_cases)} cases")
+        debug(f"Params: base={api_base}, model={model_id}")
+        samples_per_case = max(1, int(samples_per_case or 1))
         self.is_running = True
         self.stop_requested = False
-        self.progress = 0.0
-        self.completed_cases = 0
-        self.total_cases = len(selected_cases)
-        self.logs = []
-        # 不重置评分计数器，允许累加（支持并发的重新评分任务）
-        # self.pending_evals = 0
-        # self.completed_evals = 0
-
-        # 判断是否为本地模型
-        local_model = is_local_model(api_base)
-        execution_mode = "串行" if local_model else "并发"
-        self.add_log(f"🔧 执行模式: {execution_mode} (模型地址: {api_base or '本地默认'})")
+        self.cancel_token = CancellationToken()
+        # 持久化的任务 ID（评测记录和服务端遥测通过它关联）
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        tracked_base = None
+        try:
+            self.job.reset(len(selected_cases) * samples_per_case)
+            profiling.begin_job(self.run_id)
+            self.clear_logs()
+            # job.reset() 不重置评分计数器，允许累加（支持并发的重新评分任务）
+            self.auto_evaluate = get_setting("AUTO_EVALUATE", False) if auto_evaluate is None else bool(auto_evaluate)
+            self.eval_pipeline.reset_metrics()
+            if self.auto_evaluate:
+                metrics = self.eval_pipeline.get_metrics()
+                self.add_log(f"⚖️ 自动评分已开启：{metrics['workers']} 个评分线程，队列容量 {metrics['queue_size']}")
+
+            # 判断是否为本地模型
+            local_model = is_local_model(api_base)
+            execution_mode = "串行" if local_model else "并发"
+            self.add_log(f"🔧 执行模式: {execution_mode} (模型地址: {api_base or '本地默认'})")
+            if samples_per_case > 1:
+                self.add_log(f"🎲 重复采样：每个用例 {samples_per_case} 次 (temperature={temperature if temperature is not None else '服务端默认'})")
+
+            # 任务开始时预取一次服务端元数据，之后由后台线程刷新，call_llm 只读缓存
+            effective_base = api_base or config.LOCAL_MODEL_URL
+            server_meta = props_cache.prefetch(effective_base)
+            if server_meta:
+                self.add_log(f"🖥️ 服务端信息: n_ctx={server_meta['n_ctx']}, 槽位={server_meta['total_slots']}, 模型={server_meta['model_path'] or '未知'}")
+            props_cache.track(effective_base)
+            tracked_base = effective_base
+
+            # 运行环境指纹（服务端构建、模型文件/量化、采样参数、评测程序版本），写入本次任务的每条记录
+            environment = collect_environment(effective_base, model_id or config.LOCAL_MODEL_ID, temperature)
+            self.env_fingerprint = environment['fingerprint']
+            try:
+                save_run_environment(environment)
+            except Exception as e:
+                debug(f"保存运行环境失败: {e}")
+            self.add_log(f"🧬 运行环境 {self.env_fingerprint}: {describe_environment(environment)}"
+                         f"{' (量化 ' + environment['quant'] + ')' if environment['quant'] else ''}")
+            # 未指定温度时请求不带 temperature，输出取决于服务端默认采样设置，一并计入运行指纹
+            self.sampling_params = {"server": get_server_sampling(effective_base)} if temperature is None else {}
+
+            # 发送前预检上下文长度，超长用例按策略跳过或截断（截断后的提示词计入运行指纹）
+            checks = {}
+            for case in selected_cases:
+                check = preflight_case(case, effective_base, model_name=model_id or config.LOCAL_MODEL_ID)
+                if check['status'] == 'too_long':
+                    self.add_log(f"⏭️ 跳过超长用例：{case['title']} (提示词 {check['prompt_tokens']} tokens，n_ctx={check['n_ctx']})")
+                    continue
+                if check['status'] == 'truncated':
+                    self.add_log(f"✂️ 用例 {case['title']} 超出上下文，已丢弃文件：{', '.join(check['dropped_files'])}")
+                checks[id(case)] = check
+            runnable = [case for case in selected_cases if id(case) in checks]
+            if len(runnable) < len(selected_cases):
+                self.add_log(f"⚠️ 预检共跳过 {len(selected_cases) - len(runnable)} 个超出上下文窗口的用例")
+
+            # 每个用例需要执行的采样次数
+            # "仅运行缺失" 模式：扣除历史记录中已有相同运行指纹的次数，只执行新增或内容有变化的用例
+            sample_plan = [(case, 0, samples_per_case) for case in runnable]
+            if only_missing:
+                effective_model = model_id or config.LOCAL_MODEL_ID
+                case_fingerprints = [
+                    (case, self.get_run_fingerprint(case, model_id, temperature,
+                                                    resolve_generation_budget(effective_model, case)['max_tokens'],
+                                                    checks[id(case)]['full_prompt'])[1])
+                    for case in runnable
+                ]
+                recorded = get_fingerprint_counts(fp for _, fp in case_fingerprints)
+                sample_plan = []
+                for case, fp in case_fingerprints:
+                    existing = recorded.get(fp, 0)
+                    if existing < samples_per_case:
+                        sample_plan.append((case, existing, samples_per_case - existing))
+            self.job.set_total(sum(count for _, _, count in sample_plan))
+            if only_missing:
+                self.add_log(f"♻️ 仅运行缺失：{len(runnable) - len(sample_plan)} 个用例已有足够的相同指纹记录，剩余 {self.total_cases} 次运行待执行")
+
+            # 共享同一上下文的用例相邻执行，并固定到同一槽位，让服务端复用 KV cache
+            total_slots = server_meta.get('total_slots', 0) if server_meta else 0
+            plan_by_case = {id(case): (first, count) for case, first, count in sample_plan}
+            scheduled = []
+            seen_groups = set()
+            for case, group in order_cases_by_prefix([case for case, _, _ in sample_plan]):
+                check = checks[id(case)]
+                first_sample, sample_count = plan_by_case[id(case)]
+                scheduled.append({
+                    "case": case,
+                    "slot_id": group % total_slots if total_slots > 1 else None,
+                    "full_prompt": check['full_prompt'],
+                    "prompt_tokens": check['prompt_tokens'],
+                    "first_sample": first_sample,
+                    "samples": sample_count,
+                    # 同组的第 2 个及之后的用例会命中前一个用例留下的上下文前缀缓存
+                    "prefix_reused": group in seen_groups,
+                })
+                seen_groups.add(group)
+
+            # 任务期间采集本地端点（含本地评委）的 /metrics 和 /slots
+            telemetry = TelemetrySampler(self.run_id, [effective_base] + [judge['base_url'] for judge in get_local_judges().values()])
+            if telemetry.start():
+                self.add_log(f"📡 服务端遥测采样已开启：{', '.join(telemetry.servers)} (每 {telemetry.interval}s，任务 ID {self.run_id})")
+            try:
+                # 本地模型先发送预热请求，避免首个用例的耗时包含模型加载时间
+                cold_start_detector.reset()
+                if local_model and scheduled and get_setting("WARMUP_REQUEST", True):
+                    self.status = "正在预热模型..."
+                    warm = warm_up_model(api_base, api_key, model_id, self.cancel_token)
+                    if warm['ok']:
+                        self.add_log(f"🔥 模型预热完成：耗时 {warm['duration_ms'] / 1000:.1f}s (首字延迟 {warm['ttft_ms'] / 1000:.1f}s)")
+                    else:
+                        self.add_log(f"⚠️ 模型预热失败：{warm['error']}")
+                self._run_cases(scheduled, local_model, total_slots, api_base, api_key, model_id, temperature)
+            finally:
+                telemetry.stop()
+        except Exception as e:
+            self.status = f"任务异常中断：{str(e)}"
+            self.add_log(f"❌ 任务异常中断：{str(e)}", level="ERROR")
+            self.job.finish()
+        finally:
+            # 准备阶段出错时也要释放元数据刷新登记和性能分析归属，并允许启动新任务
+            if tracked_base:
+                props_cache.untrack(tracked_base)
+            profiling.end_job(self.run_id)
+            self.is_running = False
+
+    def _ensure_llm_executor(self, workers):
+        """按并发流上限调整 LLM 线程池大小（旧线程池中的任务执行完后自行退出）"""
+        workers = max(1, int(workers))
+        if workers != self._llm_workers:
+            self.llm_executor.shutdown(wait=False)
+            self.llm_executor = ThreadPoolExecutor(max_workers=workers)
+            self._llm_workers = workers
+
+    def _record_case_result(self, success):
+        """更新用例完成/失败计数和进度（停止后未成功的用例计为已取消）"""
+        self.job.record_result(success, cancelled=not success and self.cancel_token.cancelled)
 
+    def _run_cases(self, scheduled, local_model, total_slots, api_base, api_key, model_id, temperature):
+        """按执行模式（串行/并发）运行所有用例并输出最终统计"""
         if local_model:
             # ========== 本地模型：串行执行 ==========
-            for idx, case in enumerate(selected_cases):
+            for idx, item in enumerate(scheduled):
                 if self.stop_requested:
                     self.add_log("🛑 任务被用户停止")
                     break
 
-                self.add_log(f"📋 处理用例 {idx + 1}/{self.total_cases}")
-                success = self.process_single_case(case, api_base, api_key, model_id)
-
-                if success:
-                    self.completed_cases += 1
-                else:
-                    self.failed_cases += 1
-                    self.completed_cases += 1
-
-                self.progress = self.completed_cases / self.total_cases
-
-            self.is_running = False
-            self.status = f"测试完成，等待评分 ({self.completed_evals}/{self.pending_evals})"
-            self.progress = 1.0
+                self.add_log(f"📋 处理用例 {idx + 1}/{len(scheduled)}")
+                sample_indexes = range(item['first_sample'], item['first_sample'] + item['samples'])
+
+                if item['samples'] > 1 and total_slots > 1:
+                    # 服务端有多个槽位时，同一用例的多次采样并发执行（不固定槽位，共享前缀缓存）
+                    with ThreadPoolExecutor(max_workers=min(item['samples'], total_slots)) as sample_executor:
+                        sample_futures = [
+                            sample_executor.submit(profiling.bind_job(self.process_single_case), item['case'],
+                                                   api_base, api_key, model_id, None, item['full_prompt'],
+                                                   temperature, sample_index, item['prompt_tokens'],
+                                                   item['prefix_reused'] or sample_index != item['first_sample'])
+                            for sample_index in sample_indexes
+                        ]
+                        for future in as_completed(sample_futures):
+                            self._record_case_result(future.result())
+                    continue
+
+                for sample_index in sample_indexes:
+                    if self.stop_requested:
+                        break
+                    success = self.process_single_case(item['case'], api_base, api_key, model_id,
+                                                       item['slot_id'], item['full_prompt'], temperature, sample_index,
+                                                       item['prompt_tokens'],
+                                                       item['prefix_reused'] or sample_index != item['first_sample'])
+                    self._record_case_result(success)
 
         else:
             # ========== 远端模型：并发执行 ==========
-            futures = {}
+            # 请求节奏由服务商整形器控制（每秒请求数 + 突发 + 并发流数，见 endpoint_scheduler），
+            # 这里一次性提交所有任务，线程池大小与并发流上限一致
+            limits = get_provider_limits(api_base)
+            self.add_log(f"🚦 请求整形：{limits['rps'] or '不限'} 次/秒，突发 {limits['burst']}，"
+                         f"最多 {limits['max_streams']} 个并发流")
+            self._ensure_llm_executor(limits['max_streams'])
 
-            for idx, case in enumerate(selected_cases):
-                if self.stop_requested:
-                    self.add_log("🛑 任务被用户停止")
-                    break
+            futures = {}
+            runs = [(item, sample_index) for item in scheduled
+                    for sample_index in range(item['first_sample'], item['first_sample'] + item['samples'])]
 
+            for idx, (item, sample_index) in enumerate(runs):
                 # 提交任务到 LLM 线程池
                 future = self.llm_executor.submit(
-                    self.process_single_case,
-                    case,
+                    profiling.bind_job(self.process_single_case),
+                    item['case'],
                     api_base,
                     api_key,
-                    model_id
+                    model_id,
+                    item['slot_id'],
+                    item['full_prompt'],
+                    temperature,
+                    sample_index,
+                    item['prompt_tokens'],
+                    item['prefix_reused'] or sample_index != item['first_sample']
                 )
                 futures[future] = idx
 
-                # 每个任务之间间隔 2 秒
-                if idx < len(selected_cases) - 1 and not self.stop_requested:
-                    time.sleep(2)
-
-            # 等待所有 LLM 任务完成
+            # 等待所有 LLM 任务完成；停止后取消尚未开始的任务，正在执行的任务会在流被关闭后很快返回
+            drained = False
             for future in as_completed(futures):
-                if self.stop_requested:
-                    future.cancel()
-                    break
+                if self.stop_requested and not drained:
+                    self.add_log("🛑 任务被用户停止")
+                    for pending in futures:
+                        pending.cancel()
+                    drained = True
 
                 try:
-                    success = future.result()
-                    if success:
-                        self.completed_cases += 1
-                    else:
-                        self.failed_cases += 1
-                        self.completed_cases += 1
+                    self._record_case_result(future.result())
+                except CancelledError:
+                    self._record_case_result(False)
                 except Exception as e:
                     self.add_log(f"❌ 任务执行异常：{str(e)}")
-                    self.failed_cases += 1
-                    self.completed_cases += 1
+                    self._record_case_result(False)
 
-                self.progress = self.completed_cases / self.total_cases
-
-            self.is_running = False
+        self.job.finish()
+        if self.auto_evaluate and not self.stop_requested:
+            # 生成结束后等待评分流水线清空，评分与生成重叠进行，这里通常只剩最后几条
             self.status = f"测试完成，等待评分 ({self.completed_evals}/{self.pending_evals})"
-            self.progress = 1.0
+            self.eval_pipeline.wait_idle(should_abort=lambda: self.stop_requested)
+        self.is_running = False
+        self.status = f"测试完成，等待评分 ({self.completed_evals}/{self.pending_evals})"
+
+        if self.auto_evaluate:
+            metrics = self.eval_pipeline.get_metrics()
+            gen, judge = metrics['generation'], metrics['judging']
+            self.add_log(f"📊 流水线统计：生成 {gen['count']} 次 ({gen['per_min']}/分钟，平均 {gen['avg_s']}s)，"
+                         f"评分 {judge['count']} 次 ({judge['per_min']}/分钟，平均 {judge['avg_s']}s)，"
+                         f"队列峰值 {metrics['max_depth']}/{metrics['queue_size']}，生成因背压等待 {metrics['blocked_s']}s")
 
         # 显示最终统计
-        if self.failed_cases > 0:
+        cancelled = self.job.cancelled
+        if self.stop_requested:
+            self.status = f"已停止 (完成 {self.completed_cases - cancelled}/{self.total_cases})"
+            self.add_log(f"🛑 任务已停止：完成 {self.completed_cases - cancelled} 个，失败 {self.failed_cases} 个，取消 {cancelled} 个")
+        elif self.failed_cases > 0:
             self.status = f"部分失败 ({self.failed_cases}/{self.total_cases})"
             self.add_log(f"⚠️  测试完成：{self.total_cases} 个用例，成功 {self.completed_cases - self.failed_cases} 个，失败 {self.failed_cases} 个，评分 {self.completed_evals} 个")
         else:
             self.status = "全部完成"
             self.add_log(f"🎉 所有任务完成！共测试 {self.total_cases} 个用例，评分 {self.completed_evals} 个")
 
-    def start_task(self, selected_cases, api_base=None, api_key=None, model_id=None):
-        if not self.is_running:
-            self.thread = threading.Thread(target=self.run_batch_test, args=(selected_cases, api_base, api_key, model_id,))
-            self.thread.daemon = True
-            self.thread.start()
+    def start_task(self, selected_cases, api_base=None, api_key=None, model_id=None, only_missing=False,
+                   samples_per_case=1, temperature=None, auto_evaluate=None):
+        """
+        启动测试任务
+
+        Returns:
+            bool: False 表示已有测试任务或吞吐测试在运行（吞吐测试与测试任务互斥，避免相互干扰）
+        """
+        if self.is_running or self.profile_running:
+            return False
+        # 线程启动前就标记为运行中，避免在此期间又启动吞吐测试
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run_batch_test, args=(selected_cases, api_base, api_key, model_id,),
+                                       kwargs={"only_missing": only_missing,
+                                               "samples_per_case": samples_per_case,
+                                               "temperature": temperature,
+                                               "auto_evaluate": auto_evaluate})
+        self.thread.daemon = True
+        self.thread.start()
+        return True
 
     def stop_task(self):
+        """
+        停止当前任务：关闭正在生成/评分的请求，丢弃评分队列中尚未开始的记录，
+        未开始的 LLM 任务由 _run_cases 取消
+        """
         self.stop_requested = True
+        self.cancel_token.cancel("任务被用户停止")
+        drained = self.eval_pipeline.drain()
+        if drained:
+            self.add_pending_evals(-drained)
+            self.add_log(f"⏹️ 已丢弃评分队列中的 {drained} 条记录（保持待评分）")
+
+    def get_pipeline_metrics(self):
+        """返回自动评分流水线的各阶段吞吐与队列状态"""
+        return self.eval_pipeline.get_metrics()
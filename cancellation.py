@@ -0,0 +1,69 @@
+"""
+协作式取消
+
+每个测试任务持有一个 CancellationToken，随 call_llm/call_evaluator 一起传递。
+取消时除了设置标记，还会调用登记的回调（例如关闭正在读取的 HTTP 流），
+让正在生成的请求在一秒内中止，而不是等到读取超时。
+"""
+import threading
+
+
+class TaskCancelled(Exception):
+    """任务在开始请求前或等待槽位时被取消"""
+
+
+class CancellationToken:
+    """取消标记 + 取消时执行的回调"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_id = 0
+        self.reason = ""
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def is_cancelled(self):
+        """与 cancelled 属性相同，便于作为 should_abort 回调传递"""
+        return self._event.is_set()
+
+    def cancel(self, reason="已取消"):
+        """取消并执行所有已登记的回调（只执行一次）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def register(self, callback):
+        """
+        登记取消时执行的回调；已经取消时立即执行
+
+        Returns:
+            callable: 调用后注销该回调（请求正常结束时调用）
+        """
+        with self._lock:
+            if not self._event.is_set():
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+        callback()
+        return lambda: None
+
+    def wait(self, timeout):
+        """可被取消打断的 sleep，返回 True 表示已取消"""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TaskCancelled(self.reason)
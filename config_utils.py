@@ -0,0 +1,63 @@
+"""
+配置读取辅助函数
+
+config.py 只导出了核心配置项（并且被 git 忽略），新增的可选配置项通过这里读取：
+优先使用 config 模块中的同名属性，其次读取环境变量（config 导入时已加载 .env），
+最后回退到默认值，并按默认值的类型做转换。
+"""
+import json
+import os
+
+import config
+
+
+def get_setting(name, default=None):
+    """读取单个配置项，按 default 的类型自动转换"""
+    value = getattr(config, name, None)
+    if value is None:
+        value = os.getenv(name)
+    if value is None or value == "":
+        return default
+
+    try:
+        if isinstance(default, bool):
+            if isinstance(value, str):
+                return value.strip().lower() in ("1", "true", "yes", "on")
+            return bool(value)
+        if isinstance(default, int):
+            return int(value)
+        if isinstance(default, float):
+            return float(value)
+    except (ValueError, TypeError):
+        return default
+    return value
+
+
+def get_list_setting(name, default=None):
+    """读取逗号分隔的列表配置项"""
+    value = getattr(config, name, None)
+    if value is None:
+        value = os.getenv(name)
+    if value is None or value == "":
+        return list(default or [])
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [item.strip() for item in str(value).split(",") if item.strip()]
+
+
+def get_json_setting(name, default=None):
+    """读取 JSON 格式的配置项（config 中可直接写 dict/list），解析失败时返回默认值"""
+    value = getattr(config, name, None)
+    if value is None:
+        value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    if isinstance(value, (dict, list)):
+        return value
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        # event_log 依赖本模块读取配置，在函数内导入避免循环导入
+        from event_log import debug
+        debug(f"配置项 {name} 不是合法的 JSON，使用默认值")
+        return default
@@ -1,7 +1,15 @@
 import sqlite3
+import threading
+import time
+import numpy as np
 import pandas as pd
 import json
 import streamlit as st
+from prompt_builder import invalidate_case_prompt
+from config_utils import get_setting
+from stats_engine import aggregate_samples, compute_leaderboard, compare_environments
+from event_log import debug
+from profiling import profiled
 
 DB_PATH = 'eval_results.db'
 
@@ -29,8 +37,35 @@ def is_remote_model(model_name):
     return not model_name.endswith('.gguf')
 
 
+# 数据代数：每次写入评测数据时递增，供按代数缓存的统计结果判断是否过期
+_data_generation = 0
+_data_generation_lock = threading.Lock()
+
+# 评委与评分字段的对应关系 (1=gem, 2=opus, 3=gpt, 4=top2, 5=top)
+JUDGE_SCORE_COLUMNS = [
+    ('gem', 'eval_score_1'),
+    ('opus', 'eval_score_2'),
+    ('gpt', 'eval_score_3'),
+    ('top2', 'eval_score_4'),
+    ('top', 'eval_score_5'),
+]
+
+
+def bump_data_generation():
+    """标记评测数据已变化"""
+    global _data_generation
+    with _data_generation_lock:
+        _data_generation += 1
+
+
+def get_data_generation():
+    """获取当前数据代数"""
+    return _data_generation
+
+
 def clear_cache():
     """清除所有 Streamlit 数据缓存"""
+    bump_data_generation()
     st.cache_data.clear()
 
 
@@ -58,6 +93,8 @@ def save_test_case(title, category, source_code_dict, prompt, reference_answer,
     
     conn.commit()
     conn.close()
+    if case_id:
+        invalidate_case_prompt(case_id)  # 用例内容变化，丢弃已组装的提示词
     clear_cache()  # 清除缓存以反映新数据
 
 
@@ -78,6 +115,7 @@ def delete_test_case(case_id):
     cursor.execute("DELETE FROM test_cases WHERE id = ?", (case_id,))
     conn.commit()
     conn.close()
+    invalidate_case_prompt(case_id)
     clear_cache()
 
 def delete_eval_record(record_id):
@@ -93,6 +131,7 @@ def get_safe_result(res, key, default):
     """Safely retrieve a key from a dictionary, checking if res is a dict first."""
     return res.get(key, default) if isinstance(res, dict) else default
 
+@profiled()
 def update_eval_scores(record_id, eval_results):
     """更新评测记录的评分和评语"""
     conn = get_connection()
@@ -115,6 +154,10 @@ def update_eval_scores(record_id, eval_results):
         avg_score = sum(valid_scores) / len(valid_scores)
     else:
         avg_score = 0
+
+    # 记录实际调用过的评委（早停面板中跳过的评委不计入）
+    judges_run = ",".join(level for level, res in eval_results.items()
+                          if isinstance(res, dict) and not res.get('skipped'))
     
     cursor.execute('''
         UPDATE eval_records
@@ -129,7 +172,8 @@ def update_eval_scores(record_id, eval_results):
             eval_score_4 = ?,
             eval_comment_4 = ?,
             eval_score_5 = ?,
-            eval_comment_5 = ?
+            eval_comment_5 = ?,
+            judges_run = ?
         WHERE id = ?
     ''', (
         avg_score,
@@ -144,17 +188,20 @@ def update_eval_scores(record_id, eval_results):
         get_safe_result(eval_results.get('top2', {}), 'reasoning', ""),
         score_5,
         get_safe_result(eval_results.get('top', {}), 'reasoning', ""),
+        judges_run,
         record_id
     ))
     
     conn.commit()
     conn.close()
+    bump_data_generation()
 
 # --- 评测记录 (Eval Records) 管理 ---
 
+@profiled()
 def save_eval_record(data):
     """保存评测记录"""
-    print(f"[DEBUG] Saving eval record for case_id: {data.get('case_id')}")
+    debug(f"Saving eval record for case_id: {data.get('case_id')}")
     conn = get_connection()
     cursor = conn.cursor()
     
@@ -162,6 +209,8 @@ def save_eval_record(data):
         'case_id', 'model_name', 'temperature', 'local_response',
         'chain_of_thought', 'prompt_tokens', 'completion_tokens',
         'total_time_ms', 'tokens_per_second', 'prompt_tps', 'max_context',
+        'case_hash', 'run_fingerprint', 'sample_index', 'finish_reason', 'ttft_ms', 'cold_start',
+        'job_id', 'started_at', 'env_fingerprint',
         'eval_score', 'eval_comment',
         'eval_score_1', 'eval_comment_1',
         'eval_score_2', 'eval_comment_2',
@@ -185,7 +234,8 @@ def save_eval_record(data):
         cursor.execute(query, values)
         conn.commit()
         record_id = cursor.lastrowid
-        print(f"[DEBUG] Eval record saved successfully. ID: {record_id}")
+        bump_data_generation()
+        debug(f"Eval record saved successfully. ID: {record_id}")
         return record_id
     except Exception as e:
         print(f"[ERROR] Failed to save eval record: {str(e)}")
@@ -206,6 +256,90 @@ def get_eval_record_by_id(record_id):
     conn.close()
     return df.iloc[0].to_dict() if not df.empty else None
 
+def get_eval_records_by_ids(record_ids):
+    """根据 ID 列表批量获取评测记录（含用例标题、任务和参考答案），返回字典列表"""
+    record_ids = [int(record_id) for record_id in record_ids]
+    if not record_ids:
+        return []
+
+    conn = get_connection()
+    frames = []
+    chunk_size = 500
+    for start in range(0, len(record_ids), chunk_size):
+        chunk = record_ids[start:start + chunk_size]
+        placeholders = ', '.join(['?' for _ in chunk])
+        query = f"""
+            SELECT r.*, c.title as case_title, c.prompt, c.reference_answer
+            FROM eval_records r
+            JOIN test_cases c ON r.case_id = c.id
+            WHERE r.id IN ({placeholders})
+        """
+        frames.append(pd.read_sql_query(query, conn, params=chunk))
+    conn.close()
+    return pd.concat(frames).to_dict('records')
+
+def get_fingerprint_counts(fingerprints):
+    """
+    统计给定运行指纹在评测记录中已有的次数，返回 {指纹: 次数}（只包含已存在的指纹），
+    被取消或超过墙钟上限中止的部分输出不计入
+    """
+    fingerprints = list(fingerprints)
+    counts = {}
+    if not fingerprints:
+        return counts
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    # 分批查询，避免超过 SQLite 的参数数量上限
+    chunk_size = 500
+    for start in range(0, len(fingerprints), chunk_size):
+        chunk = fingerprints[start:start + chunk_size]
+        placeholders = ', '.join(['?' for _ in chunk])
+        cursor.execute(
+            f"SELECT run_fingerprint, COUNT(*) FROM eval_records WHERE run_fingerprint IN ({placeholders}) "
+            f"AND COALESCE(finish_reason, '') NOT IN ('cancelled', 'deadline') GROUP BY run_fingerprint",
+            chunk
+        )
+        counts.update({row[0]: row[1] for row in cursor.fetchall()})
+    conn.close()
+    return counts
+
+def get_model_latency_samples(model_name, limit=200):
+    """
+    获取模型最近正常结束的生成的延迟样本（用于自适应超时和模型加载检测），
+    被取消、超时中止或包含模型加载时间的记录不计入
+
+    Returns:
+        list[dict]: {"ttft_ms", "total_time_ms", "tps", "prompt_tps", "prompt_tokens", "completion_tokens"}，
+                    旧记录缺少 ttft_ms 时按预读速度估算
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ttft_ms, prompt_tokens, prompt_tps, total_time_ms, tokens_per_second, completion_tokens
+        FROM eval_records
+        WHERE model_name = ? AND total_time_ms > 0
+          AND COALESCE(finish_reason, '') NOT IN ('cancelled', 'deadline') AND COALESCE(cold_start, 0) = 0
+        ORDER BY id DESC
+        LIMIT ?
+    """, (model_name, int(limit)))
+    rows = cursor.fetchall()
+    conn.close()
+
+    samples = []
+    for ttft_ms, prompt_tokens, prompt_tps, total_time_ms, tps, completion_tokens in rows:
+        if not ttft_ms and prompt_tokens and prompt_tps:
+            ttft_ms = prompt_tokens / prompt_tps * 1000
+        samples.append({
+            "ttft_ms": ttft_ms or 0,
+            "total_time_ms": total_time_ms,
+            "tps": tps or 0,
+            "prompt_tps": prompt_tps or 0,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+        })
+    return samples
+
 @st.cache_data(ttl=30)
 def get_eval_history(case_id=None, model_name=None):
     """获取评测历史，可选按 case_id 和 model_name 筛选（缓存30秒）"""
@@ -271,7 +405,8 @@ def get_stats():
     """)
     stats['avg_score'] = cursor.fetchone()[0] or 0
     
-    cursor.execute("SELECT AVG(tokens_per_second) FROM eval_records")
+    cursor.execute("SELECT AVG(tokens_per_second) FROM eval_records "
+                   "WHERE COALESCE(cold_start, 0) = 0 AND COALESCE(finish_reason, '') != 'cancelled'")
     stats['avg_tps'] = cursor.fetchone()[0] or 0
     
     cursor.execute("SELECT COUNT(*) FROM eval_records")
@@ -347,9 +482,13 @@ def get_model_detail_stats(model_name):
                AVG(COALESCE(r.eval_score_5, 0)) as avg_score_5,
                AVG(r.completion_tokens) as avg_completion_tokens,
                AVG(r.prompt_tokens) as avg_prompt_tokens,
-               AVG(r.total_time_ms) as avg_total_time_ms,
-               AVG(r.tokens_per_second) as avg_tps,
-               AVG(r.prompt_tps) as avg_prompt_tps,
+               -- 包含模型加载时间的记录 (cold_start) 和被取消的部分输出不计入速度指标
+               AVG(CASE WHEN COALESCE(r.cold_start, 0) = 0 AND COALESCE(r.finish_reason, '') != 'cancelled'
+                        THEN r.total_time_ms END) as avg_total_time_ms,
+               AVG(CASE WHEN COALESCE(r.cold_start, 0) = 0 AND COALESCE(r.finish_reason, '') != 'cancelled'
+                        THEN r.tokens_per_second END) as avg_tps,
+               AVG(CASE WHEN COALESCE(r.cold_start, 0) = 0 AND COALESCE(r.finish_reason, '') != 'cancelled'
+                        THEN r.prompt_tps END) as avg_prompt_tps,
                COUNT(*) as run_count
         FROM eval_records r
         JOIN test_cases c ON r.case_id = c.id
@@ -454,7 +593,8 @@ def get_case_model_ranking(case_id, model_type="全部"):
                        0
                    )
                 ) as avg_score, 
-               AVG(total_time_ms) as avg_total_time_ms,
+               AVG(CASE WHEN COALESCE(cold_start, 0) = 0 AND COALESCE(finish_reason, '') != 'cancelled'
+                        THEN total_time_ms END) as avg_total_time_ms,
                COUNT(*) as run_count
         FROM eval_records
         WHERE case_id = ?
@@ -475,7 +615,7 @@ def get_case_model_ranking(case_id, model_type="全部"):
 
 @st.cache_data(ttl=30)
 def get_model_speed_ranking(model_type="全部"):
-    """获取模型速度排行（按平均耗时升序排序，缓存30秒）"""
+    """获取模型速度排行（按平均耗时升序排序，缓存30秒；包含模型加载时间的记录和被取消的部分输出不计入）"""
     conn = get_connection()
     query = """
         SELECT model_name, 
@@ -484,7 +624,7 @@ def get_model_speed_ranking(model_type="全部"):
                AVG(prompt_tps) as avg_prompt_tps,
                COUNT(*) as test_count
         FROM eval_records
-        WHERE total_time_ms > 0
+        WHERE total_time_ms > 0 AND COALESCE(cold_start, 0) = 0 AND COALESCE(finish_reason, '') != 'cancelled'
         GROUP BY model_name
         ORDER BY avg_total_time_ms ASC
     """
@@ -497,4 +637,504 @@ def get_model_speed_ranking(model_type="全部"):
     elif model_type == "远端模型":
         df = df[df['model_name'].apply(lambda x: is_remote_model(x))]
     
-    return df
\ No newline at end of file
+    return df
+
+@st.cache_data(ttl=30)
+def get_sample_stats(model_type="全部", pass_threshold=None):
+    """
+    重复采样统计：按 (用例, 模型) 聚合已评分记录的均值、标准差、bootstrap 置信区间和 pass@k（缓存30秒）
+    """
+    if pass_threshold is None:
+        pass_threshold = get_setting("PASS_SCORE_THRESHOLD", 60)
+
+    conn = get_connection()
+    query = """
+        SELECT r.case_id, c.title as case_title, r.model_name, r.eval_score as score
+        FROM eval_records r
+        JOIN test_cases c ON r.case_id = c.id
+        WHERE r.eval_score > 0
+    """
+    df = pd.read_sql_query(query, conn)
+    conn.close()
+
+    # 根据模型类型过滤
+    if model_type == "本地模型":
+        df = df[df['model_name'].apply(lambda x: not is_remote_model(x))]
+    elif model_type == "远端模型":
+        df = df[df['model_name'].apply(lambda x: is_remote_model(x))]
+
+    result = aggregate_samples(df, pass_threshold=pass_threshold)
+    titles = df.drop_duplicates('case_id').set_index('case_id')['case_title']
+    result.insert(1, 'case_title', result['case_id'].map(titles))
+    return result
+
+
+def load_score_matrix():
+    """
+    一次性读取所有评测记录的评委评分
+
+    Returns:
+        (records, matrix, judge_names):
+        records 为记录元数据 DataFrame (id, case_id, model_name, category, created_at)，
+        matrix 为 (记录数 × 评委数) 的评分矩阵，0 分（失败/未评分）记为 NaN
+    """
+    score_columns = ', '.join(f"r.{column}" for _, column in JUDGE_SCORE_COLUMNS)
+    conn = get_connection()
+    query = f"""
+        SELECT r.id, r.case_id, r.model_name, COALESCE(c.category, '未分类') as category,
+               r.created_at, {score_columns}
+        FROM eval_records r
+        JOIN test_cases c ON r.case_id = c.id
+    """
+    df = pd.read_sql_query(query, conn)
+    conn.close()
+
+    columns = [column for _, column in JUDGE_SCORE_COLUMNS]
+    matrix = df[columns].to_numpy(dtype=float, copy=True)
+    matrix[~(matrix > 0)] = np.nan
+    records = df.drop(columns=columns)
+    return records, matrix, [name for name, _ in JUDGE_SCORE_COLUMNS]
+
+
+_leaderboard_cache = {}
+_leaderboard_cache_lock = threading.Lock()
+
+# 排行榜缓存的最长有效时间（秒）：其他进程（migrate_scores.py 等脚本）修改评分不会改变本进程的数据代数
+LEADERBOARD_CACHE_SECONDS = 60
+
+
+def _eval_records_version():
+    """
+    评测记录表的版本标识（最大 ID，走主键索引，不扫描全表），其他进程新增记录后会变化；
+    删除或重新评分由数据代数和缓存时长兜底
+    """
+    conn = get_connection()
+    try:
+        return conn.execute("SELECT MAX(id) FROM eval_records").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def get_leaderboard_stats(model_type="全部"):
+    """
+    排行榜统计（评委偏差标准化、评委一致性、Bradley-Terry/Elo、分类明细），
+    按 (数据代数, 最大记录 ID) 缓存，最长 LEADERBOARD_CACHE_SECONDS 秒：
+    评测数据没有变化时直接返回上次的计算结果
+    """
+    key = (get_data_generation(), _eval_records_version())
+    now = time.time()
+    with _leaderboard_cache_lock:
+        cached = _leaderboard_cache.get(model_type)
+        if cached and cached[0] == key and now - cached[1] < LEADERBOARD_CACHE_SECONDS:
+            return cached[2]
+
+    records, matrix, judge_names = load_score_matrix()
+
+    # 根据模型类型过滤
+    if model_type in ("本地模型", "远端模型"):
+        remote = records['model_name'].apply(is_remote_model).to_numpy(dtype=bool)
+        keep = remote if model_type == "远端模型" else ~remote
+        records = records[keep].reset_index(drop=True)
+        matrix = matrix[keep]
+
+    result = compute_leaderboard(records, matrix, judge_names)
+    with _leaderboard_cache_lock:
+        _leaderboard_cache[model_type] = (key, now, result)
+    return result
+
+
+# --- 批量重新评分 (Re-score Jobs) ---
+
+def build_record_filter(filters):
+    """
+    将批量重新评分的筛选条件转换为 SQL 条件
+
+    filters: {
+        "model_names": [模型名称], "case_ids": [用例 ID],
+        "date_from": "YYYY-MM-DD", "date_to": "YYYY-MM-DD"（包含当天）,
+        "only_failed": True 时只选择目标评委评分失败/为 0 的记录（早停面板跳过的评委不算失败）,
+        "judge_levels": 配合 only_failed 使用的评委级别
+    }
+    被取消的部分输出始终排除
+
+    Returns:
+        (where_sql, params)
+    """
+    filters = filters or {}
+    # 被取消的记录只有部分输出，评分没有意义
+    conditions = ["COALESCE(r.finish_reason, '') != 'cancelled'"]
+    params = []
+
+    model_names = list(filters.get("model_names") or [])
+    if model_names:
+        conditions.append(f"r.model_name IN ({', '.join(['?' for _ in model_names])})")
+        params.extend(model_names)
+
+    case_ids = [int(case_id) for case_id in filters.get("case_ids") or []]
+    if case_ids:
+        conditions.append(f"r.case_id IN ({', '.join(['?' for _ in case_ids])})")
+        params.extend(case_ids)
+
+    if filters.get("date_from"):
+        conditions.append("r.created_at >= ?")
+        params.append(str(filters["date_from"]))
+    if filters.get("date_to"):
+        conditions.append("r.created_at < date(?, '+1 day')")
+        params.append(str(filters["date_to"]))
+
+    if filters.get("only_failed"):
+        score_columns = dict(JUDGE_SCORE_COLUMNS)
+        levels = [level for level in filters.get("judge_levels") or [] if level in score_columns]
+        if levels:
+            # 评分为 0 且该评委确实被调用过（judges_run 为空的旧记录视为全部调用）
+            failed = [f"(COALESCE(r.{score_columns[level]}, 0) = 0 AND "
+                      f"(r.judges_run IS NULL OR ',' || r.judges_run || ',' LIKE ?))" for level in levels]
+            conditions.append(f"({' OR '.join(failed)})")
+            params.extend(f"%,{level},%" for level in levels)
+        else:
+            conditions.append("COALESCE(r.eval_score, 0) = 0")
+
+    return " AND ".join(conditions), params
+
+
+def count_filtered_records(filters, after_id=0):
+    """统计满足筛选条件且 ID 大于 after_id 的记录数"""
+    where_sql, params = build_record_filter(filters)
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM eval_records r WHERE {where_sql} AND r.id > ?", params + [int(after_id)])
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+
+def iter_filtered_records(filters, after_id=0, chunk_size=200):
+    """
+    按 ID 升序分块读取满足筛选条件的记录（含用例标题、任务和参考答案），
+    使用 "id > 上一块最后一个 ID" 的键集分页，不会随偏移量增大而变慢
+
+    Yields:
+        list: 每块的记录字典列表
+    """
+    where_sql, params = build_record_filter(filters)
+    query = f"""
+        SELECT r.*, c.title as case_title, c.prompt, c.reference_answer
+        FROM eval_records r
+        JOIN test_cases c ON r.case_id = c.id
+        WHERE {where_sql} AND r.id > ?
+        ORDER BY r.id
+        LIMIT ?
+    """
+    last_id = int(after_id)
+    while True:
+        conn = get_connection()
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(query, params + [last_id, int(chunk_size)]).fetchall()
+        conn.close()
+        if not rows:
+            return
+        chunk = [dict(row) for row in rows]
+        last_id = chunk[-1]['id']
+        yield chunk
+
+
+def create_rescore_job(filters, target_levels, total):
+    """登记一个批量重新评分任务，返回任务 ID"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO rescore_jobs (filters, target_levels, status, total, processed, failed, last_record_id)
+        VALUES (?, ?, 'running', ?, 0, 0, 0)
+    ''', (json.dumps(filters or {}, ensure_ascii=False), ",".join(target_levels or []), int(total)))
+    conn.commit()
+    job_id = cursor.lastrowid
+    conn.close()
+    return job_id
+
+
+def update_rescore_job(job_id, **fields):
+    """更新批量重新评分任务的检查点（status、processed、failed、last_record_id、total）"""
+    allowed = ('status', 'total', 'processed', 'failed', 'last_record_id')
+    updates = {key: value for key, value in fields.items() if key in allowed}
+    if not updates:
+        return
+    assignments = ', '.join(f"{key} = ?" for key in updates)
+    conn = get_connection()
+    conn.execute(f"UPDATE rescore_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                 list(updates.values()) + [int(job_id)])
+    conn.commit()
+    conn.close()
+
+
+def get_rescore_job(job_id):
+    """获取批量重新评分任务，filters 和 target_levels 已解析"""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM rescore_jobs WHERE id = ?", (int(job_id),)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job['filters'] = json.loads(job['filters'] or "{}")
+    job['target_levels'] = [level for level in (job['target_levels'] or "").split(",") if level]
+    return job
+
+
+def get_rescore_jobs():
+    """获取所有批量重新评分任务（最新的在前）"""
+    conn = get_connection()
+    df = pd.read_sql_query("SELECT * FROM rescore_jobs ORDER BY id DESC", conn)
+    conn.close()
+    return df
+
+
+# --- 端点吞吐测试 (Throughput Profiles) ---
+
+THROUGHPUT_FIELDS = [
+    'run_id', 'api_base', 'model_name', 'model_path', 'n_ctx', 'total_slots',
+    'concurrency', 'prompt_tokens_target', 'prompt_tokens', 'max_tokens', 'requests', 'errors',
+    'wall_time_ms', 'completion_tokens', 'aggregate_tps', 'per_stream_tps',
+    'ttft_ms_p50', 'ttft_ms_p95', 'prompt_tps', 'error'
+]
+
+
+def save_throughput_point(point):
+    """保存吞吐测试的一个测试点"""
+    conn = get_connection()
+    conn.execute(
+        f"INSERT INTO throughput_profiles ({', '.join(THROUGHPUT_FIELDS)}) "
+        f"VALUES ({', '.join(['?' for _ in THROUGHPUT_FIELDS])})",
+        [point.get(field) for field in THROUGHPUT_FIELDS]
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_throughput_runs():
+    """获取所有吞吐测试（每次扫描一行，最新的在前）"""
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        SELECT run_id, model_name, api_base, model_path, n_ctx, total_slots,
+               COUNT(*) as points, MAX(aggregate_tps) as best_aggregate_tps, MIN(created_at) as created_at
+        FROM throughput_profiles
+        GROUP BY run_id
+        ORDER BY created_at DESC
+    """, conn)
+    conn.close()
+    return df
+
+
+def get_throughput_profile(run_id):
+    """获取一次吞吐测试的所有测试点"""
+    conn = get_connection()
+    df = pd.read_sql_query(
+        "SELECT * FROM throughput_profiles WHERE run_id = ? ORDER BY prompt_tokens_target, concurrency",
+        conn, params=(run_id,)
+    )
+    conn.close()
+    return df
+
+
+# --- 服务端遥测 (Telemetry Samples) ---
+
+TELEMETRY_FIELDS = [
+    'job_id', 'server', 'ts', 'kv_cache_usage', 'kv_cache_tokens', 'requests_processing', 'requests_deferred',
+    'prompt_tokens_total', 'tokens_predicted_total', 'prompt_tps', 'predicted_tps',
+    'total_slots', 'busy_slots', 'max_slot_fill', 'metrics'
+]
+
+
+def save_telemetry_samples(samples):
+    """批量保存遥测采样"""
+    if not samples:
+        return
+    conn = get_connection()
+    conn.executemany(
+        f"INSERT INTO telemetry_samples ({', '.join(TELEMETRY_FIELDS)}) "
+        f"VALUES ({', '.join(['?' for _ in TELEMETRY_FIELDS])})",
+        [[sample.get(field) for field in TELEMETRY_FIELDS] for sample in samples]
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_job_telemetry(job_id, server=None):
+    """获取一个测试任务的遥测时间序列（可按端点筛选）"""
+    conn = get_connection()
+    query = "SELECT * FROM telemetry_samples WHERE job_id = ?"
+    params = [job_id]
+    if server:
+        query += " AND server = ?"
+        params.append(server)
+    df = pd.read_sql_query(query + " ORDER BY ts", conn, params=params)
+    conn.close()
+    return df
+
+
+def get_record_telemetry(record_id):
+    """获取一条评测记录生成期间（started_at 到 started_at + total_time_ms）同一任务的遥测采样"""
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        SELECT t.*
+        FROM eval_records r
+        JOIN telemetry_samples t ON t.job_id = r.job_id
+        WHERE r.id = ? AND r.started_at IS NOT NULL
+          AND t.ts BETWEEN r.started_at AND r.started_at + r.total_time_ms / 1000.0
+        ORDER BY t.ts
+    """, conn, params=(int(record_id),))
+    conn.close()
+    return df
+
+
+def get_records_telemetry_summary(job_id):
+    """
+    汇总一个测试任务中每条记录生成期间的遥测峰值，用于把慢记录与服务端压力对应起来
+
+    Returns:
+        DataFrame: record_id、用例、耗时、生成速度，以及期间的最大 KV cache 占用、最大推迟请求数、
+                   最多忙碌槽位、最大槽位上下文填充率和采样数
+    """
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        SELECT r.id as record_id, c.title as case_title, r.model_name, r.total_time_ms, r.tokens_per_second,
+               r.prompt_tps, r.finish_reason,
+               MAX(t.kv_cache_usage) as max_kv_cache_usage,
+               MAX(t.requests_deferred) as max_requests_deferred,
+               MAX(t.busy_slots) as max_busy_slots,
+               MAX(t.max_slot_fill) as max_slot_fill,
+               COUNT(t.id) as samples
+        FROM eval_records r
+        JOIN test_cases c ON r.case_id = c.id
+        LEFT JOIN telemetry_samples t ON t.job_id = r.job_id
+             AND t.ts BETWEEN r.started_at AND r.started_at + r.total_time_ms / 1000.0
+        WHERE r.job_id = ?
+        GROUP BY r.id
+        ORDER BY r.total_time_ms DESC
+    """, conn, params=(job_id,))
+    conn.close()
+    return df
+
+
+# --- 运行环境指纹 (Run Environments) ---
+
+RUN_ENVIRONMENT_FIELDS = [
+    'fingerprint', 'model_name', 'model_family', 'model_file', 'quant', 'server_build', 'sampling',
+    'harness_version', 'api_base'
+]
+
+
+def save_run_environment(env):
+    """保存运行环境（指纹已存在时只更新最后使用时间）"""
+    conn = get_connection()
+    conn.execute(
+        f"INSERT INTO run_environments ({', '.join(RUN_ENVIRONMENT_FIELDS)}) "
+        f"VALUES ({', '.join(['?' for _ in RUN_ENVIRONMENT_FIELDS])}) "
+        f"ON CONFLICT(fingerprint) DO UPDATE SET last_seen = CURRENT_TIMESTAMP",
+        [env.get(field) for field in RUN_ENVIRONMENT_FIELDS]
+    )
+    conn.commit()
+    conn.close()
+
+
+@st.cache_data(ttl=30)
+def get_run_environments(model_family=None):
+    """
+    获取运行环境列表及各环境的记录统计（缓存30秒），按首次使用时间排序
+
+    Returns:
+        DataFrame: 环境字段 + first_seen、last_seen、record_count、avg_tps、avg_prompt_tps、avg_score
+    """
+    conn = get_connection()
+    query = """
+        SELECT e.*,
+               COUNT(r.id) as record_count,
+               AVG(CASE WHEN COALESCE(r.cold_start, 0) = 0 AND COALESCE(r.finish_reason, '') != 'cancelled'
+                             AND r.tokens_per_second > 0 THEN r.tokens_per_second END) as avg_tps,
+               AVG(CASE WHEN COALESCE(r.cold_start, 0) = 0 AND COALESCE(r.finish_reason, '') != 'cancelled'
+                             AND r.prompt_tps > 0 THEN r.prompt_tps END) as avg_prompt_tps,
+               AVG(CASE WHEN r.eval_score > 0 THEN r.eval_score END) as avg_score
+        FROM run_environments e
+        LEFT JOIN eval_records r ON r.env_fingerprint = e.fingerprint
+    """
+    params = []
+    if model_family:
+        query += " WHERE e.model_family = ?"
+        params.append(model_family)
+    query += " GROUP BY e.fingerprint ORDER BY e.first_seen, e.rowid"
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    return df
+
+
+def get_environment_records(fingerprint):
+    """获取一个运行环境下的评测记录（用于环境之间的指标比较）"""
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        SELECT id, case_id, case_hash, tokens_per_second, prompt_tps, ttft_ms, eval_score as score, cold_start, finish_reason
+        FROM eval_records
+        WHERE env_fingerprint = ? AND COALESCE(finish_reason, '') != 'cancelled'
+    """, conn, params=(fingerprint,))
+    conn.close()
+    return df
+
+
+@st.cache_data(ttl=30)
+def get_environment_regressions(model_family, alpha=None, min_change=None):
+    """
+    按首次使用时间依次比较同一模型系列的相邻运行环境，标记显著的速度/评分回归（缓存30秒）
+
+    Returns:
+        DataFrame: baseline、candidate 两个指纹 + compare_environments 的各列
+    """
+    alpha = alpha if alpha is not None else get_setting("REGRESSION_ALPHA", 0.05)
+    min_change = min_change if min_change is not None else get_setting("REGRESSION_MIN_CHANGE", 0.05)
+    envs = get_run_environments(model_family)
+    envs = envs[envs['record_count'] > 0]
+    frames = []
+    fingerprints = envs['fingerprint'].tolist()
+    for baseline, candidate in zip(fingerprints, fingerprints[1:]):
+        result = compare_environments(get_environment_records(baseline), get_environment_records(candidate),
+                                      alpha=alpha, min_change=min_change)
+        result.insert(0, 'candidate', candidate)
+        result.insert(0, 'baseline', baseline)
+        frames.append(result)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# --- 性能剖析 (Profile Spans) ---
+
+def save_profile_summary(job_id, rows):
+    """保存一个任务的区间汇总（覆盖该任务之前保存的汇总）"""
+    conn = get_connection()
+    conn.execute("DELETE FROM profile_spans WHERE job_id = ?", (job_id,))
+    conn.executemany(
+        "INSERT INTO profile_spans (job_id, span, count, total_ms, self_ms, mean_ms, max_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(job_id, row['span'], row['count'], row['total_ms'], row['self_ms'], row['mean_ms'], row['max_ms'])
+         for row in rows]
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_profiled_jobs():
+    """获取保存过性能剖析结果的任务（最新的在前）"""
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        SELECT job_id, COUNT(*) as spans, SUM(self_ms) as self_ms, MAX(created_at) as created_at
+        FROM profile_spans
+        GROUP BY job_id
+        ORDER BY created_at DESC
+    """, conn)
+    conn.close()
+    return df
+
+
+def get_profile_summary(job_id):
+    """获取一个任务保存的区间汇总（按总耗时降序）"""
+    conn = get_connection()
+    df = pd.read_sql_query(
+        "SELECT span, count, total_ms, self_ms, mean_ms, max_ms FROM profile_spans WHERE job_id = ? ORDER BY total_ms DESC",
+        conn, params=(job_id,)
+    )
+    conn.close()
+    return df
@@ -0,0 +1,301 @@
+"""
+按端点调度并发请求
+
+本地 llama.cpp 服务的并发能力由槽位数 (-np) 决定。生成任务和本地评委可能共用同一台服务器，
+这里为每个本地端点维护一个槽位计数：
+- generation（生成）优先：有生成请求在等待时，评委不会占用新的槽位
+- judge（评分）受单独的并发上限约束，避免评分把生成挤占掉
+
+远端端点按服务商（主机名）整形生成请求：令牌桶限制每秒请求数（允许一定突发），
+同时限制同时进行的流式请求数；收到 429 时暂停该服务商的新请求。
+"""
+import fnmatch
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from config_utils import get_setting, get_json_setting
+from server_props import props_cache, get_server_root, is_local_endpoint
+
+KIND_GENERATION = "generation"
+KIND_JUDGE = "judge"
+
+
+class EndpointSlots:
+    """单个端点的槽位计数器"""
+
+    def __init__(self, capacity=1):
+        self.capacity = max(1, capacity)
+        self.in_use = {KIND_GENERATION: 0, KIND_JUDGE: 0}
+        self.waiting = {KIND_GENERATION: 0, KIND_JUDGE: 0}
+        self._cond = threading.Condition()
+
+    def _can_start(self, kind, limit):
+        if sum(self.in_use.values()) >= self.capacity:
+            return False
+        if kind == KIND_GENERATION:
+            return True
+        if self.waiting[KIND_GENERATION] > 0:
+            return False  # 生成优先
+        return limit is None or self.in_use[KIND_JUDGE] < limit
+
+    def acquire(self, kind, limit=None, should_abort=None):
+        """
+        等待并占用一个槽位
+        should_abort: 可选的回调，返回 True 时放弃等待并返回 False
+        """
+        with self._cond:
+            self.waiting[kind] += 1
+            try:
+                while not self._can_start(kind, limit):
+                    if should_abort and should_abort():
+                        return False
+                    self._cond.wait(0.5)
+                self.in_use[kind] += 1
+                return True
+            finally:
+                self.waiting[kind] -= 1
+                self._cond.notify_all()
+
+    def release(self, kind):
+        with self._cond:
+            self.in_use[kind] = max(0, self.in_use[kind] - 1)
+            self._cond.notify_all()
+
+    def resize(self, capacity):
+        with self._cond:
+            self.capacity = max(1, capacity)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {"capacity": self.capacity, "in_use": dict(self.in_use), "waiting": dict(self.waiting)}
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint_slots(api_base, capacity=None):
+    """
+    获取端点的槽位计数器。容量优先使用传入值，其次是 /props 中的 total_slots，默认 1
+    """
+    server_root = get_server_root(api_base)
+    if capacity is None:
+        capacity = props_cache.get(api_base).get("total_slots", 0) or 1
+    with _endpoints_lock:
+        slots = _endpoints.get(server_root)
+        if slots is None:
+            slots = EndpointSlots(capacity)
+            _endpoints[server_root] = slots
+        elif slots.capacity < capacity:
+            slots.resize(capacity)
+        return slots
+
+
+class RateLimiter:
+    """远端服务商的请求整形：令牌桶 (rps + burst) + 并发流数上限"""
+
+    def __init__(self, rps, burst=1, max_streams=5):
+        self._cond = threading.Condition()
+        self.rps = 0.0
+        self.burst = 1
+        self.max_streams = 1
+        self.configure(rps, burst, max_streams)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.active = 0
+        self.waiting = 0
+        self.started = 0
+        self.rate_limited = 0
+        self.wait_s = 0.0
+
+    def configure(self, rps, burst=1, max_streams=5):
+        """更新限制（配置变化时调用），rps 为 0 表示不限制请求速率"""
+        with self._cond:
+            self.rps = max(0.0, float(rps or 0))
+            self.burst = max(1, int(burst or 1))
+            self.max_streams = max(1, int(max_streams or 1))
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        if self.rps > 0:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated_at) * self.rps)
+        else:
+            self.tokens = float(self.burst)
+        self.updated_at = now
+
+    def _wait_time(self, now):
+        """距离可以发出下一个请求还需等待的秒数（0 表示可以立即发出）"""
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.active >= self.max_streams:
+            return 0.5  # 等待 release() 唤醒
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rps
+
+    def acquire(self, should_abort=None):
+        """
+        等待令牌和空闲的流
+        should_abort: 可选的回调，返回 True 时放弃等待并返回 False
+        """
+        wait_start = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._wait_time(now)
+                    if wait <= 0:
+                        self.tokens -= 1
+                        self.active += 1
+                        self.started += 1
+                        self.wait_s += now - wait_start
+                        return True
+                    if should_abort and should_abort():
+                        return False
+                    self._cond.wait(min(wait, 0.5))
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active = max(0, self.active - 1)
+            self._cond.notify_all()
+
+    def penalize(self, retry_after=None):
+        """
+        服务商返回 429 时暂停新请求并清空已积攒的令牌；retry_after 为 Retry-After 响应头（秒数或 HTTP 日期），
+        缺失或无法解析时暂停 RATE_LIMIT_BACKOFF_S 秒
+        """
+        backoff = parse_retry_after(retry_after)
+        if backoff is None:
+            backoff = get_setting("RATE_LIMIT_BACKOFF_S", 10.0)
+        with self._cond:
+            self.rate_limited += 1
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + backoff)
+
+    def snapshot(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "rps": self.rps, "burst": self.burst, "max_streams": self.max_streams,
+                "active": self.active, "waiting": self.waiting, "tokens": round(self.tokens, 2),
+                "started": self.started, "rate_limited": self.rate_limited,
+                "paused_s": round(max(0.0, self.paused_until - time.monotonic()), 1),
+                "avg_wait_s": round(self.wait_s / self.started, 2) if self.started else 0.0,
+            }
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 响应头：秒数或 HTTP 日期（RFC 9110 两种格式都允许）
+
+    Returns:
+        float: 需要等待的秒数；缺失或无法解析时返回 None
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_provider_limits(api_base):
+    """
+    读取服务商的整形参数：PROVIDER_RATE_LIMITS（JSON，按主机名通配符匹配）优先，
+    其次是 REMOTE_RPS / REMOTE_BURST / REMOTE_MAX_STREAMS
+
+    Returns:
+        dict: {"rps", "burst", "max_streams"}
+    """
+    limits = {
+        "rps": get_setting("REMOTE_RPS", 0.5),
+        "burst": get_setting("REMOTE_BURST", 1),
+        "max_streams": get_setting("REMOTE_MAX_STREAMS", 5),
+    }
+    host = (urlparse(api_base or "").hostname or "").lower()
+    providers = get_json_setting("PROVIDER_RATE_LIMITS", {})
+    if isinstance(providers, dict):
+        for pattern, provider in providers.items():
+            if isinstance(provider, dict) and fnmatch.fnmatch(host, pattern.lower()):
+                limits.update({key: provider[key] for key in limits if key in provider})
+                break
+    return limits
+
+
+def get_rate_limiter(api_base):
+    """获取远端服务商（按主机名）的请求整形器，每次获取时按当前配置更新限制"""
+    host = (urlparse(api_base or "").hostname or "").lower()
+    limits = get_provider_limits(api_base)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(host)
+        if limiter is None:
+            limiter = RateLimiter(**limits)
+            _rate_limiters[host] = limiter
+            return limiter
+    limiter.configure(**limits)
+    return limiter
+
+
+@contextmanager
+def endpoint_slot(api_base, kind, limit=None, capacity=None, should_abort=None):
+    """
+    在本地端点上占用一个槽位执行请求；远端端点的生成请求经过服务商的速率与并发流整形，
+    远端评委直接放行（评委沿用按模型的锁）
+    yield: True 表示已获得槽位（或无需调度），False 表示等待期间被中止
+    """
+    if not is_local_endpoint(api_base):
+        if kind != KIND_GENERATION:
+            yield True
+            return
+        limiter = get_rate_limiter(api_base)
+        acquired = limiter.acquire(should_abort)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                limiter.release()
+        return
+
+    slots = get_endpoint_slots(api_base, capacity)
+    acquired = slots.acquire(kind, limit, should_abort)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            slots.release(kind)
+
+
+def get_scheduler_snapshot():
+    """返回所有端点的槽位占用情况 {服务地址: {...}}"""
+    with _endpoints_lock:
+        items = list(_endpoints.items())
+    return {server_root: slots.snapshot() for server_root, slots in items}
+
+
+def get_rate_limiter_snapshot():
+    """返回所有远端服务商的整形状态 {主机名: {...}}"""
+    with _rate_limiters_lock:
+        items = list(_rate_limiters.items())
+    return {host: limiter.snapshot() for host, limiter in items}
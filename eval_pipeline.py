@@ -0,0 +1,189 @@
+"""
+生成与评分的流水线
+
+生成线程把保存好的记录放入有界队列，评分线程并发地从队列中取出并调用评委。
+队列满时生成线程阻塞等待（背压），避免评分跟不上时积压大量待评分记录；
+两个阶段同时进行，一批任务的总耗时接近 max(生成, 评分) 而不是两者之和。
+"""
+import queue
+import threading
+import time
+
+from config_utils import get_setting
+from event_log import debug
+
+# 队列中用于通知评分线程退出的标记
+_STOP = object()
+
+
+class StageMetrics:
+    """单个阶段的吞吐统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.failed = 0
+            self.busy_s = 0.0
+            self.started_at = time.time()
+            self.last_finished_at = None
+
+    def record(self, duration_s, success=True):
+        with self._lock:
+            self.count += 1
+            if not success:
+                self.failed += 1
+            self.busy_s += duration_s
+            self.last_finished_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            end = self.last_finished_at or time.time()
+            wall_s = max(end - self.started_at, 1e-6)
+            return {
+                "count": self.count,
+                "failed": self.failed,
+                "busy_s": round(self.busy_s, 2),
+                "avg_s": round(self.busy_s / self.count, 2) if self.count else 0.0,
+                "per_min": round(self.count / wall_s * 60, 2) if self.count else 0.0,
+            }
+
+
+class EvalPipeline:
+    """
+    有界队列 + 固定数量的评分线程
+    handler(item) 在评分线程中执行，返回 True/False 表示成功与否
+    """
+
+    def __init__(self, handler, workers=None, queue_size=None):
+        self.handler = handler
+        self.workers = max(1, workers or get_setting("EVAL_PIPELINE_WORKERS", 4))
+        self.queue = queue.Queue(maxsize=max(1, queue_size or get_setting("EVAL_QUEUE_SIZE", 16)))
+        self.generation = StageMetrics()
+        self.judging = StageMetrics()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.blocked_s = 0.0
+        self.max_depth = 0
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for _ in range(self.workers - len(self._threads)):
+                thread = threading.Thread(target=self._worker_loop, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                start = time.time()
+                success = False
+                try:
+                    success = bool(self.handler(item))
+                except Exception as e:
+                    debug(f"评分流水线处理失败: {e}")
+                self.judging.record(time.time() - start, success)
+                with self._counter_lock:
+                    self.completed += 1
+            finally:
+                self.queue.task_done()
+
+    def reset_metrics(self):
+        """新一批任务开始时重置吞吐统计（计数器保留，支持并发的其他评分任务）"""
+        self.generation.reset()
+        self.judging.reset()
+        with self._counter_lock:
+            self.blocked_s = 0.0
+            self.max_depth = 0
+
+    def record_generation(self, duration_s, success=True):
+        """记录一次生成的耗时"""
+        self.generation.record(duration_s, success)
+
+    def submit(self, item, should_abort=None):
+        """
+        放入待评分队列；队列满时阻塞等待（背压）
+
+        Returns:
+            bool: False 表示等待期间被中止，记录未进入队列
+        """
+        self._ensure_workers()
+        wait_start = time.time()
+        while True:
+            try:
+                self.queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                if should_abort and should_abort():
+                    return False
+        with self._counter_lock:
+            self.blocked_s += time.time() - wait_start
+            self.pending += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def wait_idle(self, should_abort=None):
+        """等待队列中的记录全部评分完成"""
+        while self.queue.unfinished_tasks:
+            if should_abort and should_abort():
+                return False
+            time.sleep(0.5)
+        return True
+
+    def drain(self):
+        """
+        丢弃队列中尚未开始评分的记录（任务停止时调用）
+
+        Returns:
+            int: 被丢弃的记录数
+        """
+        drained = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self.queue.put(_STOP)
+                self.queue.task_done()
+                break
+            drained += 1
+            self.queue.task_done()
+        with self._counter_lock:
+            self.pending -= drained
+        return drained
+
+    def shutdown(self):
+        """通知所有评分线程在处理完已排队的记录后退出"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self.queue.put(_STOP)
+
+    def get_metrics(self):
+        """返回各阶段吞吐、队列深度和背压等待时间"""
+        with self._counter_lock:
+            counters = {
+                "pending": self.pending,
+                "completed": self.completed,
+                "blocked_s": round(self.blocked_s, 2),
+                "max_depth": self.max_depth,
+            }
+        counters.update({
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "workers": self.workers,
+            "generation": self.generation.snapshot(),
+            "judging": self.judging.snapshot(),
+        })
+        return counters
@@ -0,0 +1,177 @@
+"""
+结构化事件日志
+
+事件保存在内存环形缓冲区 (deque) 中，并追加写入 JSONL 文件，页面关闭或任务重新开始后
+仍然可以查看历史运行的日志。每条事件包含级别、来源、任务/用例/模型/记录 ID 和耗时。
+
+每次调用都会触发的调试输出（原来的 print("[DEBUG] ...")）改用 debug()，
+可以通过 DEBUG_PRINTS=false 关闭控制台输出。
+
+JSONL 文件超过 EVENT_LOG_MAX_BYTES 时轮转为 <文件名>.1（只保留一份旧文件），
+读取历史时从文件末尾向前读取，不随文件大小变慢。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from config_utils import get_setting
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+_LEVEL_RANK = {level: rank for rank, level in enumerate(LOG_LEVELS)}
+
+# 事件中可携带的结构化字段
+EVENT_FIELDS = ("source", "job_id", "case", "model", "record_id", "duration_ms")
+
+# 从文件末尾向前读取历史时每次读取的字节数
+_TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def _level_rank(level):
+    return _LEVEL_RANK.get(str(level).upper(), _LEVEL_RANK["INFO"])
+
+
+class EventLog:
+    """内存环形缓冲区 + JSONL 追加写入"""
+
+    def __init__(self, capacity=None, path=None, sink_level=None, max_bytes=None):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=capacity or get_setting("EVENT_LOG_BUFFER_SIZE", 2000))
+        self._path = get_setting("EVENT_LOG_PATH", "event_log.jsonl") if path is None else path
+        self._sink_rank = _level_rank(sink_level or get_setting("EVENT_LOG_SINK_LEVEL", "INFO"))
+        self._max_bytes = get_setting("EVENT_LOG_MAX_BYTES", 10 * 1024 * 1024) if max_bytes is None else max_bytes
+        self._sink = None
+        self._sink_size = 0
+
+    def _write_sink(self, event):
+        if not self._path or _level_rank(event["level"]) < self._sink_rank:
+            return
+        try:
+            if self._sink is None:
+                directory = os.path.dirname(self._path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._sink = open(self._path, "a", encoding="utf-8", buffering=1)
+                self._sink_size = os.path.getsize(self._path)
+            line = json.dumps(event, ensure_ascii=False) + "\n"
+            self._sink.write(line)
+            self._sink_size += len(line.encode("utf-8"))
+            if self._max_bytes and self._sink_size >= self._max_bytes:
+                self._rotate()
+        except OSError:
+            self._path = None  # 日志文件不可写时只保留内存缓冲区
+
+    def _rotate(self):
+        """当前文件改名为 <文件名>.1（覆盖更早的旧文件），之后写入新文件"""
+        self._sink.close()
+        self._sink = None
+        os.replace(self._path, self._path + ".1")
+
+    def log(self, level, message, **fields):
+        """记录一条事件，返回事件字典"""
+        event = {"ts": time.time(), "level": str(level).upper(), "message": str(message)}
+        for key in EVENT_FIELDS:
+            if fields.get(key) is not None:
+                event[key] = fields[key]
+        with self._lock:
+            self._events.append(event)
+            self._write_sink(event)
+        return event
+
+    def recent(self, limit=None):
+        """内存缓冲区中最近的事件（旧的在前）"""
+        with self._lock:
+            events = list(self._events)
+        return events[-limit:] if limit else events
+
+    def read_history(self, limit=5000):
+        """从 JSONL 文件读取最近的 limit 条历史事件（旧的在前），当前文件不足时再读轮转后的旧文件"""
+        if not self._path:
+            return []
+        with self._lock:
+            if self._sink is not None:
+                self._sink.flush()
+        events = []
+        for path in (self._path, self._path + ".1"):
+            if len(events) >= limit:
+                break
+            events = _tail_events(path, limit - len(events)) + events
+        return events
+
+    def close(self):
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+
+def _tail_events(path, limit):
+    """从 JSONL 文件末尾向前按块读取，返回最后 limit 条能解析的事件（旧的在前）"""
+    if limit <= 0 or not os.path.exists(path):
+        return []
+    lines = []
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0 and len(lines) < limit:
+            size = min(_TAIL_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size) + remainder
+            parts = block.split(b"\n")
+            # 第一段可能是不完整的行，留到读取前一块时拼接
+            remainder = parts.pop(0) if position > 0 else b""
+            lines = [part for part in parts if part.strip()] + lines
+
+    events = []
+    for line in lines[-limit:]:
+        try:
+            events.append(json.loads(line.decode("utf-8")))
+        except ValueError:
+            continue
+    return events
+
+
+# 全局共享实例
+event_log = EventLog()
+
+
+def log_event(level, message, **fields):
+    """记录一条结构化事件"""
+    return event_log.log(level, message, **fields)
+
+
+def debug(message, **fields):
+    """
+    调试输出：写入事件缓冲区（DEBUG 级别默认不写文件），
+    DEBUG_PRINTS 开启时（默认）同时打印到控制台
+    """
+    if get_setting("DEBUG_PRINTS", True):
+        print(f"[DEBUG] {message}")
+    event_log.log("DEBUG", message, **fields)
+
+
+def filter_events(events, min_level=None, job_id=None, source=None, text=None):
+    """按最低级别、任务 ID、来源和关键字筛选事件"""
+    min_rank = _level_rank(min_level) if min_level else 0
+    text = (text or "").lower()
+    result = []
+    for event in events:
+        if _level_rank(event.get("level")) < min_rank:
+            continue
+        if job_id is not None and event.get("job_id") != job_id:
+            continue
+        if source and event.get("source") != source:
+            continue
+        if text and text not in event.get("message", "").lower() \
+                and text not in str(event.get("case", "")).lower() \
+                and text not in str(event.get("model", "")).lower():
+            continue
+        result.append(event)
+    return result
+
+
+def format_event(event):
+    """格式化为 "[HH:MM:SS] 消息" 的日志行（与任务日志的显示格式一致）"""
+    return f"[{time.strftime('%H:%M:%S', time.localtime(event['ts']))}] {event['message']}"
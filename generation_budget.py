@@ -0,0 +1,175 @@
+"""
+生成预算与自适应超时
+
+call_llm 原来使用固定的 300 秒读取超时且不限制 max_tokens，陷入重复输出的模型会长时间占用本地槽位。
+这里按 模型 / 用例 解析每次生成的预算：
+- max_tokens：最大生成长度（服务端以 finish_reason=length 结束）
+- deadline_s：整次生成的墙钟时间上限（到期后关闭连接，记录为 finish_reason=deadline）
+- first_token_timeout_s：等待首个 token（以及两个 chunk 之间）的最长时间
+
+开启自适应超时后，未显式配置的 deadline/首字超时由该模型最近的历史 TTFT 和生成速度推算
+（p99 × 余量），并且不超过全局配置的上限。提示词比历史记录长时，按历史预读速度估算的预读时间放宽首字超时。
+"""
+import fnmatch
+import threading
+import time
+
+import numpy as np
+
+from config_utils import get_setting, get_json_setting
+from event_log import debug
+
+# 表示生成被截断的 finish_reason 及其说明
+TRUNCATION_REASONS = {
+    "length": "达到 max_tokens 上限",
+    "deadline": "超过生成时间上限",
+}
+
+# 历史延迟统计的缓存时间（秒），避免每个用例都查询数据库
+PROFILE_CACHE_SECONDS = 300
+
+_profile_cache = {}
+_profile_lock = threading.Lock()
+
+
+def get_latency_profile(model_name):
+    """
+    模型最近生成的延迟统计（按模型缓存 PROFILE_CACHE_SECONDS 秒）
+
+    Returns:
+        dict: {"samples", "ttft_p99_s", "tps_p1", "total_p99_s", "prompt_tps_p50", "prompt_tokens_max"}；
+              没有样本时 samples 为 0
+    """
+    now = time.time()
+    with _profile_lock:
+        cached = _profile_cache.get(model_name)
+        if cached and now - cached[0] < PROFILE_CACHE_SECONDS:
+            return cached[1]
+
+    from database import get_model_latency_samples
+    try:
+        samples = get_model_latency_samples(model_name, get_setting("ADAPTIVE_TIMEOUT_WINDOW", 200))
+    except Exception as e:
+        debug(f"读取 {model_name} 的历史延迟失败: {e}")
+        samples = []
+
+    profile = {"samples": len(samples), "ttft_p99_s": 0.0, "tps_p1": 0.0, "total_p99_s": 0.0, "prompt_tps_p50": 0.0,
+               "prompt_tokens_max": 0}
+    if samples:
+        ttft = [s["ttft_ms"] / 1000 for s in samples if s["ttft_ms"] > 0]
+        tps = [s["tps"] for s in samples if s["tps"] > 0]
+        totals = [s["total_time_ms"] / 1000 for s in samples]
+        prompt_tps = [s["prompt_tps"] for s in samples if s["prompt_tps"] > 0]
+        profile["ttft_p99_s"] = float(np.percentile(ttft, 99)) if ttft else 0.0
+        profile["tps_p1"] = float(np.percentile(tps, 1)) if tps else 0.0
+        profile["total_p99_s"] = float(np.percentile(totals, 99))
+        profile["prompt_tps_p50"] = float(np.median(prompt_tps)) if prompt_tps else 0.0
+        profile["prompt_tokens_max"] = max(s.get("prompt_tokens", 0) for s in samples)
+
+    with _profile_lock:
+        _profile_cache[model_name] = (now, profile)
+    return profile
+
+
+def invalidate_latency_profile(model_name=None):
+    """丢弃缓存的延迟统计（model_name 为空时清空全部）"""
+    with _profile_lock:
+        if model_name is None:
+            _profile_cache.clear()
+        else:
+            _profile_cache.pop(model_name, None)
+
+
+def _matching_overrides(model_name, case):
+    """
+    从 GENERATION_BUDGETS 中取出与模型、用例匹配的配置，例如：
+    {"models": {"*qwen*": {"max_tokens": 8192}}, "cases": {"12": {"deadline_s": 900}}}
+    模型名支持通配符，用例按 ID 或标题匹配；用例配置优先于模型配置
+    """
+    budgets = get_json_setting("GENERATION_BUDGETS", {})
+    if not isinstance(budgets, dict):
+        return {}
+
+    overrides = {}
+    for pattern, budget in (budgets.get("models") or {}).items():
+        if isinstance(budget, dict) and model_name and fnmatch.fnmatch(model_name.lower(), pattern.lower()):
+            overrides.update(budget)
+    if case is not None:
+        case_budgets = budgets.get("cases") or {}
+        for key in (str(case.get("id")), case.get("title")):
+            if isinstance(case_budgets.get(key), dict):
+                overrides.update(case_budgets[key])
+    return overrides
+
+
+def _expected_ttft(profile, prompt_tokens):
+    """
+    本次请求的预期首字延迟：历史 TTFT 的 p99，提示词较长时不低于按中位预读速度估算的预读时间；
+    提示词比历史记录都长且没有预读速度可参考时返回 None（无法估算，不收紧首字超时）
+    """
+    expected_s = profile["ttft_p99_s"]
+    if prompt_tokens and profile["prompt_tps_p50"] > 0:
+        expected_s = max(expected_s, prompt_tokens / profile["prompt_tps_p50"])
+    elif prompt_tokens and prompt_tokens > profile["prompt_tokens_max"]:
+        return None
+    return expected_s
+
+
+def resolve_generation_budget(model_name, case=None, prompt_tokens=None):
+    """
+    解析一次生成的预算
+
+    Args:
+        model_name: 请求使用的模型 ID
+        case: 测试用例字典（可选，用于匹配按用例的配置）
+        prompt_tokens: 本次提示词的 token 数（可选，用于按提示词长度放宽自适应首字超时）
+
+    Returns:
+        dict: {"max_tokens", "deadline_s", "first_token_timeout_s", "adaptive"}，
+              max_tokens/deadline_s 为 None 表示不限制
+    """
+    max_tokens = get_setting("GENERATION_MAX_TOKENS", 0)
+    deadline_s = get_setting("GENERATION_DEADLINE_S", 0.0)
+    first_token_s = get_setting("GENERATION_FIRST_TOKEN_TIMEOUT_S", 300.0)
+    budget = {
+        "max_tokens": max_tokens or None,
+        "deadline_s": deadline_s or None,
+        "first_token_timeout_s": first_token_s,
+        "adaptive": False,
+    }
+
+    overrides = _matching_overrides(model_name, case)
+    for key in ("max_tokens", "deadline_s", "first_token_timeout_s"):
+        if overrides.get(key):
+            budget[key] = overrides[key]
+
+    if not get_setting("ADAPTIVE_TIMEOUTS", False) or not model_name:
+        return budget
+
+    profile = get_latency_profile(model_name)
+    if profile["samples"] < get_setting("ADAPTIVE_TIMEOUT_MIN_SAMPLES", 10):
+        return budget
+
+    margin = get_setting("ADAPTIVE_TIMEOUT_MARGIN", 2.0)
+    floor_s = get_setting("ADAPTIVE_TIMEOUT_FLOOR_S", 30.0)
+
+    # 首字超时：预期首字延迟（历史 TTFT 的 p99，长提示词按预读时间估算）× 余量
+    expected_ttft_s = _expected_ttft(profile, prompt_tokens)
+    if not overrides.get("first_token_timeout_s") and expected_ttft_s:
+        budget["first_token_timeout_s"] = round(min(first_token_s, max(floor_s, expected_ttft_s * margin)), 1)
+        budget["adaptive"] = True
+    if expected_ttft_s is None:
+        return budget
+
+    # 墙钟上限：有生成预算时按最慢的历史速度生成满预算所需的时间估算，否则取历史总耗时的 p99
+    if not overrides.get("deadline_s"):
+        if budget["max_tokens"] and profile["tps_p1"] > 0:
+            expected_s = expected_ttft_s + budget["max_tokens"] / profile["tps_p1"]
+        else:
+            expected_s = profile["total_p99_s"] + max(0.0, expected_ttft_s - profile["ttft_p99_s"])
+        if expected_s > 0:
+            adaptive_deadline = round(max(floor_s, expected_s * margin), 1)
+            budget["deadline_s"] = min(deadline_s, adaptive_deadline) if deadline_s else adaptive_deadline
+            budget["adaptive"] = True
+
+    return budget
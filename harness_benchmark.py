@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+评测程序自身的性能基准
+
+在临时目录中使用独立的数据库，并启动进程内的模拟服务 (mock_server.MockLLMServer，默认不限速、无首字延迟)，
+测量与真实端点无关的开销：
+- call_llm：单次流式生成的客户端开销
+- batch：run_batch_test 的用例吞吐（用例/秒）
+- call_evaluator / evaluate_response：单个评委和完整评委面板的评分吞吐
+- save_eval_record / update_eval_scores：数据库写入速率
+- stats：各统计查询在 1k / 100k / 1M 条记录（synthetic_db 生成）下的耗时（每轮前清空缓存）
+
+每项基准报告 min / median / mean / max 和 ops/s（风格参照 pytest-benchmark）。
+可以保存结果为 JSON，并与之前保存的基准比较，中位数变慢超过阈值时返回非零退出码。
+
+用法:
+    python harness_benchmark.py
+    python harness_benchmark.py --only stats --sizes 1000,100000 --save bench_before.json
+    python harness_benchmark.py --compare bench_before.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# 基准运行时会切换到临时目录，确保仍能导入项目模块
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+BENCHMARK_GROUPS = ("call_llm", "batch", "evaluator", "db_write", "stats")
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+
+
+def measure(func, rounds=10, warmup=1):
+    """
+    多轮执行 func 并统计耗时（秒）
+
+    Returns:
+        dict: rounds、min、median、mean、max、stddev、ops（按中位数计算的每秒次数）
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings)
+    median = float(np.median(timings))
+    return {
+        "rounds": rounds,
+        "min": float(timings.min()),
+        "median": median,
+        "mean": float(timings.mean()),
+        "max": float(timings.max()),
+        "stddev": float(timings.std()),
+        "ops": 1 / median if median > 0 else 0.0,
+    }
+
+
+def _prepare_environment(workdir, mock_url):
+    """切换到临时目录（数据库和事件日志都写在这里），并把评委和本地模型指向模拟服务"""
+    os.chdir(workdir)
+    import config
+    overrides = {
+        "EVALUATOR_BASE_URL": mock_url, "EVALUATOR_API_KEY": "mock",
+        "LOCAL_MODEL_URL": mock_url, "LOCAL_MODEL_KEY": "mock", "LOCAL_MODEL_ID": "mock-model-Q4_K_M.gguf",
+        "EVALUATOR_MODEL_GEM": "mock-gem", "EVALUATOR_MODEL_OPUS": "mock-opus", "EVALUATOR_MODEL_GPT": "mock-gpt",
+        "EVALUATOR_MODEL_TOP2": "mock-top2", "EVALUATOR_MODEL_TOP": "mock-top",
+        "AUTO_EVALUATE": False, "WARMUP_REQUEST": False, "TELEMETRY_INTERVAL_S": 0,
+        "DEBUG_PRINTS": False, "EVENT_LOG_PATH": "", "GENERATION_MAX_TOKENS": 0,
+    }
+    for name, value in overrides.items():
+        setattr(config, name, value)
+
+    from init_db import init_db
+    init_db()
+
+
+def _create_cases(count, prefix="bench"):
+    from database import save_test_case, get_all_test_cases
+    for i in range(count):
+        save_test_case(f"{prefix}-{i}", "benchmark", {f"main_{i}.py": f"def f_{i}(x):\n    return x * {i}\n"},
+                       f"解释函数 f_{i} 的作用并给出测试。", f"f_{i} 返回 x 乘以 {i}。")
+    get_all_test_cases.clear()
+    cases = get_all_test_cases()
+    return cases[cases['title'].str.startswith(prefix)].to_dict('records')
+
+
+def bench_call_llm(mock_url, rounds):
+    from llm_client import call_llm
+    prompt = "请解释下面的代码。\n" + "def f(x):\n    return x + 1\n" * 50
+    result = measure(lambda: call_llm("", prompt, mock_url, "mock", "mock-model-Q4_K_M.gguf", full_prompt=prompt,
+                                      max_tokens=128), rounds=rounds)
+    return [("call_llm", "128 tokens", result)]
+
+
+def bench_batch(mock_url, rounds, cases):
+    from background_tasks import BackgroundTaskManager
+    manager = BackgroundTaskManager()
+    result = measure(lambda: manager.run_batch_test(cases, mock_url, "mock", "mock-model-Q4_K_M.gguf"),
+                     rounds=max(1, rounds // 5), warmup=0)
+    result["items_per_s"] = len(cases) / result["median"] if result["median"] > 0 else 0.0
+    return [("run_batch_test", f"{len(cases)} cases", result)]
+
+
+def bench_evaluator(rounds):
+    from llm_client import call_evaluator, evaluate_response
+    prompt, reference, response = "实现快速排序", "def quicksort(a): ...", "def quicksort(items):\n    ...\n" * 20
+    results = [("call_evaluator", "gem", measure(lambda: call_evaluator(prompt, reference, response, "gem"),
+                                                 rounds=rounds))]
+    results.append(("evaluate_response", "full panel",
+                     measure(lambda: evaluate_response(prompt, reference, response), rounds=rounds)))
+    return results
+
+
+def bench_db_write(rounds, cases, records_per_round=200):
+    from database import save_eval_record, update_eval_scores
+    record_ids = []
+
+    def write_records():
+        for i in range(records_per_round):
+            record_ids.append(save_eval_record({
+                "case_id": cases[i % len(cases)]['id'], "model_name": "bench-model.gguf", "temperature": 0.0,
+                "local_response": "回答内容 " * 100, "chain_of_thought": None, "prompt_tokens": 1000,
+                "completion_tokens": 300, "total_time_ms": 5000.0, "tokens_per_second": 60.0, "prompt_tps": 800.0,
+                "max_context": 32768, "eval_score": 0, "eval_comment": "待评分",
+            }))
+
+    def update_scores():
+        for record_id in record_ids[-records_per_round:]:
+            update_eval_scores(record_id, {level: {"score": 80, "reasoning": "ok"}
+                                           for level in ("gem", "opus", "gpt", "top")})
+
+    write = measure(write_records, rounds=rounds, warmup=0)
+    write["items_per_s"] = records_per_round / write["median"] if write["median"] > 0 else 0.0
+    update = measure(update_scores, rounds=rounds, warmup=0)
+    update["items_per_s"] = records_per_round / update["median"] if update["median"] > 0 else 0.0
+    return [("save_eval_record", f"{records_per_round} records", write),
+            ("update_eval_scores", f"{records_per_round} records", update)]
+
+
+def stats_queries():
+    """统计查询基准：名称 -> 无参调用"""
+    import database
+    return {
+        "get_stats": database.get_stats,
+        "get_model_summary_stats": database.get_model_summary_stats,
+        "get_model_detail_stats": lambda: database.get_model_detail_stats(database.get_all_models()[0]),
+        "get_case_summary_stats": database.get_case_summary_stats,
+        "get_case_model_ranking": lambda: database.get_case_model_ranking(1),
+        "get_model_speed_ranking": database.get_model_speed_ranking,
+        "get_sample_stats": database.get_sample_stats,
+        "get_leaderboard_stats": database.get_leaderboard_stats,
+        "get_eval_history": database.get_eval_history,
+    }
+
+
+def bench_stats(sizes, rounds):
+    import database
+    from synthetic_db import generate_database
+    results = []
+    for size in sizes:
+        start = time.perf_counter()
+        # 合成数据（缩短文本以控制临时数据库大小），会清空前面基准写入的用例和记录
+        generate_database(database.DB_PATH, n_records=size, n_models=100, n_cases=1000, text_scale=0.1)
+        print(f"  已写入 {size} 条记录 ({time.perf_counter() - start:.1f}s)")
+        for name, query in stats_queries().items():
+            def run():
+                database.clear_cache()
+                query()
+            results.append((name, f"{size} records", measure(run, rounds=max(1, rounds // 2) if size >= 1_000_000 else rounds)))
+    return results
+
+
+def compare_results(current, baseline, threshold):
+    """与保存的基准比较中位数，返回变慢超过阈值的条目"""
+    previous = {(row["name"], row["param"]): row for row in baseline}
+    regressions = []
+    for row in current:
+        old = previous.get((row["name"], row["param"]))
+        if old and old["median"] > 0:
+            change = row["median"] / old["median"] - 1
+            row["change"] = change
+            if change > threshold:
+                regressions.append(row)
+    return regressions
+
+
+def print_results(rows):
+    print(f"\n{'基准':<26}{'参数':<18}{'min (ms)':>11}{'median (ms)':>13}{'mean (ms)':>11}{'max (ms)':>11}"
+          f"{'ops/s':>10}{'items/s':>10}{'变化':>9}")
+    for row in rows:
+        change = f"{row['change']:+.0%}" if "change" in row else ""
+        items = f"{row['items_per_s']:.1f}" if "items_per_s" in row else ""
+        print(f"{row['name']:<26}{row['param']:<18}{row['min'] * 1000:>11.2f}{row['median'] * 1000:>13.2f}"
+              f"{row['mean'] * 1000:>11.2f}{row['max'] * 1000:>11.2f}{row['ops']:>10.1f}{items:>10}{change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评测程序自身的性能基准（模拟服务 + 临时数据库）")
+    parser.add_argument("--only", default=None, help=f"只运行部分基准，逗号分隔：{','.join(BENCHMARK_GROUPS)}")
+    parser.add_argument("--sizes", default=None, help="统计查询基准的记录数，默认 1000,100000,1000000")
+    parser.add_argument("--rounds", type=int, default=10, help="每项基准的执行轮数")
+    parser.add_argument("--batch-cases", type=int, default=20, help="batch 基准每轮运行的用例数")
+    parser.add_argument("--save", default=None, help="把结果保存为 JSON")
+    parser.add_argument("--compare", default=None, help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="中位数变慢超过该比例时视为回归")
+    args = parser.parse_args()
+
+    if sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    requested = [g.strip() for g in args.only.split(",")] if args.only else list(BENCHMARK_GROUPS)
+    for group in requested:
+        if group not in BENCHMARK_GROUPS:
+            print(f"未知的基准: {group}")
+    # stats 会用合成数据替换临时数据库的内容，始终放在最后
+    groups = [group for group in BENCHMARK_GROUPS if group in requested]
+    sizes = [int(v) for v in args.sizes.split(",")] if args.sizes else list(DEFAULT_SIZES)
+    save_path = os.path.abspath(args.save) if args.save else None
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    from mock_server import MockLLMServer
+    mock = MockLLMServer()
+    mock_url = mock.start()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="harness-bench-") as workdir:
+        cwd = os.getcwd()
+        try:
+            _prepare_environment(workdir, mock_url)
+            cases = _create_cases(max(args.batch_cases, 10))
+            runners = {
+                "call_llm": lambda: bench_call_llm(mock_url, args.rounds),
+                "batch": lambda: bench_batch(mock_url, args.rounds, cases[:args.batch_cases]),
+                "evaluator": lambda: bench_evaluator(args.rounds),
+                "db_write": lambda: bench_db_write(args.rounds, cases),
+                "stats": lambda: bench_stats(sizes, args.rounds),
+            }
+            for group in groups:
+                print(f"运行基准: {group} ...")
+                for name, param, stats in runners[group]():
+                    results.append({"name": name, "param": param, **stats})
+        finally:
+            os.chdir(cwd)
+            mock.stop()
+
+    regressions = compare_results(results, baseline, args.threshold) if baseline else []
+    print_results(results)
+    print(f"\n模拟服务统计: {mock.stats}")
+
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {save_path}")
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} 项基准的中位数变慢超过 {args.threshold:.0%}:")
+        for row in regressions:
+            print(f"  {row['name']} ({row['param']}): {row['change']:+.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,37 @@
 import sqlite3
 import sys
 
-def init_db(clear_records=False):
+# 建表之后新增的字段：字段名 -> 类型定义（旧数据库通过 ALTER TABLE 补齐）
+EVAL_RECORD_EXTRA_COLUMNS = {
+    'case_hash': 'TEXT',
+    'run_fingerprint': 'TEXT',
+    'sample_index': 'INTEGER DEFAULT 0',
+    'judges_run': 'TEXT',
+    'finish_reason': 'TEXT',
+    'ttft_ms': 'REAL',
+    'cold_start': 'INTEGER DEFAULT 0',
+    'job_id': 'TEXT',
+    'started_at': 'REAL',
+    'env_fingerprint': 'TEXT',
+}
+
+
+def ensure_columns(cursor, table_name, columns):
+    """检查表中缺失的字段并补齐"""
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    existing = {col[1] for col in cursor.fetchall()}
+    for column, definition in columns.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}")
+            print(f"   - 已为 {table_name} 表添加字段: {column}")
+
+def init_db(clear_records=False, db_path='eval_results.db'):
     """初始化数据库，创建测试用例表和评测记录表"""
     # 强制设置 stdout 编码为 UTF-8，解决 Windows 终端中文乱码问题
     if sys.stdout.encoding != 'utf-8':
         sys.stdout.reconfigure(encoding='utf-8')
         
-    conn = sqlite3.connect('eval_results.db')
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # 如果需要清空记录，删除评测记录表
@@ -51,6 +75,17 @@ def init_db(clear_records=False):
             tokens_per_second REAL,             -- 生成速度 (tokens/s)
             prompt_tps REAL,                    -- 预读速度 (tokens/s)
             max_context INTEGER,                -- 模型支持的最大上下文
+            ttft_ms REAL,                       -- 首字延迟 (毫秒，从拿到槽位开始计时)
+            finish_reason TEXT,                 -- 生成结束原因 (stop / length / deadline / cancelled)
+            cold_start INTEGER DEFAULT 0,       -- 1 表示首字延迟包含模型加载时间，不计入速度统计
+            job_id TEXT,                        -- 所属测试任务（关联 telemetry_samples.job_id）
+            started_at REAL,                    -- 请求开始时间 (Unix 时间戳，拿到槽位时)
+            env_fingerprint TEXT,               -- 运行环境指纹（关联 run_environments.fingerprint）
+            
+            -- 运行指纹（用于跳过已有的确定性运行）
+            case_hash TEXT,                     -- 用例内容哈希（上下文 + 任务）
+            run_fingerprint TEXT,               -- 用例哈希 + 模型 + 温度 + 采样参数 + 提示词模板版本
+            sample_index INTEGER DEFAULT 0,     -- 重复采样时的采样序号
             
             -- 评分与反馈 (五种评委，权重相同)
             eval_score REAL,                    -- 综合评分 (0-100)
@@ -66,6 +101,7 @@ def init_db(clear_records=False):
             eval_comment_4 TEXT,                -- 评委4 评语
             eval_score_5 INTEGER,               -- 评委5 评分 (0-100)
             eval_comment_5 TEXT,                -- 评委5 评语
+            judges_run TEXT,                    -- 实际调用的评委（逗号分隔，早停面板会跳过部分评委）
             
             -- 元数据
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -74,11 +110,123 @@ def init_db(clear_records=False):
         )
     ''')
 
+    # 为旧数据库补充新增字段
+    ensure_columns(cursor, 'eval_records', EVAL_RECORD_EXTRA_COLUMNS)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_eval_records_fingerprint ON eval_records(run_fingerprint)')
+
+    # 批量重新评分任务（记录筛选条件和检查点，中断后可以从 last_record_id 之后继续）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rescore_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filters TEXT,                       -- 筛选条件 (JSON)
+            target_levels TEXT,                 -- 目标评委（逗号分隔，空表示全部）
+            status TEXT,                        -- running / stopped / completed / failed
+            total INTEGER,                      -- 创建时满足条件的记录数
+            processed INTEGER DEFAULT 0,        -- 已处理记录数
+            failed INTEGER DEFAULT 0,           -- 评分失败记录数
+            last_record_id INTEGER DEFAULT 0,   -- 检查点：已处理完的最大记录 ID
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 端点吞吐测试（并发数 × 提示词长度扫描，每个测试点一行）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS throughput_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT,                        -- 一次扫描的标识
+            api_base TEXT,                      -- 被测端点
+            model_name TEXT,                    -- 模型 ID
+            model_path TEXT,                    -- /props 中的模型文件（区分量化版本）
+            n_ctx INTEGER,                      -- 服务端上下文窗口
+            total_slots INTEGER,                -- 服务端槽位数 (-np)
+            concurrency INTEGER,                -- 并发请求数
+            prompt_tokens_target INTEGER,       -- 目标提示词长度
+            prompt_tokens REAL,                 -- 实际平均提示词长度
+            max_tokens INTEGER,                 -- 每个请求的生成长度
+            requests INTEGER,                   -- 请求数
+            errors INTEGER,                     -- 失败请求数
+            wall_time_ms REAL,                  -- 测试点总耗时
+            completion_tokens INTEGER,          -- 所有请求生成的 token 总数
+            aggregate_tps REAL,                 -- 聚合吞吐 (tokens/s)
+            per_stream_tps REAL,                -- 单流平均生成速度 (tokens/s)
+            ttft_ms_p50 REAL,                   -- 首字延迟中位数
+            ttft_ms_p95 REAL,                   -- 首字延迟 p95
+            prompt_tps REAL,                    -- 平均预读速度 (tokens/s)
+            error TEXT,                         -- 第一个失败请求的错误信息
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_throughput_profiles_run ON throughput_profiles(run_id)')
+
+    # llama.cpp 服务端遥测（测试任务运行期间按固定间隔采集 /metrics 和 /slots）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS telemetry_samples (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT,                        -- 所属测试任务
+            server TEXT,                        -- 服务地址
+            ts REAL,                            -- 采样时间 (Unix 时间戳)
+            kv_cache_usage REAL,                -- KV cache 占用比例 (0~1)
+            kv_cache_tokens INTEGER,            -- KV cache 中的 token 数
+            requests_processing INTEGER,        -- 正在处理的请求数
+            requests_deferred INTEGER,          -- 被推迟（排队）的请求数
+            prompt_tokens_total REAL,           -- 累计预读 token 数
+            tokens_predicted_total REAL,        -- 累计生成 token 数
+            prompt_tps REAL,                    -- 服务端统计的平均预读速度
+            predicted_tps REAL,                 -- 服务端统计的平均生成速度
+            total_slots INTEGER,                -- 槽位数
+            busy_slots INTEGER,                 -- 忙碌槽位数
+            max_slot_fill REAL,                 -- 忙碌槽位的最大上下文填充率（接近 1 时发生上下文滑动）
+            metrics TEXT                        -- 全部 /metrics 指标 (JSON)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_telemetry_samples_job ON telemetry_samples(job_id, ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_eval_records_job ON eval_records(job_id)')
+
+    # 运行环境（服务端构建、模型文件/量化、采样参数、评测程序版本），评测记录通过 env_fingerprint 关联
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_environments (
+            fingerprint TEXT PRIMARY KEY,       -- 环境指纹
+            model_name TEXT,                    -- 请求使用的模型 ID
+            model_family TEXT,                  -- 模型系列（文件名去掉量化类型和扩展名）
+            model_file TEXT,                    -- 模型文件名
+            quant TEXT,                         -- 量化类型 (Q4_K_M / Q8_0 / BF16 ...)
+            server_build TEXT,                  -- /props 中的 build_info
+            sampling TEXT,                      -- 采样参数 (JSON)
+            harness_version TEXT,               -- 评测程序版本（git 提交 + 提示词模板版本）
+            api_base TEXT,                      -- 首次使用的端点
+            first_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_eval_records_env ON eval_records(env_fingerprint)')
+
+    # 性能剖析结果（开启 PROFILING 时按任务保存各计时区间的汇总）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_spans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT,                        -- 测试任务 ID（批量重评为 rescore-<ID>，页面渲染为 ui）
+            span TEXT,                          -- 区间名（函数名）
+            count INTEGER,                      -- 调用次数
+            total_ms REAL,                      -- 总耗时（包含嵌套的子区间）
+            self_ms REAL,                       -- 自身耗时（扣除嵌套的子区间）
+            mean_ms REAL,                       -- 平均耗时
+            max_ms REAL,                        -- 最大耗时
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_profile_spans_job ON profile_spans(job_id)')
+
     conn.commit()
     conn.close()
     print("数据库初始化成功！")
     print("   - test_cases 表已就绪")
     print("   - eval_records 表已更新为五模型架构")
+    print("   - rescore_jobs 表已就绪")
+    print("   - throughput_profiles 表已就绪")
+    print("   - telemetry_samples 表已就绪")
+    print("   - run_environments 表已就绪")
+    print("   - profile_spans 表已就绪")
 
 if __name__ == "__main__":
     # 如果通过命令行运行且带有 --clear 参数，则清空记录
@@ -0,0 +1,152 @@
+"""
+测试任务的进度与计数
+
+BackgroundTaskManager 的用例计数、评分计数和正在执行的用例会被多个工作线程同时更新，
+这里把它们集中到一个带锁的对象中，并提供一次性读取全部状态的 snapshot()，
+页面轮询时只需复制几个计数和一个小字典。
+"""
+import itertools
+import threading
+import time
+
+
+class JobProgress:
+    """单个测试任务的进度（所有方法都是线程安全的）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count(1)
+        self._job_ids = itertools.count(1)
+        # 评分计数跨任务累加（重新评分可能与测试任务并发进行），reset() 不清零
+        self.pending_evals = 0
+        self.completed_evals = 0
+        self.job_id = 0
+        self._reset_job(0)
+
+    def _reset_job(self, total):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.in_flight = {}
+        self.last_case = ""
+
+    def reset(self, total=0):
+        """开始新任务：清零用例计数（包括失败数），返回新的任务 ID"""
+        with self._lock:
+            self.job_id = next(self._job_ids)
+            self._reset_job(total)
+            return self.job_id
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+
+    def start_task(self, case_title, **info):
+        """登记一个正在执行的用例，返回任务 ID"""
+        with self._lock:
+            task_id = next(self._task_ids)
+            self.in_flight[task_id] = dict(info, case=case_title, stage="生成中", started_at=time.time())
+            self.last_case = case_title
+            return task_id
+
+    def update_task(self, task_id, stage):
+        """更新正在执行的用例所处的阶段"""
+        with self._lock:
+            task = self.in_flight.get(task_id)
+            if task is not None:
+                task["stage"] = stage
+
+    def finish_task(self, task_id, prompt_tokens=0, completion_tokens=0):
+        """用例执行结束（无论成功与否），累计 token 数"""
+        with self._lock:
+            self.in_flight.pop(task_id, None)
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+
+    def record_result(self, success, cancelled=False):
+        """记录一次用例执行结果（被取消的用例单独计数，不计入失败），返回当前进度 (0~1)"""
+        with self._lock:
+            if cancelled:
+                self.cancelled += 1
+            elif not success:
+                self.failed += 1
+            self.completed += 1
+            return self._progress()
+
+    def finish(self):
+        """任务结束"""
+        with self._lock:
+            self.finished_at = time.time()
+
+    def add_pending_evals(self, count=1):
+        with self._lock:
+            self.pending_evals += count
+
+    def add_completed_evals(self, count=1):
+        with self._lock:
+            self.completed_evals += count
+
+    def _progress(self):
+        if self.finished_at is not None:
+            return 1.0
+        return self.completed / self.total if self.total else 0.0
+
+    @property
+    def progress(self):
+        with self._lock:
+            return self._progress()
+
+    @property
+    def current_case(self):
+        """最近开始且仍在执行的用例（没有正在执行的用例时为最后开始的用例）"""
+        with self._lock:
+            if self.in_flight:
+                return self.in_flight[max(self.in_flight)]["case"]
+            return self.last_case
+
+    def in_flight_count(self):
+        with self._lock:
+            return len(self.in_flight)
+
+    def snapshot(self):
+        """
+        返回进度快照
+
+        Returns:
+            dict: 计数、进度、耗时、吞吐 (用例/分钟、聚合 tokens/s)、预计剩余时间和正在执行的用例列表
+        """
+        with self._lock:
+            now = time.time()
+            end = self.finished_at or now
+            elapsed = max(end - self.started_at, 1e-6)
+            remaining = max(self.total - self.completed, 0)
+            rate = self.completed / elapsed
+            in_flight = [
+                {"task_id": task_id, "case": task["case"], "stage": task["stage"],
+                 "model": task.get("model", ""), "sample_index": task.get("sample_index", 0),
+                 "elapsed_s": round(now - task["started_at"], 1)}
+                for task_id, task in sorted(self.in_flight.items())
+            ]
+            return {
+                "job_id": self.job_id,
+                "total": self.total,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "succeeded": self.completed - self.failed - self.cancelled,
+                "progress": self._progress(),
+                "elapsed_s": round(elapsed, 1),
+                "cases_per_min": round(rate * 60, 2),
+                "tokens_per_s": round(self.completion_tokens / elapsed, 2),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "eta_s": round(remaining / rate, 1) if rate > 0 and self.finished_at is None else None,
+                "pending_evals": self.pending_evals,
+                "completed_evals": self.completed_evals,
+                "in_flight": in_flight,
+            }
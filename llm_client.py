@@ -2,11 +2,18 @@ import os
 import time
 import json
 import re
-import requests
 import threading
 from concurrent.futures import ThreadPoolExecutor
-from openai import OpenAI
+from contextlib import contextmanager, nullcontext
+from openai import OpenAI, BadRequestError, RateLimitError
 import config  # 使用集中配置文件
+from config_utils import get_setting, get_list_setting, get_json_setting
+from prompt_builder import build_prompt
+from server_props import props_cache, is_local_endpoint
+from endpoint_scheduler import endpoint_slot, get_rate_limiter, KIND_GENERATION, KIND_JUDGE
+from event_log import debug, log_event
+from cancellation import TaskCancelled
+from profiling import profiled, bind_job
 
 # 全局变量：用于控制不同模型的分开限制
 _model_locks = {}
@@ -20,6 +27,7 @@ def get_model_lock(model_name):
             _model_locks[model_name] = threading.Lock()
         return _model_locks[model_name]
 
+@profiled()
 def extract_cot(text):
     """
     尝试从文本中提取思维链内容 (CoT)
@@ -42,6 +50,7 @@ def extract_cot(text):
             
     return None, text
 
+@profiled()
 def extract_score_from_xml(text):
     """从 XML 标签中尝试提取评分和理由"""
     try:
@@ -56,9 +65,10 @@ def extract_score_from_xml(text):
                 final_score = max(1, score)
                 return {"score": final_score, "reasoning": reasoning}
     except Exception as e:
-        print(f"[DEBUG] XML extraction failed: {e}")
+        debug(f"XML extraction failed: {e}")
     return None
 
+@profiled()
 def extract_score_from_text(text):
     """从自然语言文本中尝试提取评分，作为 JSON 格式失败时的后备方案"""
     # 尝试匹配 "score: 85" 或 "评分: 88" 等模式
@@ -78,6 +88,7 @@ def extract_score_from_text(text):
                 return {"score": final_score, "reasoning": text}
     return None
 
+@profiled()
 def robust_json_load(clean_json):
     """
     鲁棒地解析 JSON，处理常见的 LLM 输出错误
@@ -86,7 +97,7 @@ def robust_json_load(clean_json):
         return json.loads(clean_json)
     except json.JSONDecodeError as json_err:
         err_msg = str(json_err).lower()
-        print(f"[DEBUG] JSON parsing failed: {json_err}. Attempting robust fix...")
+        debug(f"JSON parsing failed: {json_err}. Attempting robust fix...")
         
         # 针对常见的控制字符（换行等）和引号未转义问题进行处理
         # 1. 处理控制字符
@@ -111,112 +122,172 @@ def robust_json_load(clean_json):
                         reasoning = fixed[reasoning_content_start:reasoning_end_match.start()]
                         return {"score": score, "reasoning": reasoning}
             except Exception as e:
-                print(f"[DEBUG] Regex extraction also failed: {e}")
+                debug(f"Regex extraction also failed: {e}")
                 
         # 如果所有尝试都失败，重新抛出原始异常
         raise json_err
 
 def get_llama_props(api_base):
-    """尝试从 llama.cpp 获取模型属性 (仅限本地地址)"""
-    if not api_base:
-        return {}
-        
-    # 如果不是本地地址，跳过，避免远端 API 响应慢或超时
-    local_keywords = ['localhost', '127.0.0.1', '10.', '192.168.', '0.0.0.0']
-    is_local = any(kw in api_base for kw in local_keywords)
-    
-    if not is_local:
-        return {}
+    """
+    获取 llama.cpp 服务端元数据 (仅限本地地址)
+    读取按端点缓存的 /props 结果，缓存由任务开始时预取并在后台刷新
+    """
+    return props_cache.get(api_base)
 
-    try:
-        # 假设 api_base 是 http://.../v1，我们需要去掉 /v1
-        base_url = api_base.replace("/v1", "")
-        # 设置极短的超时，避免阻塞
-        resp = requests.get(f"{base_url}/props", timeout=1)
-        if resp.status_code == 200:
-            return resp.json()
-    except:
-        pass
-    return {}
-
-def call_llm(source_code_json, prompt, api_base=None, api_key=None, model_id=None):
+@profiled()
+def call_llm(source_code_json, prompt, api_base=None, api_key=None, model_id=None, slot_id=None, full_prompt=None,
+             temperature=None, cancel_token=None, max_tokens=None, deadline_s=None, first_token_timeout_s=None,
+             schedule=True):
     """
     调用 LLM (本地或远端，使用标准 OpenAI 格式)
     source_code_json: 可能是单文件字符串，也可能是多文件 JSON
+    slot_id: llama.cpp 槽位提示，共享上下文的用例固定到同一槽位以复用 KV cache
+    full_prompt: 已组装好的完整提示词（来自 prompt_builder 缓存），提供时跳过组装
+    temperature: 采样温度，None 时使用服务端默认值
+    cancel_token: CancellationToken，取消时关闭正在读取的流并返回已生成的部分内容
+                  (finish_reason 为 "cancelled")；在拿到槽位前取消时抛出 TaskCancelled
+    max_tokens: 最大生成长度，None 时不限制（达到上限时 finish_reason 为 "length"）
+    deadline_s: 生成的墙钟时间上限（从拿到槽位开始计时），到期后关闭连接并返回已生成的部分内容
+                (finish_reason 为 "deadline")
+    first_token_timeout_s: 等待首个 token（以及两个 chunk 之间）的最长时间，None 时为 300 秒
+    schedule: False 时不经过端点调度（本地槽位 / 远端服务商整形），请求立即发出；
+              用于吞吐测试这类需要真实并发的压测
     """
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
     # 优先使用传入的参数，否则使用配置文件中的设置
     final_api_base = api_base if api_base else config.LOCAL_MODEL_URL
     final_api_key = api_key if api_key else config.LOCAL_MODEL_KEY
     final_model_id = model_id if model_id else config.LOCAL_MODEL_ID
 
-    print(f"\n[DEBUG] Calling LLM at: {final_api_base}")
-    print(f"[DEBUG] Model ID: {final_model_id}")
+    debug(f"Calling LLM at: {final_api_base}")
+    debug(f"Model ID: {final_model_id}")
 
-    # 设置超时时间：连接超时 10 秒，读取超时 300 秒 (5 分钟)
+    # 设置超时时间：连接超时 10 秒，读取超时默认 300 秒 (5 分钟)，可由生成预算按模型历史 TTFT 收紧
     # 这样可以防止在网络连接失败时卡住太久
-    client = OpenAI(api_key=final_api_key, base_url=final_api_base, timeout=(10.0, 300.0))
+    read_timeout = float(first_token_timeout_s) if first_token_timeout_s else 300.0
+    client = OpenAI(api_key=final_api_key, base_url=final_api_base, timeout=(10.0, read_timeout))
 
-    # 处理多文件上下文
-    context = ""
-    is_empty_context = False
+    # 组装提示词：多文件上下文按文件名排序放在最前面，便于服务端复用前缀缓存
+    if full_prompt is None:
+        full_prompt = build_prompt(source_code_json, prompt)
 
-    try:
-        source_dict = json.loads(source_code_json)
-        if isinstance(source_dict, dict) and source_dict:
-            for filename, content in source_dict.items():
-                context += f"--- FILE: {filename} ---\n{content}\n\n"
-        elif isinstance(source_dict, dict) and not source_dict:
-            is_empty_context = True
-        else:
-            context = str(source_code_json)
-    except:
-        if not source_code_json or not source_code_json.strip():
-            is_empty_context = True
-        else:
-            context = source_code_json
-
-    if is_empty_context:
-        full_prompt = f"Task:\n{prompt}\n\nNote: No existing code provided. Please implement this feature from scratch."
-    else:
-        full_prompt = f"Context:\n{context}\n\nTask:\n{prompt}"
-    
-    start_time = time.time()
     first_token_time = None
     full_content = ""
     actual_model_name = final_model_id  # 默认使用配置的模型名
 
     # 使用流式输出以精确计算生成速度 (TPS)
     # 为 Qwen 模型添加 enable_thinking 参数
-    extra_body = None
+    extra_body = {}
     if final_api_base and "dashscope" in final_api_base:
-        extra_body = {"enable_thinking": True}
-    
-    response_stream = client.chat.completions.create(
-        model=final_model_id,
-        messages=[{"role": "user", "content": full_prompt}],
-        stream=True,
-        stream_options={"include_usage": True},
-        extra_body=extra_body
-    )
+        extra_body["enable_thinking"] = True
+
+    # llama.cpp 前缀缓存提示：复用上次请求已处理的提示词前缀
+    if is_local_endpoint(final_api_base) and get_setting("LLAMA_CACHE_PROMPT", True):
+        extra_body["cache_prompt"] = True
+        if slot_id is not None:
+            extra_body["id_slot"] = slot_id
     
+    sampling_kwargs = {}
+    if temperature is not None:
+        sampling_kwargs["temperature"] = temperature
+    if max_tokens:
+        sampling_kwargs["max_tokens"] = int(max_tokens)
+
     prompt_tokens = 0
     completion_tokens = 0
+    finish_reason = ""
+    # llama.cpp 在最后一个 chunk 中附带的 timings（prompt_n 为实际预读的 token 数，不含前缀缓存命中部分）
+    timings = None
 
-    for chunk in response_stream:
-        # 尝试从第一个 chunk 获取实际的模型名称
-        if hasattr(chunk, 'model') and chunk.model:
-            actual_model_name = chunk.model
-            
-        if chunk.choices and len(chunk.choices) > 0:
-            delta = chunk.choices[0].delta.content
-            if delta:
-                if first_token_time is None:
-                    first_token_time = time.time()
-                full_content += delta
-        
-        if hasattr(chunk, 'usage') and chunk.usage is not None:
-            prompt_tokens = chunk.usage.prompt_tokens
-            completion_tokens = chunk.usage.completion_tokens
+    # 取消时关闭流和底层连接，服务端检测到断开后会停止生成并释放槽位
+    open_streams = []
+
+    def abort_request():
+        for stream in open_streams:
+            stream.close()
+        client.close()
+
+    # 墙钟上限到期时与取消一样关闭流，保留已生成的部分内容
+    deadline_hit = threading.Event()
+
+    def on_deadline():
+        deadline_hit.set()
+        abort_request()
+
+    def should_stop():
+        return deadline_hit.is_set() or (cancel_token is not None and cancel_token.cancelled)
+
+    should_abort = cancel_token.is_cancelled if cancel_token is not None else None
+
+    # 本地端点按槽位调度：生成请求优先于同一服务器上的本地评委
+    slot = endpoint_slot(final_api_base, KIND_GENERATION, should_abort=should_abort) if schedule else nullcontext(True)
+    with slot as acquired:
+        if not acquired:
+            raise TaskCancelled(cancel_token.reason)
+
+        # 从拿到槽位时开始计时，排队等待的时间不计入 TTFT/预读速度
+        start_time = time.time()
+        unregister = cancel_token.register(abort_request) if cancel_token is not None else (lambda: None)
+        deadline_timer = threading.Timer(float(deadline_s), on_deadline) if deadline_s else None
+        if deadline_timer is not None:
+            deadline_timer.daemon = True
+            deadline_timer.start()
+        try:
+            response_stream = client.chat.completions.create(
+                model=final_model_id,
+                messages=[{"role": "user", "content": full_prompt}],
+                stream=True,
+                stream_options={"include_usage": True},
+                extra_body=extra_body or None,
+                **sampling_kwargs
+            )
+            open_streams.append(response_stream)
+
+            for chunk in response_stream:
+                if should_stop():
+                    break
+
+                # 尝试从第一个 chunk 获取实际的模型名称
+                if hasattr(chunk, 'model') and chunk.model:
+                    actual_model_name = chunk.model
+
+                if chunk.choices and len(chunk.choices) > 0:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token_time is None:
+                            first_token_time = time.time()
+                        full_content += delta
+                    if chunk.choices[0].finish_reason:
+                        finish_reason = chunk.choices[0].finish_reason
+
+                if hasattr(chunk, 'usage') and chunk.usage is not None:
+                    prompt_tokens = chunk.usage.prompt_tokens
+                    completion_tokens = chunk.usage.completion_tokens
+                chunk_timings = (getattr(chunk, 'model_extra', None) or {}).get('timings')
+                if isinstance(chunk_timings, dict):
+                    timings = chunk_timings
+        except RateLimitError as e:
+            # 服务商限流：暂停该服务商的新请求（优先使用 Retry-After），由调用方决定是否重试
+            if not is_local_endpoint(final_api_base):
+                get_rate_limiter(final_api_base).penalize(e.response.headers.get("retry-after"))
+            raise
+        except Exception:
+            # 取消或超过墙钟上限导致的连接关闭异常不向上抛出，返回已生成的部分内容
+            if not should_stop():
+                raise
+        finally:
+            if deadline_timer is not None:
+                deadline_timer.cancel()
+            unregister()
+
+    if should_abort is not None and should_abort():
+        finish_reason = "cancelled"
+        debug(f"LLM 请求已取消，保留 {len(full_content)} 个字符的部分输出", model=final_model_id)
+    elif deadline_hit.is_set():
+        finish_reason = "deadline"
+        debug(f"LLM 生成超过 {deadline_s} 秒上限，保留 {len(full_content)} 个字符的部分输出", model=final_model_id)
 
     end_time = time.time()
     
@@ -226,12 +297,11 @@ def call_llm(source_code_json, prompt, api_base=None, api_key=None, model_id=Non
 
     duration_ms = (end_time - start_time) * 1000
     
-    print(f"[DEBUG] Post-processing response...")
+    debug(f"Post-processing response...")
     raw_content = full_content
     cot, clean_content = extract_cot(raw_content)
 
-    # 尝试获取 llama.cpp 的额外指标
-    print(f"[DEBUG] Fetching llama props (if local)...")
+    # 读取缓存的 llama.cpp 元数据（不会阻塞请求服务端）
     props = get_llama_props(final_api_base)
     max_context = props.get("n_ctx", 0)
     
@@ -240,14 +310,20 @@ def call_llm(source_code_json, prompt, api_base=None, api_key=None, model_id=Non
     gen_duration_s = (end_time - first_token_time) if first_token_time else (duration_ms / 1000)
     tps = completion_tokens / gen_duration_s if gen_duration_s > 0 else 0
     
-    # 计算预读速度 (Prompt TPS)
-    if first_token_time and prompt_tokens > 0:
+    # 计算预读速度 (Prompt TPS)：优先使用服务端统计的实际预读 token 数和耗时，
+    # 命中前缀缓存时 prompt_tokens / 首字延迟 会远高于真实预读速度
+    prompt_n = None
+    if timings and timings.get("prompt_n") is not None:
+        prompt_n = int(timings["prompt_n"])
+    if prompt_n is not None and timings.get("prompt_ms"):
+        prompt_tps = timings.get("prompt_per_second") or prompt_n / (timings["prompt_ms"] / 1000)
+    elif first_token_time and prompt_tokens > 0:
         prompt_processing_time = first_token_time - start_time
         prompt_tps = prompt_tokens / prompt_processing_time if prompt_processing_time > 0 else 0
     else:
         prompt_tps = 0
     
-    print(f"[DEBUG] Finalizing response object...")
+    debug(f"Finalizing response object...")
     return {
         "content": clean_content,
         "chain_of_thought": cot,
@@ -256,10 +332,139 @@ def call_llm(source_code_json, prompt, api_base=None, api_key=None, model_id=Non
         "duration_ms": duration_ms,
         "tps": tps,
         "prompt_tps": prompt_tps,
+        "prompt_n": prompt_n,
         "max_context": max_context,
-        "model_name": actual_model_name
+        "model_name": actual_model_name,
+        "finish_reason": finish_reason,
+        "ttft_ms": (first_token_time - start_time) * 1000 if first_token_time else 0,
+        "started_at": start_time
+    }
+
+# 评委提示词中的评测说明与评分标准（单条评分与批量评分共用）
+EVALUATION_CRITERIA = """【评测任务说明】
+本地模型收到了一个编程任务，需要根据任务要求生成代码解决方案。
+你的任务是评估本地模型的回答是否正确解决了原始问题。
+
+【评分标准】
+- 【严格评分要求】请执行严格评分：任何代码中的小错误、不符合最佳实践、或可能导致边缘情况失败的地方，都必须扣分。只有完美或接近完美的解决方案才能获得高分（90 分以上）。
+- 主要评估本地模型的回答是否正确解决了原始任务
+- 参考答案仅作为参考，本地模型的方案不必与参考答案完全一致"""
+
+# 可以由本地评委接管的评委级别（与 eval_records 的评分字段一一对应）
+JUDGE_LEVELS = ["gem", "opus", "gpt", "top2", "top"]
+
+# 默认参与评分的远端评委（top2 已禁用）
+DEFAULT_JUDGE_LEVELS = ["gem", "opus", "gpt", "top"]
+
+
+def get_local_judges():
+    """
+    读取本地 llama.cpp 评委配置 EVALUATOR_LOCAL_JUDGES（JSON，按评委级别登记），例如：
+    {"top2": {"base_url": "http://10.0.0.115:8080/v1", "model": "qwen2.5-coder-32b.gguf",
+              "concurrency": 2, "n_ctx": 32768, "max_tokens": 1024}}
+
+    Returns:
+        dict: {评委级别: 配置}，忽略未知级别和缺少 base_url 的条目
+    """
+    judges = get_json_setting("EVALUATOR_LOCAL_JUDGES", {})
+    if not isinstance(judges, dict):
+        return {}
+    valid = {}
+    for level, judge in judges.items():
+        if level not in JUDGE_LEVELS or not isinstance(judge, dict) or not judge.get("base_url"):
+            debug(f"忽略无效的本地评委配置: {level}")
+            continue
+        valid[level] = judge
+    return valid
+
+
+def get_active_judge_levels():
+    """默认评委加上登记了本地评委的其他级别（例如由本地模型接管的 top2）"""
+    levels = list(DEFAULT_JUDGE_LEVELS)
+    for level in get_local_judges():
+        if level not in levels:
+            levels.append(level)
+    return levels
+
+
+def get_evaluator_endpoint(evaluator_level):
+    """
+    获取评委的请求目标：登记了本地评委的级别使用其专属 llama.cpp 端点，
+    其他级别使用 EVALUATOR_BASE_URL (LiteLLM 代理)
+
+    Returns:
+        dict: {"model", "api_base", "api_key", "local", "concurrency", "n_ctx", "max_tokens", "timeout"}
+    """
+    judge = get_local_judges().get(evaluator_level)
+    timeout = get_setting("EVALUATOR_TIMEOUT_S", 120.0)
+    if judge is None:
+        return {
+            "model": get_evaluator_model_name(evaluator_level),
+            "api_base": config.EVALUATOR_BASE_URL,
+            "api_key": config.EVALUATOR_API_KEY,
+            "local": False,
+            "concurrency": None,
+            "n_ctx": 0,
+            "max_tokens": None,
+            "timeout": timeout,
+        }
+    return {
+        "model": judge.get("model") or get_evaluator_model_name(evaluator_level),
+        "api_base": judge["base_url"],
+        "api_key": judge.get("api_key") or "any",
+        "local": is_local_endpoint(judge["base_url"]),
+        "concurrency": max(1, int(judge.get("concurrency", 1))),
+        "n_ctx": int(judge.get("n_ctx", 0)),
+        "max_tokens": judge.get("max_tokens"),
+        "timeout": float(judge.get("timeout") or timeout),
     }
 
+
+@contextmanager
+def judge_request_slot(endpoint, cancel_token=None):
+    """
+    评委请求的并发控制：本地评委在端点调度器上占用槽位（让位于生成请求，
+    并受 concurrency 限制）；远端评委沿用按模型名称的锁
+    等待槽位期间被取消时抛出 TaskCancelled
+    """
+    if endpoint["local"]:
+        capacity = props_cache.get(endpoint["api_base"]).get("total_slots") or endpoint["concurrency"]
+        should_abort = cancel_token.is_cancelled if cancel_token is not None else None
+        with endpoint_slot(endpoint["api_base"], KIND_JUDGE, limit=endpoint["concurrency"], capacity=capacity,
+                           should_abort=should_abort) as acquired:
+            if not acquired:
+                raise TaskCancelled(cancel_token.reason)
+            yield
+    else:
+        with get_model_lock(endpoint["model"]):
+            yield
+
+
+def fit_judge_input(endpoint, original_prompt, reference_answer, local_response):
+    """
+    本地评委的上下文窗口通常较小：评委提示词超出 n_ctx 时保留回答的开头和结尾，截掉中间部分。
+    n_ctx 未配置时读取 /props；远端评委原样返回
+    """
+    if not endpoint["local"]:
+        return local_response
+    n_ctx = endpoint["n_ctx"] or props_cache.get(endpoint["api_base"]).get("n_ctx", 0)
+    if not n_ctx:
+        return local_response
+
+    reserve = endpoint["max_tokens"] or get_setting("EVALUATOR_STRUCTURED_MAX_TOKENS", 512)
+    # 按约 3 个字符一个 token 估算，另外为评委说明预留 1000 token
+    budget_chars = (n_ctx - reserve - 1000) * 3 - len(original_prompt) - len(reference_answer or "")
+    if len(local_response) <= budget_chars:
+        return local_response
+    if budget_chars <= 0:
+        return local_response[:1000]
+
+    head = budget_chars * 2 // 3
+    tail = budget_chars - head
+    debug(f"本地评委上下文不足 (n_ctx={n_ctx})，截断回答中间 {len(local_response) - budget_chars} 个字符")
+    return f"{local_response[:head]}\n\n...[中间内容因评委上下文窗口限制被截断]...\n\n{local_response[-tail:]}"
+
+
 def get_evaluator_model_name(evaluator_level):
     """根据评委级别获取实际的模型 ID"""
     if evaluator_level == "gem":
@@ -277,7 +482,89 @@ def get_evaluator_model_name(evaluator_level):
     else:
         return evaluator_level
 
-def call_evaluator(original_prompt, reference_answer, local_response, evaluator_level="high"):
+# 结构化评分输出的 JSON schema
+JUDGE_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 0, "maximum": 100},
+        "reasoning": {"type": "string"}
+    },
+    "required": ["score", "reasoning"],
+    "additionalProperties": False
+}
+
+def call_structured_evaluator(client, endpoint, original_prompt, reference_answer, local_response, evaluator_level,
+                              cancel_token=None):
+    """
+    使用结构化输出调用评委：远端评委使用 response_format=json_schema，
+    本地 llama.cpp 评委使用 json_schema 语法约束，并限制较短的 max_tokens。
+
+    Returns:
+        dict: 评分结果；评委不支持结构化输出 (400) 时返回 None，由调用方回退到普通模式
+    """
+    system_prompt = f"""你是一位严谨的编程专家评委（级别：{evaluator_level}）。
+
+请以 JSON 对象输出评分结果，包含 score（0-100 的整数）和 reasoning（简洁的评分理由，不超过 200 字）两个字段。
+
+{EVALUATION_CRITERIA}"""
+
+    user_content = f"""【原始编程任务】:
+{original_prompt}
+
+【参考答案】:
+{reference_answer}
+
+【本地模型回答】:
+{local_response}"""
+
+    model = endpoint["model"]
+    request_kwargs = {"max_tokens": get_setting("EVALUATOR_STRUCTURED_MAX_TOKENS", 512)}
+    if is_local_endpoint(endpoint["api_base"]):
+        request_kwargs["extra_body"] = {"json_schema": JUDGE_RESULT_SCHEMA}
+    else:
+        request_kwargs["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "judge_result", "schema": JUDGE_RESULT_SCHEMA, "strict": True}
+        }
+
+    try:
+        with judge_request_slot(endpoint, cancel_token):
+            _last_call_times[model] = time.time()
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": f"{system_prompt}\n\n{user_content}"}
+                ],
+                timeout=endpoint["timeout"],
+                **request_kwargs
+            )
+    except BadRequestError as e:
+        debug(f"Structured evaluator ({evaluator_level}) 请求被拒绝: {e}")
+        return None
+    except Exception as e:
+        return {"score": 0, "reasoning": f"评委调用失败: {str(e)}", "failed": True}
+
+    raw_content = response.choices[0].message.content or ""
+    try:
+        result = json.loads(raw_content)
+        score = max(0, min(100, int(result["score"])))
+        # 与其他解析路径保持一致：0 分记为 1 分，以区分评分失败 (0)
+        return {"score": max(1, score), "reasoning": str(result.get("reasoning", ""))}
+    except (ValueError, TypeError, KeyError):
+        fallback_result = extract_score_from_text(raw_content)
+        if fallback_result:
+            return fallback_result
+        return {"score": 0, "reasoning": f"结构化输出无法解析\nAPI返回详情: {raw_content}", "failed": True}
+
+# 任务停止时被取消的评分使用的评语
+JUDGE_CANCELLED_REASON = "评分已取消"
+
+def cancelled_judge_result():
+    """评分被取消时的结果（不写入数据库）"""
+    return {"score": 0, "reasoning": JUDGE_CANCELLED_REASON, "cancelled": True}
+
+@profiled()
+def call_evaluator(original_prompt, reference_answer, local_response, evaluator_level="high", cancel_token=None):
     """
     调用评委大模型进行评分，包含重试逻辑
     original_prompt: 原始的编程任务描述
@@ -286,25 +573,54 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
     local_response: 本地模型的回答
 
     evaluator_level: "super" | "high" | "low"
+
+    cancel_token: CancellationToken，取消时关闭评委连接、不再重试，返回 cancelled_judge_result()
+
+    Returns:
+        dict: {"score", "reasoning"}；重试后仍然失败时带 "failed": True（评分为 0）
     """
-    # 根据评委级别选择对应的模型
-    model = get_evaluator_model_name(evaluator_level)
-    
-    # 所有评委使用相同的 API 配置
-    api_key = config.EVALUATOR_API_KEY
-    api_base = config.EVALUATOR_BASE_URL
-    
+    if cancel_token is not None and cancel_token.cancelled:
+        return cancelled_judge_result()
+
+    # 根据评委级别选择对应的模型和端点（本地评委使用其专属 llama.cpp 服务，其余走 EVALUATOR_BASE_URL）
+    endpoint = get_evaluator_endpoint(evaluator_level)
+    model = endpoint["model"]
+    api_key = endpoint["api_key"]
+    api_base = endpoint["api_base"]
+    local_response = fit_judge_input(endpoint, original_prompt, reference_answer, local_response)
+
+    debug(f"Calling Evaluator ({evaluator_level}) at: {api_base}")
+    debug(f"Evaluator Model: {model}")
+
+    # 评委超时默认 120 秒 (EVALUATOR_TIMEOUT_S，本地评委可单独配置 timeout)
+    client = OpenAI(api_key=api_key, base_url=api_base, timeout=endpoint["timeout"])
+    # 取消时关闭评委连接，正在等待的请求立即失败
+    unregister = cancel_token.register(client.close) if cancel_token is not None else (lambda: None)
+    try:
+        return _call_evaluator_with_retries(client, endpoint, original_prompt, reference_answer, local_response,
+                                            evaluator_level, cancel_token)
+    finally:
+        unregister()
+
+def _call_evaluator_with_retries(client, endpoint, original_prompt, reference_answer, local_response, evaluator_level,
+                                 cancel_token):
+    """call_evaluator 的请求与重试部分"""
+    model = endpoint["model"]
     max_retries = 3
     retry_delay = 2  # 重试间隔秒数
-    
+
     # 确定该模型的基准频率限制阈值：所有模型默认 0秒（无限制）
     base_threshold = 0
 
-    print(f"\n[DEBUG] Calling Evaluator ({evaluator_level}) at: {api_base}")
-    print(f"[DEBUG] Evaluator Model: {model}")
-
-    # 评委模型设置 120 秒超时
-    client = OpenAI(api_key=api_key, base_url=api_base, timeout=120.0)
+    # 结构化输出模式：JSON schema 约束解码，输出必然可解析，不进入重试循环
+    if evaluator_level in get_list_setting("EVALUATOR_STRUCTURED_LEVELS"):
+        structured_result = call_structured_evaluator(client, endpoint, original_prompt, reference_answer,
+                                                      local_response, evaluator_level, cancel_token)
+        if cancel_token is not None and cancel_token.cancelled:
+            return cancelled_judge_result()
+        if structured_result is not None:
+            return structured_result
+        debug(f"Evaluator ({evaluator_level}) 不支持结构化输出，回退到标签解析模式")
     
     system_prompt = f"""你是一位严谨的编程专家评委（级别：{evaluator_level}）。
 
@@ -316,14 +632,7 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
 
 禁止输出任何其他内容，禁止使用 Markdown 代码块，直接输出包含上述标签的内容。
 
-【评测任务说明】
-本地模型收到了一个编程任务，需要根据任务要求生成代码解决方案。
-你的任务是评估本地模型的回答是否正确解决了原始问题。
-
-【评分标准】
-- 【严格评分要求】请执行严格评分：任何代码中的小错误、不符合最佳实践、或可能导致边缘情况失败的地方，都必须扣分。只有完美或接近完美的解决方案才能获得高分（90 分以上）。
-- 主要评估本地模型的回答是否正确解决了原始任务
-- 参考答案仅作为参考，本地模型的方案不必与参考答案完全一致"""
+{EVALUATION_CRITERIA}"""
     
     user_content = f"""【原始编程任务】:
 {original_prompt}
@@ -336,6 +645,8 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
 
     # 获取模型专属锁，确保同一模型不会被过于频繁地调用
     model_lock = get_model_lock(model)
+    # 本地评委可以限制生成长度，避免长篇推理占满槽位
+    request_kwargs = {"max_tokens": endpoint["max_tokens"]} if endpoint["max_tokens"] else {}
     
     last_error = ""
     last_raw_response = ""
@@ -347,12 +658,12 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
                 pass
 
             # --- 频率限制逻辑开始 ---
-            with model_lock:
+            with judge_request_slot(endpoint, cancel_token):
                 last_time = _last_call_times.get(model, 0)
                 elapsed = time.time() - last_time
                 if elapsed < base_threshold:
                     wait_time = base_threshold - elapsed
-                    print(f"[频率限制] 评委模型 {model} 调用过于频繁，等待 {wait_time:.1f} 秒...")
+                    debug(f"[频率限制] 评委模型 {model} 调用过于频繁，等待 {wait_time:.1f} 秒...", model=model)
                     time.sleep(wait_time)
                 
                 # 更新最后调用时间（在发起请求前更新，确保后续请求能看到这个时间点）
@@ -365,7 +676,8 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
                     ],
                     # 移除强制 JSON 格式，以支持更多模型
                     # response_format={"type": "json_object"},
-                    timeout=120.0  # 显式设置超时
+                    timeout=endpoint["timeout"],  # 显式设置超时
+                    **request_kwargs
                 )
             # --- 频率限制逻辑结束 ---
             
@@ -384,7 +696,7 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
             # 优先尝试从 XML 中提取
             xml_result = extract_score_from_xml(raw_content)
             if xml_result:
-                print(f"[DEBUG] XML extraction successful for {evaluator_level}")
+                debug(f"XML extraction successful for {evaluator_level}")
                 return xml_result
 
             # 首先判断是否已经是合法的 JSON，如果是则跳过清洗，避免误伤（如理由中包含 ```）
@@ -409,7 +721,7 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
                 # 如果 robust_json_load 也彻底失败，尝试最后的文字提取兜底
                 fallback_result = extract_score_from_text(raw_content)
                 if fallback_result:
-                    print("[DEBUG] All JSON parsing failed. Fallback to text extraction successful.")
+                    debug("All JSON parsing failed. Fallback to text extraction successful.")
                     return fallback_result
                 raise
             
@@ -426,7 +738,7 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
                 fallback_result = extract_score_from_text(raw_content)
 
                 if fallback_result:
-                    print("[DEBUG] Fallback to text extraction successful.")
+                    debug("Fallback to text extraction successful.")
                     return fallback_result
                 raise ValueError(f"API returned non-dict type: {type(result)}")
 
@@ -435,7 +747,7 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
                 fallback_result = extract_score_from_text(raw_content)
 
                 if fallback_result:
-                    print("[DEBUG] Fallback to text extraction successful.")
+                    debug("Fallback to text extraction successful.")
                     return fallback_result
                 raise ValueError(f"API returned dict missing required fields: {result}")
 
@@ -443,17 +755,17 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
             try:
                 result['score'] = int(result['score'])
             except (ValueError, TypeError):
-                print(f"[DEBUG] Score type conversion failed: {result['score']}")
+                debug(f"Score type conversion failed: {result['score']}")
                 fallback_result = extract_score_from_text(raw_content)
 
                 if fallback_result:
-                    print("[DEBUG] Fallback to text extraction successful.")
+                    debug("Fallback to text extraction successful.")
                     return fallback_result
                 raise ValueError(f"Could not convert score to integer: {result['score']}")
 
             # 验证分数范围
             if not (0 <= result['score'] <= 100):
-                print(f"[DEBUG] Score out of range: {result['score']}")
+                debug(f"Score out of range: {result['score']}")
                 result['score'] = max(0, min(100, result['score']))
 
             # 如果分数为 0，强制修改为 1
@@ -463,11 +775,13 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
             return result
 
         except Exception as e:
+            if cancel_token is not None and cancel_token.cancelled:
+                return cancelled_judge_result()
             last_error = str(e)
-            print(f"[DEBUG] Evaluator attempt {attempt} 失败: {last_error}")
+            debug(f"Evaluator attempt {attempt} 失败: {last_error}")
 
             if last_response and hasattr(last_response, 'choices'):
-                print(f"[DEBUG] Raw response content: {last_response.choices[0].message.content}")
+                debug(f"Raw response content: {last_response.choices[0].message.content}")
 
             # 如果出错，不增加额外的冷却惩罚
             with model_lock:
@@ -475,8 +789,13 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
                 _last_call_times[model] = time.time()
 
             if attempt < max_retries:
-                print(f"[错误重试] 评委模型 {model} 尝试失败，等待 10 秒后进行下次重试...")
-                time.sleep(10)
+                log_event("WARNING", f"[错误重试] 评委模型 {model} 尝试失败 ({last_error})，等待 10 秒后进行下次重试...",
+                          source="judge", model=model)
+                if cancel_token is not None:
+                    if cancel_token.wait(10):
+                        return cancelled_judge_result()
+                else:
+                    time.sleep(10)
             
             continue
             
@@ -489,30 +808,290 @@ def call_evaluator(original_prompt, reference_answer, local_response, evaluator_
 
     if last_raw_response:
         error_msg += f"\nAPI返回详情: {last_raw_response}"
-        # 将原始响应输出到控制台，方便调试
-        print(f"\n[ERROR] 原始响应内容（无法解析）:")
-        print("=" * 80)
-        print(last_raw_response)
-        print("=" * 80)
+        # 原始响应写入事件日志，方便调试（"运行日志"页面可查看）
+        log_event("ERROR", f"评委模型 {model} 的原始响应无法解析:\n{last_raw_response}", source="judge", model=model)
 
-    return {"score": 0, "reasoning": error_msg}
+    return {"score": 0, "reasoning": error_msg, "failed": True}
 
-def call_all_evaluators(original_prompt, reference_answer, local_response):
+@profiled()
+def parse_batch_results(raw_content, count):
+    """
+    解析批量评分的输出：<result id="N">...</result>，返回长度为 count 的列表，
+    无法解析的位置为 None
+    """
+    results = [None] * count
+    for match in re.finditer(r'<result\s+id\s*=\s*["\']?(\d+)["\']?\s*>(.*?)</result>', raw_content or "",
+                             re.DOTALL | re.IGNORECASE):
+        index = int(match.group(1)) - 1
+        if 0 <= index < count and results[index] is None:
+            results[index] = extract_score_from_xml(match.group(2))
+    return results
+
+# 结构化批量评分输出的 JSON schema（id 为候选回答编号，从 1 开始）
+JUDGE_BATCH_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer", "minimum": 1},
+                    "score": {"type": "integer", "minimum": 0, "maximum": 100},
+                    "reasoning": {"type": "string"}
+                },
+                "required": ["id", "score", "reasoning"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+def call_structured_evaluator_batch(client, endpoint, original_prompt, reference_answer, candidates, count,
+                                    evaluator_level, cancel_token=None):
+    """
+    批量评分的结构化输出版本（约束方式与 call_structured_evaluator 相同）
+
+    Returns:
+        list: 与候选回答一一对应的评分结果，缺失或无法解析的位置为 None；
+              评委不支持结构化输出 (400) 时返回 None，由调用方回退到标签解析模式
+    """
+    system_prompt = f"""你是一位严谨的编程专家评委（级别：{evaluator_level}）。
+
+下面共有 {count} 个候选回答，请以 JSON 对象输出评分结果：results 数组中为每个候选回答各包含一项，
+每项包含 id（候选编号）、score（0-100 的整数）和 reasoning（简洁的评分理由，不超过 200 字）。
+各候选回答相互独立，请按同一标准分别评分，不要相互比较。
+
+{EVALUATION_CRITERIA}"""
+
+    user_content = f"""【原始编程任务】:
+{original_prompt}
+
+【参考答案】:
+{reference_answer}
+
+{candidates}"""
+
+    model = endpoint["model"]
+    request_kwargs = {"max_tokens": get_setting("EVALUATOR_STRUCTURED_MAX_TOKENS", 512) * count}
+    if is_local_endpoint(endpoint["api_base"]):
+        request_kwargs["extra_body"] = {"json_schema": JUDGE_BATCH_RESULT_SCHEMA}
+    else:
+        request_kwargs["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "judge_batch_result", "schema": JUDGE_BATCH_RESULT_SCHEMA, "strict": True}
+        }
+
+    results = [None] * count
+    try:
+        with judge_request_slot(endpoint, cancel_token):
+            _last_call_times[model] = time.time()
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": f"{system_prompt}\n\n{user_content}"}
+                ],
+                timeout=endpoint["timeout"],
+                **request_kwargs
+            )
+        items = json.loads(response.choices[0].message.content or "")["results"]
+    except BadRequestError as e:
+        debug(f"Structured batch evaluator ({evaluator_level}) 请求被拒绝: {e}")
+        return None
+    except Exception as e:
+        debug(f"Structured batch evaluator ({evaluator_level}) 失败: {e}")
+        return results
+
+    for item in items if isinstance(items, list) else []:
+        try:
+            index = int(item["id"]) - 1
+            score = max(0, min(100, int(item["score"])))
+        except (ValueError, TypeError, KeyError):
+            continue
+        if 0 <= index < count and results[index] is None:
+            # 与其他解析路径保持一致：0 分记为 1 分，以区分评分失败 (0)
+            results[index] = {"score": max(1, score), "reasoning": str(item.get("reasoning", ""))}
+    return results
+
+@profiled()
+def call_evaluator_batch(original_prompt, reference_answer, local_responses, evaluator_level="high", cancel_token=None):
+    """
+    批量评分：一次请求中发送同一任务、参考答案和 N 个候选回答，解析 N 个评分。
+    批量结果中缺失或无法解析的候选回答会回退到逐条评分 (call_evaluator)。
+    结构化输出模式 (EVALUATOR_STRUCTURED_LEVELS) 与取消 (cancel_token) 的处理与 call_evaluator 相同。
+
+    Returns:
+        list: 与 local_responses 一一对应的 {"score", "reasoning"} 列表
+    """
+    count = len(local_responses)
+    if count == 0:
+        return []
+    if cancel_token is not None and cancel_token.cancelled:
+        return [cancelled_judge_result() for _ in local_responses]
+    if count == 1:
+        return [call_evaluator(original_prompt, reference_answer, local_responses[0], evaluator_level, cancel_token)]
+
+    endpoint = get_evaluator_endpoint(evaluator_level)
+    api_base = endpoint["api_base"]
+
+    debug(f"Calling Evaluator batch ({evaluator_level}, {count} responses) at: {api_base}")
+
+    client = OpenAI(api_key=endpoint["api_key"], base_url=api_base, timeout=endpoint["timeout"])
+    # 取消时关闭评委连接，正在等待的请求立即失败
+    unregister = cancel_token.register(client.close) if cancel_token is not None else (lambda: None)
+    try:
+        results = _call_evaluator_batch_request(client, endpoint, original_prompt, reference_answer, local_responses,
+                                                evaluator_level, cancel_token)
+    finally:
+        unregister()
+
+    if cancel_token is not None and cancel_token.cancelled:
+        return [res if res is not None else cancelled_judge_result() for res in results]
+    missing = [i for i, res in enumerate(results) if res is None]
+    if missing:
+        debug(f"Batch evaluator ({evaluator_level}) 有 {len(missing)}/{count} 个结果无法解析，回退到逐条评分")
+    for i in missing:
+        results[i] = call_evaluator(original_prompt, reference_answer, local_responses[i], evaluator_level,
+                                    cancel_token)
+    return results
+
+def _call_evaluator_batch_request(client, endpoint, original_prompt, reference_answer, local_responses,
+                                  evaluator_level, cancel_token):
+    """call_evaluator_batch 的批量请求部分，返回的列表中无法解析的位置为 None"""
+    model = endpoint["model"]
+    count = len(local_responses)
+    candidates = "\n\n".join(f"【候选回答 {i + 1}】:\n{response}" for i, response in enumerate(local_responses))
+    # 本地评委上下文窗口放不下全部候选回答时直接逐条评分
+    if fit_judge_input(endpoint, original_prompt, reference_answer, candidates) is not candidates:
+        debug(f"Batch evaluator ({evaluator_level}) 超出本地评委上下文窗口，改为逐条评分")
+        return [None] * count
+
+    # 结构化输出模式：评委不支持时回退到标签解析模式
+    if evaluator_level in get_list_setting("EVALUATOR_STRUCTURED_LEVELS"):
+        structured_results = call_structured_evaluator_batch(client, endpoint, original_prompt, reference_answer,
+                                                             candidates, count, evaluator_level, cancel_token)
+        if structured_results is not None:
+            return structured_results
+        debug(f"Batch evaluator ({evaluator_level}) 不支持结构化输出，回退到标签解析模式")
+
+    system_prompt = f"""你是一位严谨的编程专家评委（级别：{evaluator_level}）。
+
+【重要】下面共有 {count} 个候选回答，你必须对每个候选回答分别评分，并将结果封装在带编号的 XML 标签中，格式如下：
+<result id="候选编号">
+    <score>数字(0-100)</score>
+    <reasoning>评分理由</reasoning>
+</result>
+
+必须为每个候选回答各输出一个 <result> 标签，禁止输出任何其他内容，禁止使用 Markdown 代码块。
+各候选回答相互独立，请按同一标准分别评分，不要相互比较。
+
+{EVALUATION_CRITERIA}"""
+
+    user_content = f"""【原始编程任务】:
+{original_prompt}
+
+【参考答案】:
+{reference_answer}
+
+{candidates}"""
+
+    try:
+        with judge_request_slot(endpoint, cancel_token):
+            _last_call_times[model] = time.time()
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": f"{system_prompt}\n\n{user_content}"}
+                ],
+                timeout=endpoint["timeout"]
+            )
+        return parse_batch_results(response.choices[0].message.content, count)
+    except Exception as e:
+        debug(f"Batch evaluator ({evaluator_level}) 失败: {e}，回退到逐条评分")
+        return [None] * count
+
+def call_all_evaluators(original_prompt, reference_answer, local_response, cancel_token=None):
     """
     并行调用所有评分级别
     由于 call_evaluator 内部有按模型名称的全局频率限制，这里可以直接简单并行
     """
     results = {}
-    # top2 已禁用，不参与评分
-    levels = ["gem", "opus", "gpt", "top"]
+    # top2 已禁用，除非登记了本地评委接管该级别
+    levels = get_active_judge_levels()
     
     with ThreadPoolExecutor(max_workers=len(levels)) as executor:
-        futures = {level: executor.submit(call_evaluator, original_prompt, reference_answer, local_response, level) 
+        futures = {level: executor.submit(bind_job(call_evaluator), original_prompt, reference_answer, local_response,
+                                          level, cancel_token)
                    for level in levels}
         for level, future in futures.items():
             try:
                 results[level] = future.result()
             except Exception as e:
-                results[level] = {"score": 0, "reasoning": f"评委调用失败: {str(e)}"}
+                results[level] = {"score": 0, "reasoning": f"评委调用失败: {str(e)}", "failed": True}
     
-    return results
\ No newline at end of file
+    return results
+
+# 早停模式下未被调用的评委使用的评语（评分记为 0，不计入平均分）
+JUDGE_SKIPPED_REASON = "未调用（评委早停）"
+
+
+def call_adaptive_evaluators(original_prompt, reference_answer, local_response, cancel_token=None):
+    """
+    自适应评委面板：先并行调用最便宜/最快的几位评委，
+    只有在评分分歧过大、接近及格线或有评委失败时才逐个追加更贵的评委
+
+    Returns:
+        dict: 与 call_all_evaluators 相同的结构；未调用的评委结果带 "skipped": True
+    """
+    order = get_list_setting("EVALUATOR_PANEL_ORDER", ["gem", "gpt", "opus", "top"])
+    # 顺序中未列出的启用评委（例如由本地评委接管的 top2）追加到末尾，避免被面板静默忽略
+    unlisted = [level for level in get_active_judge_levels() if level not in order]
+    if unlisted:
+        debug(f"EVALUATOR_PANEL_ORDER 未包含评委 {', '.join(unlisted)}，追加到早停面板末尾")
+        order = order + unlisted
+    initial = max(1, min(get_setting("EVALUATOR_PANEL_INITIAL", 2), len(order)))
+    spread_threshold = get_setting("EVALUATOR_AGREEMENT_THRESHOLD", 10.0)
+    boundary = get_setting("PASS_SCORE_THRESHOLD", 60.0)
+    margin = get_setting("EVALUATOR_BOUNDARY_MARGIN", 5.0)
+
+    def run_judges(levels):
+        with ThreadPoolExecutor(max_workers=len(levels)) as executor:
+            futures = {level: executor.submit(bind_job(call_evaluator), original_prompt, reference_answer,
+                                              local_response, level, cancel_token)
+                       for level in levels}
+            for level, future in futures.items():
+                try:
+                    results[level] = future.result()
+                except Exception as e:
+                    results[level] = {"score": 0, "reasoning": f"评委调用失败: {str(e)}", "failed": True}
+
+    def needs_escalation():
+        scores = [res.get("score", 0) for res in results.values()]
+        valid = [score for score in scores if score > 0]
+        if len(valid) < len(scores) or not valid:
+            return True  # 有评委失败，需要补充
+        if max(valid) - min(valid) > spread_threshold:
+            return True  # 评委之间分歧过大
+        mean = sum(valid) / len(valid)
+        return abs(mean - boundary) <= margin  # 接近及格线，需要更多意见
+
+    results = {}
+    run_judges(order[:initial])
+    for level in order[initial:]:
+        if (cancel_token is not None and cancel_token.cancelled) or not needs_escalation():
+            break
+        run_judges([level])
+
+    for level in order:
+        if level not in results:
+            results[level] = {"score": 0, "reasoning": JUDGE_SKIPPED_REASON, "skipped": True}
+    return results
+
+
+def evaluate_response(original_prompt, reference_answer, local_response, cancel_token=None):
+    """按 EVALUATOR_PANEL_MODE 选择评分方式：full（全部评委并行）或 adaptive（早停面板）"""
+    if get_setting("EVALUATOR_PANEL_MODE", "full") == "adaptive":
+        return call_adaptive_evaluators(original_prompt, reference_answer, local_response, cancel_token)
+    return call_all_evaluators(original_prompt, reference_answer, local_response, cancel_token)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+确定性的 OpenAI 兼容模拟服务（仅使用标准库）
+
+用于离线测量评测程序自身的开销（call_llm、call_evaluator、数据库写入、统计查询），不依赖真实端点：
+- /v1/chat/completions：流式请求按配置的首字延迟和生成速度以 SSE 输出（遵守 max_tokens，最后一个 chunk 带 usage）；
+  非流式请求视为评委请求，按 --judge-format 返回 XML / JSON / 纯文本 / 无法解析的评分
+- /props、/slots、/metrics、/tokenize、/health、/v1/models：模拟 llama.cpp 服务端接口
+- 按 --error-rate 随机返回 500 或 429（带 Retry-After），随机数由 --seed 固定
+
+输出内容和评分由请求内容的哈希决定，同一请求多次运行结果一致。
+
+用法:
+    python mock_server.py --port 18080 --tps 200 --ttft-ms 50
+    python mock_server.py --port 18080 --tps 0 --ttft-ms 0 --error-rate 0.05 --judge-format json
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 评委输出格式
+JUDGE_FORMATS = ("xml", "json", "text", "garbage")
+
+
+def _digest(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class MockLLMServer:
+    """
+    模拟服务：可以在当前进程中启动（benchmark 使用），也可以通过命令行单独运行
+
+    Args:
+        tps: 每个流的生成速度 (tokens/s)，0 表示不限速
+        ttft_ms: 首字延迟（毫秒，不含按 prompt_tps 计算的预读时间）
+        prompt_tps: 预读速度 (tokens/s)，0 表示不计预读时间
+        max_tokens: 请求未指定 max_tokens 时的生成长度
+        error_rate: 返回错误的概率（一半为 500，一半为 429）
+        judge_format: 评委输出格式，见 JUDGE_FORMATS
+        model_path: /props 中的模型文件
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, tps=0.0, ttft_ms=0.0, prompt_tps=0.0, max_tokens=128,
+                 error_rate=0.0, judge_format="xml", seed=0, n_ctx=32768, total_slots=4,
+                 model_path="/models/mock-model-Q4_K_M.gguf"):
+        self.tps = tps
+        self.ttft_ms = ttft_ms
+        self.prompt_tps = prompt_tps
+        self.max_tokens = max_tokens
+        self.error_rate = error_rate
+        self.judge_format = judge_format
+        self.n_ctx = n_ctx
+        self.total_slots = total_slots
+        self.model_path = model_path
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._active = 0
+        self.stats = {"requests": 0, "streams": 0, "judge_requests": 0, "errors": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """在后台线程中启动服务，返回 OpenAI 兼容地址"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def _count(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                self.stats[key] += value
+
+    def _should_fail(self):
+        if self.error_rate <= 0:
+            return None
+        with self._lock:
+            if self._rng.random() >= self.error_rate:
+                return None
+            return 429 if self._rng.random() < 0.5 else 500
+
+    @staticmethod
+    def count_tokens(text):
+        """粗略的分词：约 4 个字符一个 token"""
+        return max(1, len(text) // 4)
+
+    @staticmethod
+    def _timings(prompt_n, prompt_s, predicted_n, predicted_s):
+        """llama.cpp 格式的 timings（模拟服务端没有前缀缓存，prompt_n 即全部提示词 token）"""
+        prompt_ms = max(prompt_s, 1e-6) * 1000
+        predicted_ms = max(predicted_s, 1e-6) * 1000
+        return {"prompt_n": prompt_n, "prompt_ms": prompt_ms, "prompt_per_second": prompt_n / prompt_ms * 1000,
+                "predicted_n": predicted_n, "predicted_ms": predicted_ms,
+                "predicted_per_second": predicted_n / predicted_ms * 1000}
+
+    def judge_output(self, prompt, structured=False):
+        """评委输出：分数由请求内容决定"""
+        score = 40 + _digest(prompt) % 61
+        reasoning = f"模拟评委：回答与参考答案的一致程度对应 {score} 分。"
+        if structured or self.judge_format == "json":
+            return json.dumps({"score": score, "reasoning": reasoning}, ensure_ascii=False)
+        if self.judge_format == "text":
+            return f"{reasoning}\n评分: {score}"
+        if self.judge_format == "garbage":
+            return "无法给出评价。"
+        return f"<result>\n    <score>{score}</score>\n    <reasoning>{reasoning}</reasoning>\n</result>"
+
+    def _metrics_text(self):
+        with self._lock:
+            stats = dict(self.stats)
+            active = self._active
+        return (
+            "# HELP llamacpp:prompt_tokens_total Number of prompt tokens processed.\n"
+            f"llamacpp:prompt_tokens_total {stats['prompt_tokens']}\n"
+            f"llamacpp:tokens_predicted_total {stats['completion_tokens']}\n"
+            f"llamacpp:requests_processing {min(active, self.total_slots)}\n"
+            f"llamacpp:requests_deferred {max(0, active - self.total_slots)}\n"
+            f"llamacpp:kv_cache_usage_ratio {min(1.0, active / max(1, self.total_slots)):.3f}\n"
+        )
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, obj, status=200, headers=None):
+                body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, data):
+                payload = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/props":
+                    return self._send_json({
+                        "n_ctx": server.n_ctx, "total_slots": server.total_slots, "model_path": server.model_path,
+                        "build_info": "b0000-mock",
+                        "default_generation_settings": {"n_ctx": server.n_ctx, "params": {"temperature": 0.8, "top_k": 40}},
+                    })
+                if path == "/slots":
+                    with server._lock:
+                        active = server._active
+                    return self._send_json([{"id": i, "n_ctx": server.n_ctx // server.total_slots,
+                                             "is_processing": i < active} for i in range(server.total_slots)])
+                if path == "/metrics":
+                    body = server._metrics_text().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    return self.wfile.write(body)
+                if path == "/health":
+                    return self._send_json({"status": "ok"})
+                if path == "/v1/models":
+                    return self._send_json({"object": "list", "data": [{"id": server.model_path.rsplit("/", 1)[-1],
+                                                                        "object": "model"}]})
+                self._send_json({"error": {"message": "not found"}}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._send_json({"error": {"message": "invalid json"}}, status=400)
+
+                path = self.path.split("?", 1)[0]
+                if path == "/tokenize":
+                    return self._send_json({"tokens": [0] * server.count_tokens(body.get("content", ""))})
+                if path != "/v1/chat/completions":
+                    return self._send_json({"error": {"message": "not found"}}, status=404)
+
+                server._count(requests=1)
+                status = server._should_fail()
+                if status is not None:
+                    server._count(errors=1)
+                    headers = {"Retry-After": "1"} if status == 429 else None
+                    return self._send_json({"error": {"message": f"mock error {status}", "code": status}},
+                                           status=status, headers=headers)
+
+                prompt = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+                with server._lock:
+                    server._active += 1
+                try:
+                    if body.get("stream"):
+                        self._stream(body, prompt)
+                    else:
+                        self._judge(body, prompt)
+                finally:
+                    with server._lock:
+                        server._active -= 1
+
+            def _judge(self, body, prompt):
+                structured = bool(body.get("response_format") or body.get("json_schema"))
+                content = server.judge_output(prompt, structured=structured)
+                prompt_tokens = server.count_tokens(prompt)
+                completion_tokens = server.count_tokens(content)
+                server._count(judge_requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+                self._send_json({
+                    "id": f"mock-{_digest(prompt):08x}", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                })
+
+            def _stream(self, body, prompt):
+                model = body.get("model", "mock")
+                n_tokens = int(body.get("max_tokens") or server.max_tokens)
+                prompt_tokens = server.count_tokens(prompt)
+                seed = _digest(prompt)
+                server._count(streams=1)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                delay_s = server.ttft_ms / 1000
+                if server.prompt_tps > 0:
+                    delay_s += prompt_tokens / server.prompt_tps
+                start = time.time()
+                if delay_s > 0:
+                    time.sleep(delay_s)
+
+                chunk_id = f"mock-{seed:08x}"
+                try:
+                    for i in range(n_tokens):
+                        # 按生成速度控制节奏（按累计时间对齐，避免 sleep 误差累积）
+                        if server.tps > 0:
+                            wait = delay_s + i / server.tps - (time.time() - start)
+                            if wait > 0:
+                                time.sleep(wait)
+                        delta = f"v{(seed + i) % 997} "
+                        finish = "length" if i == n_tokens - 1 else None
+                        self._send_chunk(json.dumps({
+                            "id": chunk_id, "object": "chat.completion.chunk", "created": int(start), "model": model,
+                            "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": finish}],
+                        }))
+                    self._send_chunk(json.dumps({
+                        "id": chunk_id, "object": "chat.completion.chunk", "created": int(start), "model": model,
+                        "choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                                                 "total_tokens": prompt_tokens + n_tokens},
+                        "timings": server._timings(prompt_tokens, delay_s, n_tokens, time.time() - start - delay_s),
+                    }))
+                    self._send_chunk("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端取消或超过墙钟上限时关闭了连接
+                    self.close_connection = True
+                    return
+                server._count(prompt_tokens=prompt_tokens, completion_tokens=n_tokens)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="确定性的 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--tps", type=float, default=100.0, help="每个流的生成速度 (tokens/s)，0 表示不限速")
+    parser.add_argument("--ttft-ms", type=float, default=50.0, help="首字延迟（毫秒）")
+    parser.add_argument("--prompt-tps", type=float, default=0.0, help="预读速度 (tokens/s)，0 表示不计预读时间")
+    parser.add_argument("--max-tokens", type=int, default=128, help="请求未指定 max_tokens 时的生成长度")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500/429 的概率")
+    parser.add_argument("--judge-format", choices=JUDGE_FORMATS, default="xml", help="评委输出格式")
+    parser.add_argument("--slots", type=int, default=4, help="/props 中的槽位数")
+    parser.add_argument("--n-ctx", type=int, default=32768, help="/props 中的上下文窗口")
+    parser.add_argument("--seed", type=int, default=0, help="错误注入的随机种子")
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, tps=args.tps, ttft_ms=args.ttft_ms, prompt_tps=args.prompt_tps,
+                           max_tokens=args.max_tokens, error_rate=args.error_rate, judge_format=args.judge_format,
+                           seed=args.seed, n_ctx=args.n_ctx, total_slots=args.slots)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+运行日志页面 - 查看结构化事件日志（当前会话的内存缓冲区或历史 JSONL 文件）
+"""
+import time
+
+import pandas as pd
+import streamlit as st
+
+import profiling
+from database import get_job_telemetry, get_records_telemetry_summary, get_profiled_jobs, get_profile_summary
+from event_log import event_log, filter_events, LOG_LEVELS
+
+
+def render_log_viewer(task_mgr=None):
+    """渲染运行日志页面"""
+    st.header("📜 运行日志")
+
+    col1, col2, col3, col4 = st.columns([1, 1, 1, 2])
+    with col1:
+        scope = st.radio("数据来源", ["当前会话", "历史日志"], horizontal=True)
+    with col2:
+        min_level = st.selectbox("最低级别", LOG_LEVELS, index=1)
+    with col3:
+        current_job_only = st.checkbox("仅当前任务", value=False, disabled=task_mgr is None)
+    with col4:
+        keyword = st.text_input("关键字（消息 / 用例 / 模型）", "")
+
+    events = event_log.recent() if scope == "当前会话" else event_log.read_history()
+    job_id = task_mgr.job.job_id if current_job_only and task_mgr is not None else None
+    events = filter_events(events, min_level=min_level, job_id=job_id, text=keyword)
+
+    if not events:
+        st.info("没有符合条件的日志")
+        return
+
+    df = pd.DataFrame(events[::-1])
+    df['时间'] = df['ts'].apply(lambda ts: time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)))
+    column_names = {
+        'level': '级别', 'source': '来源', 'job_id': '任务', 'case': '用例', 'model': '模型',
+        'record_id': '记录 ID', 'duration_ms': '耗时 (ms)', 'message': '消息'
+    }
+    columns = ['时间'] + [column for column in column_names if column in df.columns]
+    st.caption(f"共 {len(df)} 条")
+    st.dataframe(df[columns].rename(columns=column_names), use_container_width=True, hide_index=True)
+
+    if task_mgr is not None and task_mgr.run_id:
+        render_job_telemetry(task_mgr.run_id)
+    render_profile_breakdown(task_mgr.run_id if task_mgr is not None else None)
+
+
+def render_job_telemetry(job_id):
+    """显示测试任务期间的服务端遥测，以及每条记录生成期间的峰值"""
+    telemetry = get_job_telemetry(job_id)
+    if telemetry.empty:
+        return
+
+    with st.expander(f"📡 服务端遥测 (任务 {job_id})", expanded=False):
+        telemetry['时间'] = pd.to_datetime(telemetry['ts'], unit='s')
+        for server, group in telemetry.groupby('server'):
+            st.markdown(f"**{server}**")
+            series = group.set_index('时间')[['kv_cache_usage', 'max_slot_fill', 'busy_slots', 'requests_deferred']]
+            st.line_chart(series.dropna(axis=1, how='all'))
+
+        summary = get_records_telemetry_summary(job_id)
+        if not summary.empty:
+            st.markdown("**各记录生成期间的服务端峰值（按耗时降序）**")
+            st.dataframe(summary.rename(columns={
+                'record_id': '记录 ID', 'case_title': '用例', 'model_name': '模型', 'total_time_ms': '耗时 (ms)',
+                'tokens_per_second': '生成速度', 'prompt_tps': '预读速度', 'finish_reason': '结束原因',
+                'max_kv_cache_usage': '最大 KV 占用', 'max_requests_deferred': '最多排队请求',
+                'max_busy_slots': '最多忙碌槽位', 'max_slot_fill': '最大上下文填充率', 'samples': '采样数'
+            }), use_container_width=True, hide_index=True)
+
+
+def render_profile_breakdown(current_job_id=None):
+    """显示开启 PROFILING 后各任务的计时区间汇总（进行中的任务使用内存中的实时数据）"""
+    saved = get_profiled_jobs()
+    live = profiling.get_live_jobs()
+    jobs = list(dict.fromkeys(live + saved['job_id'].tolist()))
+    if not jobs:
+        return
+
+    with st.expander("⏱️ 性能剖析", expanded=False):
+        index = jobs.index(current_job_id) if current_job_id in jobs else 0
+        job_id = st.selectbox("任务", jobs, index=index,
+                              format_func=lambda job: "页面渲染" if job == profiling.UI_JOB_ID else job)
+        df = pd.DataFrame(profiling.get_summary(job_id)) if job_id in live else get_profile_summary(job_id)
+        if df.empty:
+            st.info("该任务没有计时数据")
+            return
+        # 自身耗时占比：各区间互不重叠的部分，之和约等于被剖析代码的总耗时（多线程时可能超过墙钟时间）
+        df['self_share'] = df['self_ms'] / df['self_ms'].sum() * 100
+        st.bar_chart(df.set_index('span')['self_ms'])
+        st.dataframe(df.rename(columns={
+            'span': '区间', 'count': '次数', 'total_ms': '总耗时 (ms)', 'self_ms': '自身耗时 (ms)',
+            'mean_ms': '平均 (ms)', 'max_ms': '最大 (ms)', 'self_share': '自身耗时占比'
+        }), use_container_width=True, hide_index=True,
+            column_config={'自身耗时占比': st.column_config.ProgressColumn(format="%.0f%%", min_value=0, max_value=100)})
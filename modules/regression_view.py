@@ -0,0 +1,101 @@
+"""
+环境回归对比页面 - 按模型系列比较不同服务端构建、量化版本和采样配置下的速度与评分
+"""
+import json
+
+import pandas as pd
+import streamlit as st
+
+from config_utils import get_setting
+from database import get_run_environments, get_environment_records, get_environment_regressions
+from stats_engine import compare_environments
+
+STATUS_LABELS = {
+    "regression": "🔻 回归",
+    "improvement": "🔺 改进",
+    "unchanged": "无显著变化",
+    "insufficient": "样本不足",
+}
+
+COMPARISON_COLUMNS = {
+    'label': '指标', 'baseline_mean': '基准均值', 'candidate_mean': '对比均值', 'change': '相对变化',
+    'n_baseline': '基准记录', 'n_candidate': '对比记录', 'paired_cases': '配对用例', 'p_value': 'p 值',
+    'status': '结论'
+}
+
+
+def _format_comparison(df):
+    view = df[list(COMPARISON_COLUMNS)].copy()
+    view['change'] = view['change'].map(lambda v: f"{v:+.1%}" if pd.notna(v) else "-")
+    view['status'] = view['status'].map(STATUS_LABELS)
+    return view.rename(columns=COMPARISON_COLUMNS)
+
+
+def _env_label(envs, fingerprint):
+    row = envs.set_index('fingerprint').loc[fingerprint]
+    return f"{fingerprint[:8]} - {row['model_file']} | {row['server_build'] or '未知构建'} | {row['harness_version']}"
+
+
+def render_regression_tracker():
+    """渲染环境回归对比页面"""
+    st.header("🧬 环境回归对比")
+    st.caption("每次测试任务记录运行环境指纹（服务端构建、模型文件/量化、采样参数、评测程序版本），"
+               "同一模型系列的环境之间做置换检验，标记显著的速度或评分变化。")
+
+    envs = get_run_environments()
+    if envs.empty:
+        st.info("暂无运行环境记录（记录环境指纹之前的评测记录不参与对比）")
+        return
+
+    families = sorted(envs['model_family'].fillna("").unique().tolist())
+    family = st.selectbox("模型系列", families)
+    envs = envs[envs['model_family'].fillna("") == family]
+
+    st.subheader("运行环境")
+    st.dataframe(envs[['fingerprint', 'model_file', 'quant', 'server_build', 'harness_version', 'record_count',
+                       'avg_tps', 'avg_prompt_tps', 'avg_score', 'first_seen']].rename(columns={
+        'fingerprint': '指纹', 'model_file': '模型文件', 'quant': '量化', 'server_build': '服务端构建',
+        'harness_version': '评测程序版本', 'record_count': '记录数', 'avg_tps': '平均生成速度',
+        'avg_prompt_tps': '平均预读速度', 'avg_score': '平均评分', 'first_seen': '首次使用'
+    }), use_container_width=True, hide_index=True)
+
+    alpha = get_setting("REGRESSION_ALPHA", 0.05)
+    min_change = get_setting("REGRESSION_MIN_CHANGE", 0.05)
+    st.subheader("相邻环境对比")
+    st.caption(f"按首次使用时间依次比较，p < {alpha:g} 且相对变化超过 {min_change:.0%} 时标记为回归或改进")
+    regressions = get_environment_regressions(family)
+    if regressions.empty:
+        st.info("该模型系列只有一个有记录的运行环境")
+    else:
+        flagged = regressions[regressions['status'] == "regression"]
+        for _, row in flagged.iterrows():
+            st.error(f"{row['label']}回归：{_env_label(envs, row['baseline'])} → {_env_label(envs, row['candidate'])}，"
+                     f"{row['baseline_mean']:.1f} → {row['candidate_mean']:.1f} ({row['change']:+.1%}, p={row['p_value']:.3f})")
+        for (baseline, candidate), group in regressions.groupby(['baseline', 'candidate'], sort=False):
+            with st.expander(f"{baseline[:8]} → {candidate[:8]}", expanded=bool((group['status'] == "regression").any())):
+                st.dataframe(_format_comparison(group), use_container_width=True, hide_index=True)
+
+    fingerprints = envs['fingerprint'].tolist()
+    if len(fingerprints) < 2:
+        return
+
+    st.subheader("任意两个环境对比")
+    col1, col2 = st.columns(2)
+    with col1:
+        baseline = st.selectbox("基准环境", fingerprints, format_func=lambda fp: _env_label(envs, fp))
+    with col2:
+        candidate = st.selectbox("对比环境", fingerprints, index=len(fingerprints) - 1,
+                                 format_func=lambda fp: _env_label(envs, fp))
+    if baseline == candidate:
+        st.info("请选择两个不同的运行环境")
+        return
+
+    result = compare_environments(get_environment_records(baseline), get_environment_records(candidate),
+                                  alpha=alpha, min_change=min_change)
+    st.dataframe(_format_comparison(result), use_container_width=True, hide_index=True)
+
+    with st.expander("采样参数"):
+        indexed = envs.set_index('fingerprint')
+        col1, col2 = st.columns(2)
+        col1.json(json.loads(indexed.loc[baseline, 'sampling'] or "{}"))
+        col2.json(json.loads(indexed.loc[candidate, 'sampling'] or "{}"))
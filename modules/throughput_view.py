@@ -0,0 +1,91 @@
+"""
+吞吐测试页面 - 扫描端点在不同并发数和提示词长度下的吞吐，并查看历史测试曲线
+"""
+import pandas as pd
+import streamlit as st
+
+import config
+from database import get_throughput_runs, get_throughput_profile
+
+
+def _parse_int_list(text):
+    return [int(v) for v in text.replace("，", ",").split(",") if v.strip().isdigit()]
+
+
+def render_throughput_profiler(task_mgr):
+    """渲染吞吐测试页面"""
+    st.header("📈 端点吞吐测试")
+    st.caption("使用合成提示词压测端点，比较不同 -np / batch 参数和量化版本的聚合吞吐、单流速度和首字延迟。")
+
+    with st.form("throughput_profile_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            api_base = st.text_input("API 地址", config.LOCAL_MODEL_URL)
+            model_id = st.text_input("模型 ID", config.LOCAL_MODEL_ID)
+            api_key = st.text_input("API Key", config.LOCAL_MODEL_KEY, type="password")
+        with col2:
+            concurrency_text = st.text_input("并发数（逗号分隔，留空按槽位数自动生成）", "")
+            lengths_text = st.text_input("提示词长度 tokens（逗号分隔，留空从 1024 翻倍到 n_ctx）", "")
+            max_tokens = st.number_input("每个请求的生成长度", min_value=16, max_value=8192, value=256, step=16)
+        submitted = st.form_submit_button("开始测试", disabled=task_mgr.profile_running or task_mgr.is_running)
+
+    if submitted:
+        started = task_mgr.start_throughput_profile(api_base, api_key, model_id,
+                                                    _parse_int_list(concurrency_text) or None,
+                                                    _parse_int_list(lengths_text) or None, int(max_tokens))
+        if started:
+            st.success("吞吐测试已开始")
+        else:
+            st.warning("已有吞吐测试或测试任务在运行")
+
+    progress = task_mgr.profile_progress
+    if task_mgr.profile_running:
+        total = progress.get("total") or 0
+        st.progress(progress.get("completed", 0) / total if total else 0.0,
+                    text=f"测试点 {progress.get('completed', 0)}/{total or '?'}")
+        if st.button("停止吞吐测试"):
+            task_mgr.stop_throughput_profile()
+        if st.button("刷新"):
+            st.rerun()
+
+    runs = get_throughput_runs()
+    if runs.empty:
+        st.info("暂无吞吐测试记录")
+        return
+
+    st.subheader("历史测试")
+    st.dataframe(runs.rename(columns={
+        'run_id': '测试 ID', 'model_name': '模型', 'api_base': '端点', 'model_path': '模型文件',
+        'n_ctx': 'n_ctx', 'total_slots': '槽位数', 'points': '测试点', 'best_aggregate_tps': '最高聚合吞吐',
+        'created_at': '时间'
+    }), use_container_width=True, hide_index=True)
+
+    run_id = st.selectbox("查看测试", runs['run_id'].tolist(),
+                          format_func=lambda rid: f"{rid} - {runs.set_index('run_id').loc[rid, 'model_name']}")
+    df = get_throughput_profile(run_id)
+    if df.empty:
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**聚合吞吐 (tokens/s) - 按并发数**")
+        st.line_chart(df.pivot_table(index='concurrency', columns='prompt_tokens_target', values='aggregate_tps'))
+        st.markdown("**单流生成速度 (tokens/s) - 按并发数**")
+        st.line_chart(df.pivot_table(index='concurrency', columns='prompt_tokens_target', values='per_stream_tps'))
+    with col2:
+        st.markdown("**TTFT p50 (ms) - 按提示词长度**")
+        st.line_chart(df.pivot_table(index='prompt_tokens_target', columns='concurrency', values='ttft_ms_p50'))
+        st.markdown("**预读速度 (tokens/s) - 按提示词长度**")
+        st.line_chart(df.pivot_table(index='prompt_tokens_target', columns='concurrency', values='prompt_tps'))
+
+    best = df.loc[df['aggregate_tps'].idxmax()]
+    st.info(f"最高聚合吞吐：并发 {int(best['concurrency'])}、提示词 {int(best['prompt_tokens_target'])} tokens 时 "
+            f"{best['aggregate_tps']:.1f} tokens/s (单流 {best['per_stream_tps']:.1f} tokens/s)")
+
+    columns = {
+        'concurrency': '并发数', 'prompt_tokens_target': '提示词长度', 'prompt_tokens': '实际提示词',
+        'aggregate_tps': '聚合吞吐', 'per_stream_tps': '单流速度', 'ttft_ms_p50': 'TTFT p50 (ms)',
+        'ttft_ms_p95': 'TTFT p95 (ms)', 'prompt_tps': '预读速度', 'wall_time_ms': '耗时 (ms)', 'errors': '失败',
+        'error': '错误信息'
+    }
+    st.dataframe(pd.DataFrame(df[list(columns)]).rename(columns=columns), use_container_width=True, hide_index=True)
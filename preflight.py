@@ -0,0 +1,117 @@
+"""
+上下文窗口预检
+
+在发送请求前，用服务端 /props 中的 n_ctx 和分词器统计每个用例的提示词长度，
+判断 "提示词 + 预留的生成空间" 是否放得进上下文窗口。超长用例按策略处理：
+- skip:     直接跳过，不再浪费服务端的预读时间
+- truncate: 按与任务的相关度从低到高丢弃上下文文件，直到放得下
+- off:      不做预检（保持旧行为）
+远端模型无法获取 n_ctx，一律视为可以发送。
+"""
+import json
+import re
+
+from config_utils import get_setting
+from generation_budget import resolve_generation_budget
+from prompt_builder import build_prompt, get_case_prompt, get_case_prompt_tokens
+from server_props import props_cache, count_tokens
+
+PREFLIGHT_POLICIES = ("skip", "truncate", "off")
+
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]{2,}')
+
+
+def _file_relevance(filename, content, task_words):
+    """
+    估算文件与任务的相关度：任务中直接提到文件名的最相关，
+    其次按任务中的标识符在文件中出现的比例
+    """
+    basename = filename.replace("\\", "/").rsplit("/", 1)[-1]
+    stem = basename.rsplit(".", 1)[0]
+    if basename.lower() in task_words or stem.lower() in task_words:
+        return 1.0 + len(task_words)
+    if not task_words:
+        return 0.0
+    file_words = {w.lower() for w in _IDENTIFIER_PATTERN.findall(content)}
+    return len(task_words & file_words) / len(task_words)
+
+
+def _truncate_context(case, api_base, token_limit):
+    """
+    丢弃相关度最低的文件直到提示词放得下
+
+    Returns:
+        (full_prompt, prompt_tokens, dropped_files)，无法截断时 full_prompt 为 None
+    """
+    try:
+        files = json.loads(case['source_code'])
+    except (TypeError, ValueError):
+        return None, 0, []
+    if not isinstance(files, dict) or len(files) < 2:
+        return None, 0, []
+
+    task_words = {w.lower() for w in _IDENTIFIER_PATTERN.findall(case['prompt'])}
+    # 相关度低的排在前面；相关度相同时先丢大文件
+    candidates = sorted(
+        files,
+        key=lambda name: (_file_relevance(name, str(files[name]), task_words), -len(str(files[name])))
+    )
+
+    kept = dict(files)
+    dropped = []
+    for filename in candidates[:-1]:  # 至少保留一个文件
+        del kept[filename]
+        dropped.append(filename)
+        full_prompt = build_prompt(json.dumps(kept), case['prompt'])
+        prompt_tokens = count_tokens(api_base, full_prompt)
+        if prompt_tokens <= token_limit:
+            return full_prompt, prompt_tokens, dropped
+    return None, 0, dropped
+
+
+def preflight_case(case, api_base, policy=None, model_name=None):
+    """
+    预检单个用例
+
+    为生成内容预留的 token 数：模型/用例配置了 max_tokens 时使用该值，
+    否则使用 COMPLETION_RESERVE_TOKENS，且不超过上下文窗口的 1/4（小上下文模型不会被全部预留掉）
+
+    Returns:
+        dict: {
+            "status": "fits" | "unknown" | "truncated" | "too_long",
+            "prompt_tokens": 提示词 token 数,
+            "n_ctx": 上下文窗口大小,
+            "full_prompt": 实际发送的提示词（截断后或原始提示词，跳过时为 None）,
+            "dropped_files": 被丢弃的文件列表
+        }
+    """
+    policy = policy or get_setting("PREFLIGHT_POLICY", "skip")
+    if policy not in PREFLIGHT_POLICIES:
+        policy = "skip"
+    full_prompt = get_case_prompt(case)['prompt']
+    result = {"status": "unknown", "prompt_tokens": 0, "n_ctx": 0,
+              "full_prompt": full_prompt, "dropped_files": []}
+
+    n_ctx = props_cache.get(api_base).get("n_ctx", 0) if api_base else 0
+    if policy == "off" or not n_ctx:
+        return result
+
+    max_tokens = resolve_generation_budget(model_name, case)['max_tokens'] if model_name else None
+    reserve = max_tokens or min(get_setting("COMPLETION_RESERVE_TOKENS", 4096), n_ctx // 4)
+    token_limit = max(n_ctx - reserve, 0)
+    prompt_tokens = get_case_prompt_tokens(case, api_base)
+    result.update({"n_ctx": n_ctx, "prompt_tokens": prompt_tokens})
+
+    if prompt_tokens <= token_limit:
+        result["status"] = "fits"
+        return result
+
+    if policy == "truncate":
+        truncated_prompt, truncated_tokens, dropped = _truncate_context(case, api_base, token_limit)
+        if truncated_prompt is not None:
+            result.update({"status": "truncated", "full_prompt": truncated_prompt,
+                           "prompt_tokens": truncated_tokens, "dropped_files": dropped})
+            return result
+
+    result.update({"status": "too_long", "full_prompt": None})
+    return result
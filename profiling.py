@@ -0,0 +1,267 @@
+"""
+可选的性能剖析
+
+批量任务变慢时，用来区分时间花在网络请求、提示词组装、正则解析、SQLite 提交还是页面重新渲染上。
+开启 PROFILING 后：
+- 用 profiled() 装饰的函数（call_llm、call_evaluator、评分解析、save_eval_record、update_eval_scores、
+  各页面的 render_* 等）每次调用记录一个计时区间，按 (任务, 区间名) 汇总次数、总耗时、自身耗时（扣除嵌套的
+  子区间）和最大耗时；任务结束时保存到 profile_spans 表，可在"运行日志"页面查看
+- PROFILING_SAMPLE_MS > 0 时，任务期间后台线程按该间隔采样所有线程的调用栈，任务结束后写出折叠栈文件
+  (PROFILING_DIR/<任务 ID>.folded，与 py-spy --format raw 相同)，可直接交给 flamegraph.pl 或 speedscope
+
+区间按当前线程（上下文）所属的任务归类：任务线程用 begin_job/end_job 设置归属，交给线程池或评分线程执行的
+函数用 bind_job() 带上提交时的任务；不属于任何任务的调用（页面渲染、手动重新评分等）归到 UI_JOB_ID，
+页面渲染每隔 PROFILING_FLUSH_S 秒保存一次。
+
+未开启时装饰器只多一次配置读取。
+"""
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from config_utils import get_setting
+from event_log import debug
+
+# 不属于任何任务的区间（例如页面渲染）归到这里
+UI_JOB_ID = "ui"
+
+_lock = threading.Lock()
+_stats = {}
+_job_started = {}
+_job_tokens = {}
+_local = threading.local()
+_samplers = {}
+_current_job = contextvars.ContextVar("profiling_job", default=UI_JOB_ID)
+_last_ui_flush = 0.0
+
+
+def is_enabled():
+    return get_setting("PROFILING", False)
+
+
+def begin_job(job_id):
+    """任务开始：当前线程之后的区间归到 job_id，开启了栈采样时启动采样线程（需在同一线程调用 end_job）"""
+    _job_tokens[job_id] = _current_job.set(job_id)
+    if not is_enabled():
+        return
+    with _lock:
+        _job_started[job_id] = time.time()
+    interval_ms = get_setting("PROFILING_SAMPLE_MS", 0)
+    if interval_ms > 0:
+        sampler = StackSampler(interval_ms / 1000)
+        sampler.start()
+        _samplers[job_id] = sampler
+
+
+def end_job(job_id):
+    """任务结束：恢复当前线程原来的归属，保存区间汇总，停止栈采样并写出折叠栈文件"""
+    token = _job_tokens.pop(job_id, None)
+    if token is not None:
+        _current_job.reset(token)
+    sampler = _samplers.pop(job_id, None)
+    if sampler is not None:
+        sampler.stop()
+        path = sampler.write(os.path.join(get_setting("PROFILING_DIR", "profiles"), f"{job_id}.folded"))
+        if path:
+            debug(f"调用栈采样已保存: {path} ({sampler.sample_count} 次采样)")
+    flush(job_id)
+
+
+@contextmanager
+def job_scope(job_id):
+    """在这段代码中把区间归到 job_id"""
+    token = _current_job.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+def bind_job(func, job_id=None):
+    """
+    包装交给其他线程执行的函数，使其中的区间归到 job_id（默认为提交时的任务）；
+    线程池和评分线程不会继承提交方的任务归属
+    """
+    job_id = job_id or current_job()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with job_scope(job_id):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def flush(job_id):
+    """把一个任务当前的区间汇总写入数据库（覆盖之前保存的汇总）"""
+    rows = get_summary(job_id)
+    if not rows:
+        return
+    from database import save_profile_summary
+    try:
+        save_profile_summary(job_id, rows)
+    except Exception as e:
+        debug(f"保存性能剖析结果失败: {e}")
+
+
+def current_job():
+    """当前线程（上下文）的区间归属的任务，不属于任何任务时为 UI_JOB_ID"""
+    return _current_job.get()
+
+
+def maybe_flush_ui():
+    """每隔 PROFILING_FLUSH_S 秒保存一次页面渲染的区间汇总（由页面渲染后调用）"""
+    global _last_ui_flush
+    if not is_enabled():
+        return
+    now = time.time()
+    if now - _last_ui_flush < get_setting("PROFILING_FLUSH_S", 60.0):
+        return
+    _last_ui_flush = now
+    flush(UI_JOB_ID)
+
+
+def _record(job_id, name, elapsed, self_elapsed):
+    key = (job_id, name)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            _stats[key] = [1, elapsed, self_elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += self_elapsed
+            entry[3] = max(entry[3], elapsed)
+
+
+class span:
+    """
+    计时区间（上下文管理器）；嵌套的区间从父区间的自身耗时中扣除
+    job_id 为空时使用 current_job()
+    """
+
+    def __init__(self, name, job_id=None):
+        self.name = name
+        self.job_id = job_id
+        self._active = False
+
+    def __enter__(self):
+        self._active = is_enabled()
+        if self._active:
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+            stack.append(0.0)
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._active:
+            return False
+        elapsed = time.perf_counter() - self._start
+        stack = _local.stack
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        _record(self.job_id or current_job(), self.name, elapsed, max(0.0, elapsed - children))
+        return False
+
+
+def profiled(name=None):
+    """装饰器：每次调用记录一个计时区间（默认使用函数名）"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_summary(job_id):
+    """
+    一个任务的区间汇总（内存中的实时数据），按总耗时降序
+
+    Returns:
+        list[dict]: span、count、total_ms、self_ms、mean_ms、max_ms
+    """
+    with _lock:
+        items = [(name, list(entry)) for (job, name), entry in _stats.items() if job == job_id]
+    rows = [{
+        "span": name,
+        "count": count,
+        "total_ms": total * 1000,
+        "self_ms": self_total * 1000,
+        "mean_ms": total / count * 1000,
+        "max_ms": max_elapsed * 1000,
+    } for name, (count, total, self_total, max_elapsed) in items]
+    return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def get_live_jobs():
+    """内存中有区间数据的任务 ID"""
+    with _lock:
+        return sorted({job for job, _ in _stats}, key=lambda job: -_job_started.get(job, 0))
+
+
+def reset(job_id=None):
+    """清空内存中的区间数据（job_id 为空时清空全部）"""
+    with _lock:
+        for key in [key for key in _stats if job_id is None or key[0] == job_id]:
+            del _stats[key]
+
+
+class StackSampler:
+    """按固定间隔采样所有线程的调用栈，汇总为折叠栈 (folded stacks)"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            names.update({thread.ident: thread.name for thread in threading.enumerate()})
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+            self.sample_count += 1
+
+    def write(self, path):
+        """写出折叠栈文件，没有采样时返回 None"""
+        if not self.stacks:
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
@@ -0,0 +1,170 @@
+"""
+提示词组装与基于共享前缀的用例排序
+
+提示词结构固定为 "Context（多文件上下文）+ Task（任务描述）"，上下文在前，
+文件按文件名排序拼接，保证相同的多文件上下文总能得到逐字节相同的前缀，
+从而让 llama.cpp 能复用 KV cache 中已处理过的提示词。
+
+按用例缓存组装好的提示词（键为用例 ID + 内容哈希）以及各分词器下的 token 数，
+同一用例被多个模型运行时不再重复解析 JSON 和拼接上下文。
+"""
+import hashlib
+import json
+import threading
+
+from server_props import count_tokens, get_tokenizer_key
+from profiling import profiled
+
+# 提示词模板版本：修改 build_prompt 的输出格式时递增，使旧的运行指纹失效
+PROMPT_TEMPLATE_VERSION = "2"
+
+_case_prompt_cache = {}
+_case_prompt_lock = threading.Lock()
+
+
+def build_context(source_code_json):
+    """
+    将 test_cases.source_code 转换为上下文字符串
+    source_code_json: 可能是单文件字符串，也可能是多文件 JSON
+
+    Returns:
+        str: 上下文字符串，空上下文返回空字符串
+    """
+    try:
+        source_dict = json.loads(source_code_json)
+    except (TypeError, ValueError):
+        if not source_code_json or not source_code_json.strip():
+            return ""
+        return source_code_json
+
+    if isinstance(source_dict, dict):
+        # 按文件名排序，保证相同文件集合生成相同的前缀
+        parts = [f"--- FILE: {filename} ---\n{source_dict[filename]}\n\n"
+                 for filename in sorted(source_dict)]
+        return "".join(parts)
+    return str(source_code_json)
+
+
+@profiled()
+def build_prompt(source_code_json, prompt):
+    """组装发送给模型的完整提示词"""
+    context = build_context(source_code_json)
+    if not context:
+        return f"Task:\n{prompt}\n\nNote: No existing code provided. Please implement this feature from scratch."
+    return f"Context:\n{context}\n\nTask:\n{prompt}"
+
+
+def context_key(source_code_json):
+    """计算上下文的哈希，作为共享前缀的分组键"""
+    return hashlib.sha1(build_context(source_code_json).encode("utf-8")).hexdigest()
+
+
+def order_cases_by_prefix(cases):
+    """
+    按共享上下文对用例分组排序：相同上下文的用例相邻执行，
+    组的先后顺序与组内顺序都保持原始顺序（稳定排序）。
+
+    Returns:
+        list: [(case, group_index), ...]
+    """
+    group_index = {}
+    keyed = []
+    for position, case in enumerate(cases):
+        key = context_key(case['source_code'])
+        if key not in group_index:
+            group_index[key] = len(group_index)
+        keyed.append((group_index[key], position, case))
+
+    keyed.sort(key=lambda item: (item[0], item[1]))
+    return [(case, group) for group, _, case in keyed]
+
+
+def content_hash(source_code_json, prompt):
+    """计算用例内容（上下文 + 任务）的哈希"""
+    digest = hashlib.sha256()
+    digest.update((source_code_json or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((prompt or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+@profiled()
+def get_case_prompt(case):
+    """
+    获取用例的完整提示词（带缓存）
+
+    Returns:
+        dict: {"prompt": 完整提示词, "content_hash": 内容哈希, "token_counts": {分词器标识: token 数}}
+    """
+    case_id = case.get('id')
+    digest = content_hash(case['source_code'], case['prompt'])
+
+    with _case_prompt_lock:
+        entry = _case_prompt_cache.get(case_id)
+        if entry is not None and entry["content_hash"] == digest:
+            return entry
+
+    entry = {
+        "prompt": build_prompt(case['source_code'], case['prompt']),
+        "content_hash": digest,
+        "token_counts": {},
+    }
+    # 没有 ID 的临时用例不进入缓存
+    if case_id is not None:
+        with _case_prompt_lock:
+            _case_prompt_cache[case_id] = entry
+    return entry
+
+
+def effective_case_hash(case, full_prompt=None):
+    """
+    实际发送内容的哈希：使用用例的完整提示词时就是用例内容哈希；
+    预检截断了上下文时混入截断后提示词的哈希，截断的运行不会被当作完整用例的运行
+    """
+    entry = get_case_prompt(case)
+    if full_prompt is None or full_prompt is entry["prompt"] or full_prompt == entry["prompt"]:
+        return entry["content_hash"]
+    digest = hashlib.sha256(entry["content_hash"].encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(full_prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_case_prompt_tokens(case, api_base):
+    """获取用例提示词在指定端点分词器下的 token 数（按分词器缓存）"""
+    entry = get_case_prompt(case)
+    tokenizer_key = get_tokenizer_key(api_base)
+    with _case_prompt_lock:
+        count = entry["token_counts"].get(tokenizer_key)
+    if count is not None:
+        return count
+    # 分词请求不持锁（可能访问服务端），并发计算同一用例时保留先写入的结果
+    count = count_tokens(api_base, entry["prompt"])
+    with _case_prompt_lock:
+        return entry["token_counts"].setdefault(tokenizer_key, count)
+
+
+def invalidate_case_prompt(case_id=None):
+    """用例被修改或删除时清除其提示词缓存（case_id 为 None 时清空全部）"""
+    with _case_prompt_lock:
+        if case_id is None:
+            _case_prompt_cache.clear()
+        else:
+            _case_prompt_cache.pop(case_id, None)
+
+
+def compute_run_fingerprint(case_hash, model_id, temperature, sampling_params=None):
+    """
+    计算运行指纹：用例内容哈希 + 模型 ID + 温度 + 采样参数 + 提示词模板版本
+    指纹相同的两次运行在确定性采样下输出一致，可以跳过重复生成
+    temperature 为 None 时请求不带温度、由服务端默认值决定，记为单独的 "server-default"
+    （不等同于 0），服务端默认采样设置应放在 sampling_params 中
+    """
+    payload = json.dumps({
+        "case_hash": case_hash,
+        "model_id": model_id,
+        "temperature": float(temperature) if temperature is not None else "server-default",
+        "sampling": sampling_params or {},
+        "template": PROMPT_TEMPLATE_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,130 @@
+"""
+运行环境指纹
+
+评测记录原来只保存 model_name，升级 llama.cpp 或更换量化版本后无法区分速度/评分的变化来自哪一边。
+每次测试任务开始时收集运行环境：
+- 服务端构建信息（/props 中的 build_info）
+- 模型文件及从 .gguf 文件名解析出的量化类型和模型系列
+- 采样参数（请求指定的温度、生成预算，以及服务端默认采样设置）
+- 评测程序版本（git 提交 + 提示词模板版本）
+计算出环境指纹，保存到 run_environments 表，并写入本次任务的每条评测记录 (env_fingerprint)。
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+from config_utils import get_setting
+from prompt_builder import PROMPT_TEMPLATE_VERSION
+from server_props import props_cache
+
+# 量化类型（按从具体到宽泛的顺序匹配，例如 IQ4_XS、Q4_K_M、Q8_0、BF16、MXFP4）
+_QUANT_PATTERN = re.compile(
+    r'(?<![A-Za-z0-9])('
+    r'I?Q[1-8]_K(?:_[XSML]+)?|IQ[1-4]_(?:XXS|XS|S|M|NL)|Q[1-8]_[01]|TQ[12]_0|MXFP4|BF16|F16|F32|FP16|FP8'
+    r')(?![A-Za-z0-9])',
+    re.IGNORECASE
+)
+# 分片模型文件的后缀，例如 -00001-of-00003
+_SHARD_PATTERN = re.compile(r'-\d{5}-of-\d{5}$')
+# 服务端默认采样设置中参与指纹的字段
+SERVER_SAMPLING_KEYS = (
+    "temperature", "top_k", "top_p", "min_p", "typical_p", "repeat_penalty", "repeat_last_n",
+    "presence_penalty", "frequency_penalty", "dry_multiplier", "xtc_probability", "samplers",
+)
+
+_harness_version = None
+
+
+def get_harness_version():
+    """评测程序版本：git 短提交号（有未提交修改时带 -dirty）+ 提示词模板版本"""
+    global _harness_version
+    if _harness_version is None:
+        try:
+            commit = subprocess.run(
+                ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, timeout=5,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            commit = ""
+        _harness_version = f"{commit or 'unknown'}+tpl{PROMPT_TEMPLATE_VERSION}"
+    return _harness_version
+
+
+def parse_quantization(model_file):
+    """从模型文件名中解析量化类型（大写），无法识别时返回空字符串"""
+    name = os.path.basename(model_file or "")
+    matches = _QUANT_PATTERN.findall(name)
+    return matches[-1].upper() if matches else ""
+
+
+def parse_model_family(model_file):
+    """
+    从模型文件名推断模型系列：去掉目录、.gguf 扩展名、分片后缀和量化类型，转为小写
+    例如 /models/Qwen2.5-Coder-32B-Instruct-Q4_K_M.gguf -> qwen2.5-coder-32b-instruct
+    """
+    name = os.path.basename(model_file or "")
+    if name.lower().endswith(".gguf"):
+        name = name[:-5]
+    name = _SHARD_PATTERN.sub("", name)
+    name = _QUANT_PATTERN.sub("", name)
+    name = re.sub(r'[-_.]{2,}', '-', name).strip("-_. ")
+    return name.lower()
+
+
+def _server_sampling(props):
+    """服务端默认采样设置（新版本 llama.cpp 放在 default_generation_settings.params 中）"""
+    settings = props.get("default_generation_settings") or {}
+    params = settings.get("params") or settings
+    return {key: params[key] for key in SERVER_SAMPLING_KEYS if key in params}
+
+
+def get_server_sampling(api_base):
+    """端点的服务端默认采样设置（读取缓存的 /props，远端或未知时为空）"""
+    return _server_sampling(props_cache.get(api_base).get("props") or {})
+
+
+def collect_environment(api_base, model_id, temperature=None):
+    """
+    收集一次测试任务的运行环境（本地端点读取缓存的 /props）
+
+    Returns:
+        dict: fingerprint、model_name、model_family、model_file、quant、server_build、sampling (JSON)、
+              harness_version、api_base
+    """
+    meta = props_cache.get(api_base)
+    model_file = os.path.basename(meta.get("model_path") or "") or model_id or ""
+    sampling = {
+        "temperature": temperature,
+        "max_tokens": get_setting("GENERATION_MAX_TOKENS", 0) or None,
+        "server": get_server_sampling(api_base),
+    }
+    env = {
+        "model_name": model_id or "",
+        "model_family": parse_model_family(model_file),
+        "model_file": model_file,
+        "quant": parse_quantization(model_file),
+        "server_build": meta.get("build_info") or "",
+        "sampling": json.dumps(sampling, sort_keys=True),
+        "harness_version": get_harness_version(),
+        "api_base": api_base or "",
+    }
+    env["fingerprint"] = compute_environment_fingerprint(env)
+    return env
+
+
+def compute_environment_fingerprint(env):
+    """环境指纹：模型文件 + 服务端构建 + 采样参数 + 评测程序版本（不含端点地址，换机器部署同一环境指纹不变）"""
+    payload = json.dumps({key: env.get(key) for key in ("model_file", "server_build", "sampling", "harness_version")},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def describe_environment(env):
+    """环境的简短描述，用于日志和下拉框"""
+    parts = [env.get("model_file") or env.get("model_name") or "?"]
+    if env.get("server_build"):
+        parts.append(f"build {env['server_build']}")
+    parts.append(f"harness {env.get('harness_version') or '?'}")
+    return " | ".join(parts)
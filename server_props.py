@@ -0,0 +1,221 @@
+"""
+llama.cpp 服务端元数据缓存
+
+按端点缓存 /props 返回的信息（n_ctx、模型路径、槽位数、构建信息），
+任务开始时预取一次，之后由后台线程定期刷新。call_llm 只读缓存，
+不再在每次调用后同步请求 /props。
+"""
+import ipaddress
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config_utils import get_setting
+
+# 获取失败的端点在这段时间内不再同步重试，避免每个用例都卡 1 秒
+NEGATIVE_CACHE_SECONDS = 60
+
+_http_session = requests.Session()
+_http_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+_http_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+
+
+def get_http_session():
+    """获取共享的 requests.Session（复用 TCP 连接）"""
+    return _http_session
+
+
+def get_server_root(api_base):
+    """
+    将 OpenAI 兼容地址转换为服务根地址，例如 http://host:8080/v1 -> http://host:8080
+    """
+    if not api_base:
+        return ""
+    parsed = urlparse(api_base.strip())
+    path = parsed.path.rstrip("/")
+    if path.endswith("/v1"):
+        path = path[:-3]
+    return f"{parsed.scheme}://{parsed.netloc}{path}"
+
+
+def is_local_endpoint(api_base):
+    """
+    判断 API 地址是否指向本机或局域网（回环、私有网段、链路本地、0.0.0.0、localhost）
+
+    Args:
+        api_base: API 基础地址
+
+    Returns:
+        bool: True 表示本地/局域网地址
+    """
+    if not api_base:
+        return False
+
+    # 没有协议头时 urlparse 无法识别主机名
+    url = api_base.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+
+    host = (urlparse(url).hostname or "").lower()
+    if not host:
+        return False
+    if host == "localhost" or host.endswith(".localhost") or host.endswith(".local"):
+        return True
+
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return ip.is_loopback or ip.is_private or ip.is_link_local or ip.is_unspecified
+
+
+def _normalize_props(props):
+    """从 /props 原始响应中提取常用字段（兼容新旧版本 llama.cpp 的字段位置）"""
+    gen_settings = props.get("default_generation_settings") or {}
+    return {
+        "n_ctx": props.get("n_ctx") or gen_settings.get("n_ctx") or 0,
+        "model_path": props.get("model_path") or gen_settings.get("model") or "",
+        "total_slots": props.get("total_slots") or 0,
+        "build_info": props.get("build_info") or "",
+        "props": props,
+    }
+
+
+class ServerPropsCache:
+    """按端点缓存 llama.cpp /props 信息，支持后台定期刷新"""
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self._entries = {}
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+
+    def _fetch(self, server_root):
+        """同步请求 /props，失败时返回空元数据"""
+        entry = {"ok": False, "fetched_at": time.time()}
+        try:
+            resp = _http_session.get(f"{server_root}/props", timeout=self.timeout)
+            if resp.status_code == 200:
+                entry.update(_normalize_props(resp.json()))
+                entry["ok"] = True
+        except (requests.RequestException, ValueError):
+            pass
+        with self._lock:
+            self._entries[server_root] = entry
+        return entry
+
+    def get(self, api_base):
+        """
+        获取端点元数据。非本地地址直接返回空字典；
+        已缓存时直接返回（由后台线程负责刷新），否则同步获取一次。
+        """
+        if not is_local_endpoint(api_base):
+            return {}
+
+        server_root = get_server_root(api_base)
+        with self._lock:
+            entry = self._entries.get(server_root)
+
+        if entry is not None:
+            if entry["ok"] or time.time() - entry["fetched_at"] < NEGATIVE_CACHE_SECONDS:
+                return entry if entry["ok"] else {}
+
+        entry = self._fetch(server_root)
+        return entry if entry["ok"] else {}
+
+    def prefetch(self, api_base):
+        """强制刷新一次端点元数据（任务开始时调用）"""
+        if not is_local_endpoint(api_base):
+            return {}
+        entry = self._fetch(get_server_root(api_base))
+        return entry if entry["ok"] else {}
+
+    def track(self, api_base):
+        """登记端点参与后台刷新（可重复登记，按引用计数）"""
+        if not is_local_endpoint(api_base):
+            return
+        server_root = get_server_root(api_base)
+        with self._lock:
+            self._tracked[server_root] = self._tracked.get(server_root, 0) + 1
+        self._ensure_refresher()
+
+    def untrack(self, api_base):
+        """取消端点的后台刷新登记"""
+        server_root = get_server_root(api_base)
+        with self._lock:
+            count = self._tracked.get(server_root, 0) - 1
+            if count > 0:
+                self._tracked[server_root] = count
+            else:
+                self._tracked.pop(server_root, None)
+
+    def invalidate(self, api_base=None):
+        """清除指定端点（或全部）的缓存"""
+        with self._lock:
+            if api_base is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(get_server_root(api_base), None)
+
+    def _ensure_refresher(self):
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        interval = get_setting("LLAMA_PROPS_REFRESH_INTERVAL", 30.0)
+        while not self._stop_event.wait(interval):
+            with self._lock:
+                roots = list(self._tracked.keys())
+            if not roots:
+                # 没有需要刷新的端点时退出线程，下次 track 时再启动
+                with self._lock:
+                    if not self._tracked:
+                        self._refresh_thread = None
+                        return
+                continue
+            for server_root in roots:
+                self._fetch(server_root)
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self._stop_event.set()
+
+
+# 全局共享实例
+props_cache = ServerPropsCache()
+
+
+def get_tokenizer_key(api_base):
+    """
+    返回端点使用的分词器标识：本地 llama.cpp 为 "服务地址|模型路径"，
+    其他端点无法精确分词，统一使用字符数估算 ("estimate")
+    """
+    meta = props_cache.get(api_base)
+    if not meta:
+        return "estimate"
+    return f"{get_server_root(api_base)}|{meta.get('model_path', '')}"
+
+
+def count_tokens(api_base, text):
+    """
+    统计文本的 token 数：本地 llama.cpp 使用 /tokenize 精确计数，
+    否则按约 3 个字符一个 token 估算（与 call_llm 缺少 usage 时的估算一致）
+    """
+    if get_tokenizer_key(api_base) != "estimate":
+        try:
+            resp = _http_session.post(f"{get_server_root(api_base)}/tokenize",
+                                      json={"content": text}, timeout=10)
+            if resp.status_code == 200:
+                return len(resp.json().get("tokens", []))
+        except (requests.RequestException, ValueError):
+            pass
+    return len(text) // 3
@@ -0,0 +1,157 @@
+"""
+llama.cpp 服务端遥测采样
+
+测试任务运行期间，后台线程按固定间隔抓取每个本地端点的 Prometheus /metrics
+（预读/生成 token 累计数、KV cache 占用、正在处理和被推迟的请求数）和 /slots（忙碌槽位、
+槽位上下文填充率），保存到 telemetry_samples 表并带上任务 ID。评测记录保存了任务 ID 和请求开始时间，
+可以取出某条记录生成期间的采样，判断慢记录是否与 KV cache 压力、请求排队或上下文滑动有关。
+
+/metrics 需要以 --metrics 启动 llama-server，端点不支持时只采集 /slots（反之亦然）。
+"""
+import json
+import re
+import threading
+import time
+
+import requests
+
+from config_utils import get_setting
+from event_log import debug
+from server_props import get_http_session, get_server_root, is_local_endpoint
+
+# 保存到独立字段的指标（去掉 "llamacpp:" 前缀后的名称）
+METRIC_COLUMNS = {
+    "kv_cache_usage_ratio": "kv_cache_usage",
+    "kv_cache_tokens": "kv_cache_tokens",
+    "requests_processing": "requests_processing",
+    "requests_deferred": "requests_deferred",
+    "prompt_tokens_total": "prompt_tokens_total",
+    "tokens_predicted_total": "tokens_predicted_total",
+    "prompt_tokens_seconds": "prompt_tps",
+    "predicted_tokens_seconds": "predicted_tps",
+}
+
+_METRIC_LINE = re.compile(r'^([A-Za-z_:][A-Za-z0-9_:]*)(?:\{[^}]*\})?\s+([-+0-9.eE]+|NaN|[+-]Inf)\s*$')
+
+
+def parse_prometheus_metrics(text):
+    """
+    解析 Prometheus 文本格式，返回 {指标名: 数值}（去掉 llamacpp: 前缀，忽略注释和无法解析的行）
+    """
+    metrics = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = _METRIC_LINE.match(line)
+        if not match:
+            continue
+        name = match.group(1).split(":", 1)[-1]
+        try:
+            metrics[name] = float(match.group(2))
+        except ValueError:
+            continue
+    return metrics
+
+
+def summarize_slots(slots):
+    """
+    汇总 /slots 返回的槽位列表（兼容不同版本 llama.cpp 的字段）
+
+    Returns:
+        dict: {"total_slots", "busy_slots", "max_slot_fill"}，max_slot_fill 为忙碌槽位中 已用上下文 / n_ctx 的最大值，
+              接近 1 说明正在发生上下文滑动 (context shift)
+    """
+    busy = 0
+    max_fill = 0.0
+    for slot in slots if isinstance(slots, list) else []:
+        processing = slot.get("is_processing")
+        if processing is None:
+            processing = slot.get("state", 0) != 0
+        if not processing:
+            continue
+        busy += 1
+        n_ctx = slot.get("n_ctx") or 0
+        used = slot.get("n_past")
+        if used is None:
+            used = (slot.get("n_prompt_tokens") or 0) + ((slot.get("next_token") or {}).get("n_decoded") or 0)
+        if n_ctx:
+            max_fill = max(max_fill, used / n_ctx)
+    return {"total_slots": len(slots) if isinstance(slots, list) else 0, "busy_slots": busy,
+            "max_slot_fill": round(max_fill, 4)}
+
+
+class TelemetrySampler:
+    """一个测试任务的遥测采样线程（按端点去重，端点不支持的接口不再请求）"""
+
+    def __init__(self, job_id, api_bases, interval=None):
+        self.job_id = job_id
+        self.interval = interval if interval is not None else get_setting("TELEMETRY_INTERVAL_S", 2.0)
+        self.servers = sorted({get_server_root(base) for base in api_bases if is_local_endpoint(base)})
+        self._unsupported = set()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.sample_count = 0
+
+    def start(self):
+        """开始采样；没有本地端点或间隔为 0 时不启动"""
+        if not self.servers or self.interval <= 0:
+            return False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """停止采样并等待线程退出（最后再采一次，覆盖任务结束时的状态）"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=self.interval + 5)
+        self._thread = None
+
+    def _get(self, server_root, path):
+        if (server_root, path) in self._unsupported:
+            return None
+        try:
+            resp = get_http_session().get(f"{server_root}{path}", timeout=2)
+        except requests.RequestException:
+            return None
+        if resp.status_code in (404, 501):
+            # 服务端未开启该接口 (--metrics / --slots)
+            self._unsupported.add((server_root, path))
+            debug(f"{server_root}{path} 不可用 ({resp.status_code})，本次任务不再采集")
+            return None
+        return resp if resp.status_code == 200 else None
+
+    def sample(self, server_root):
+        """采集一个端点的一次遥测，返回样本字典（两个接口都不可用时返回 None）"""
+        metrics_resp = self._get(server_root, "/metrics")
+        slots_resp = self._get(server_root, "/slots")
+        if metrics_resp is None and slots_resp is None:
+            return None
+
+        sample = {"job_id": self.job_id, "server": server_root, "ts": time.time()}
+        metrics = parse_prometheus_metrics(metrics_resp.text) if metrics_resp is not None else {}
+        for name, column in METRIC_COLUMNS.items():
+            sample[column] = metrics.get(name)
+        if slots_resp is not None:
+            try:
+                sample.update(summarize_slots(slots_resp.json()))
+            except ValueError:
+                pass
+        sample["metrics"] = json.dumps(metrics) if metrics else None
+        return sample
+
+    def _loop(self):
+        from database import save_telemetry_samples
+        while True:
+            stopping = self._stop_event.wait(self.interval)
+            samples = [s for s in (self.sample(server) for server in self.servers) if s is not None]
+            if samples:
+                try:
+                    save_telemetry_samples(samples)
+                    self.sample_count += len(samples)
+                except Exception as e:
+                    debug(f"保存遥测采样失败: {e}")
+            if stopping:
+                return
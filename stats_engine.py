@@ -0,0 +1,393 @@
+"""
+统计计算模块（NumPy 向量化）
+
+对重复采样的评测记录按 (用例, 模型) 分组，一次性计算均值、标准差、
+bootstrap 置信区间和 pass@k，避免逐组循环。
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+def _nanmean(values, axis):
+    """nanmean，全为 NaN 的行/列返回 NaN 且不产生警告"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmean(values, axis=axis)
+
+
+def _nanstd(values, axis):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanstd(values, axis=axis)
+
+
+def _pad_groups(values, group_codes, n_groups):
+    """把按组排列的一维数组填充为 (组数 × 最大样本数) 的矩阵，空位为 NaN"""
+    order = np.argsort(group_codes, kind="stable")
+    sorted_codes = group_codes[order]
+    counts = np.bincount(sorted_codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = np.arange(len(sorted_codes)) - starts[sorted_codes]
+
+    matrix = np.full((n_groups, max(counts.max(), 1)), np.nan)
+    matrix[sorted_codes, positions] = values[order]
+    return matrix, counts
+
+
+def bootstrap_mean_ci(matrix, counts, n_boot=1000, confidence=0.95, seed=0):
+    """
+    对每一行（每组）的有效样本做 bootstrap，返回均值的置信区间 (下界, 上界)
+    matrix: (组数 × 最大样本数)，有效样本位于每行的前 counts[i] 个位置
+    """
+    rng = np.random.default_rng(seed)
+    n_groups = matrix.shape[0]
+    lower = np.full(n_groups, np.nan)
+    upper = np.full(n_groups, np.nan)
+    if n_groups == 0:
+        return lower, upper
+
+    max_n = matrix.shape[1]
+    alpha = (1 - confidence) / 2
+    # 分块计算，控制 (组数 × n_boot × 最大样本数) 的内存占用
+    chunk = max(1, int(2_000_000 // max(n_boot * max_n, 1)))
+    for start in range(0, n_groups, chunk):
+        sub = matrix[start:start + chunk]
+        sub_counts = counts[start:start + chunk]
+        draws = rng.random((sub.shape[0], n_boot, max_n))
+        idx = np.floor(draws * sub_counts[:, None, None]).astype(int)
+        samples = np.take_along_axis(sub[:, None, :].repeat(n_boot, axis=1), idx, axis=2)
+        # 每行只取前 counts[i] 个抽样位置
+        mask = np.arange(max_n)[None, None, :] < sub_counts[:, None, None]
+        means = np.where(mask, samples, 0).sum(axis=2) / np.maximum(sub_counts[:, None], 1)
+        lower[start:start + chunk] = np.quantile(means, alpha, axis=1)
+        upper[start:start + chunk] = np.quantile(means, 1 - alpha, axis=1)
+    return lower, upper
+
+
+def pass_at_k(n, c, k):
+    """
+    无偏 pass@k 估计（向量化）：1 - C(n-c, k) / C(n, k)
+    n: 每组样本数，c: 每组通过数；样本数不足 k 的组返回 NaN
+    """
+    n = np.asarray(n, dtype=float)
+    c = np.asarray(c, dtype=float)
+    result = np.ones_like(n)
+    # C(n-c, k) / C(n, k) = prod_{j=0}^{k-1} (n-c-j) / (n-j)
+    for j in range(k):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result *= np.clip(n - c - j, 0, None) / (n - j)
+    result = 1 - result
+    result[n < k] = np.nan
+    return result
+
+
+def aggregate_samples(df, pass_threshold=60, ks=(1, 5, 10), n_boot=1000, confidence=0.95):
+    """
+    按 (case_id, model_name) 聚合重复采样的得分
+
+    Args:
+        df: 至少包含 case_id, model_name, score 三列的 DataFrame（每行一次采样）
+        pass_threshold: 判定为 "通过" 的最低分
+        ks: 需要计算的 pass@k 列表
+
+    Returns:
+        DataFrame: case_id, model_name, n, mean, std, ci_low, ci_high, pass_rate, pass@k...
+    """
+    columns = ['case_id', 'model_name', 'n', 'mean', 'std', 'ci_low', 'ci_high', 'pass_rate'] + [f'pass@{k}' for k in ks]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    keys = df[['case_id', 'model_name']].astype(str).agg('\x1f'.join, axis=1)
+    group_codes, uniques = pd.factorize(keys)
+    scores = df['score'].to_numpy(dtype=float)
+    n_groups = len(uniques)
+
+    matrix, counts = _pad_groups(scores, group_codes, n_groups)
+    means = _nanmean(matrix, axis=1)
+    squared = np.nansum((matrix - means[:, None]) ** 2, axis=1)
+    stds = np.sqrt(squared / np.maximum(counts - 1, 1))
+    passed = np.nansum(matrix >= pass_threshold, axis=1)
+    ci_low, ci_high = bootstrap_mean_ci(matrix, counts, n_boot=n_boot, confidence=confidence)
+
+    first_rows = df.groupby(group_codes, sort=True)[['case_id', 'model_name']].first()
+    result = first_rows.reset_index(drop=True)
+    result['n'] = counts
+    result['mean'] = means
+    result['std'] = stds
+    result['ci_low'] = ci_low
+    result['ci_high'] = ci_high
+    result['pass_rate'] = passed / counts
+    for k in ks:
+        result[f'pass@{k}'] = pass_at_k(counts, passed, k)
+    return result[columns]
+
+
+# ---------- 排行榜统计：记录 × 评委 矩阵 ----------
+
+def zscore_normalize(matrix):
+    """
+    按评委（列）做 z-score 标准化，消除各评委打分松紧的系统性偏差，
+    再映射回全体评分的均值/标准差，使结果仍处于 0-100 的量纲
+    matrix: (记录数 × 评委数)，缺失/失败的评分为 NaN
+    """
+    col_mean = _nanmean(matrix, axis=0)
+    col_std = _nanstd(matrix, axis=0)
+    col_std = np.where(col_std > 0, col_std, 1.0)
+    z = (matrix - col_mean) / col_std
+
+    valid = matrix[~np.isnan(matrix)]
+    global_mean = valid.mean() if valid.size else 0.0
+    global_std = valid.std() if valid.size else 0.0
+    return z * global_std + global_mean
+
+
+def _rank_columns(matrix):
+    """对每列做平均秩排名（并列取平均秩），NaN 保持为 NaN"""
+    ranks = np.full(matrix.shape, np.nan)
+    for j in range(matrix.shape[1]):
+        col = matrix[:, j]
+        valid = ~np.isnan(col)
+        ranks[valid, j] = pd.Series(col[valid]).rank(method="average").to_numpy()
+    return ranks
+
+
+def spearman_matrix(matrix):
+    """评委两两之间的 Spearman 秩相关（只使用双方都有评分的记录）"""
+    n_judges = matrix.shape[1]
+    result = np.full((n_judges, n_judges), np.nan)
+    for a in range(n_judges):
+        for b in range(a, n_judges):
+            both = ~np.isnan(matrix[:, a]) & ~np.isnan(matrix[:, b])
+            if both.sum() < 3:
+                continue
+            ranks = _rank_columns(matrix[both][:, [a, b]])
+            with np.errstate(invalid="ignore"):
+                rho = np.corrcoef(ranks[:, 0], ranks[:, 1])[0, 1]
+            result[a, b] = result[b, a] = rho
+    return result
+
+
+def kendall_matrix(matrix, max_records=2000, seed=0):
+    """
+    评委两两之间的 Kendall tau-b。成对比较是 O(n²)，记录过多时随机抽样 max_records 条
+    """
+    rng = np.random.default_rng(seed)
+    n_judges = matrix.shape[1]
+    result = np.full((n_judges, n_judges), np.nan)
+    for a in range(n_judges):
+        for b in range(a, n_judges):
+            both = np.flatnonzero(~np.isnan(matrix[:, a]) & ~np.isnan(matrix[:, b]))
+            if both.size < 3:
+                continue
+            if both.size > max_records:
+                both = rng.choice(both, max_records, replace=False)
+            x = matrix[both, a]
+            y = matrix[both, b]
+            dx = np.sign(x[:, None] - x[None, :])
+            dy = np.sign(y[:, None] - y[None, :])
+            upper = np.triu_indices(both.size, k=1)
+            dx, dy = dx[upper], dy[upper]
+            concordance = (dx * dy).sum()
+            denom = np.sqrt((dx != 0).sum() * (dy != 0).sum())
+            result[a, b] = result[b, a] = concordance / denom if denom else np.nan
+    return result
+
+
+def pairwise_wins(case_model_scores):
+    """
+    由 (用例 × 模型) 的平均分矩阵计算两两胜场：同一用例上得分更高记 1 胜，平局各记 0.5
+    Returns:
+        wins: (模型 × 模型)，wins[i, j] 为 i 胜 j 的次数
+    """
+    m = case_model_scores
+    n_models = m.shape[1]
+    wins = np.zeros((n_models, n_models))
+    # 逐个模型与其余所有模型比较，内存占用为 (用例 × 模型)
+    for i in range(n_models):
+        column = m[:, i:i + 1]
+        wins[i] = (column > m).sum(axis=0) + 0.5 * (column == m).sum(axis=0)
+    np.fill_diagonal(wins, 0)
+    return wins
+
+
+def bradley_terry(wins, iterations=200, tol=1e-8, prior=1.0):
+    """
+    Bradley-Terry 模型的 MM 迭代求解（Hunter 2004），返回 Elo 量纲的评分（均值 1500）
+    prior: 每对模型之间额外加入的虚拟平局场数，防止全胜/全败时评分发散
+    """
+    n = wins.shape[0]
+    if n == 0:
+        return np.array([])
+    wins = wins + prior / 2 * (1 - np.eye(n))
+    games = wins + wins.T
+    total_wins = wins.sum(axis=1)
+    strength = np.ones(n)
+    for _ in range(iterations):
+        denom = (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        updated = np.where(denom > 0, total_wins / np.where(denom > 0, denom, 1), strength)
+        updated = np.maximum(updated, 1e-6)
+        updated /= np.exp(np.mean(np.log(updated)))
+        if np.max(np.abs(updated - strength)) < tol:
+            strength = updated
+            break
+        strength = updated
+    return 1500 + 400 * np.log10(strength)
+
+
+def compute_leaderboard(records, matrix, judge_names):
+    """
+    一次性计算排行榜所需的全部统计
+
+    Args:
+        records: DataFrame，每行一条评测记录，包含 case_id, model_name, category
+        matrix: (记录数 × 评委数) 评分矩阵，失败/未评分为 NaN
+        judge_names: 评委名称列表，对应矩阵的列
+
+    Returns:
+        dict: {
+            "models": 每个模型的原始均分、标准化均分、BT/Elo 评分、记录数,
+            "categories": 模型 × 分类的原始均分与标准化均分,
+            "judge_bias": 各评委的均值/标准差/评分数,
+            "spearman": 评委两两 Spearman 相关 DataFrame,
+            "kendall": 评委两两 Kendall tau DataFrame
+        }
+    """
+    normalized = zscore_normalize(matrix)
+    raw_score = _nanmean(matrix, axis=1)
+    norm_score = _nanmean(normalized, axis=1)
+
+    scored = records.assign(raw_score=raw_score, norm_score=norm_score)
+    scored = scored[~np.isnan(raw_score)]
+
+    models = scored.groupby('model_name').agg(
+        raw_score=('raw_score', 'mean'),
+        norm_score=('norm_score', 'mean'),
+        record_count=('raw_score', 'size'),
+    )
+
+    case_model = scored.pivot_table(index='case_id', columns='model_name', values='norm_score', aggfunc='mean')
+    case_model = case_model.reindex(columns=models.index)
+    models['bt_elo'] = bradley_terry(pairwise_wins(case_model.to_numpy(dtype=float)))
+    models = models.sort_values('bt_elo', ascending=False).reset_index()
+
+    categories = scored.groupby(['model_name', 'category']).agg(
+        raw_score=('raw_score', 'mean'),
+        norm_score=('norm_score', 'mean'),
+        record_count=('raw_score', 'size'),
+    ).reset_index()
+
+    judge_bias = pd.DataFrame({
+        'judge': judge_names,
+        'mean': _nanmean(matrix, axis=0),
+        'std': _nanstd(matrix, axis=0),
+        'count': (~np.isnan(matrix)).sum(axis=0),
+    })
+
+    return {
+        "models": models,
+        "categories": categories,
+        "judge_bias": judge_bias,
+        "spearman": pd.DataFrame(spearman_matrix(matrix), index=judge_names, columns=judge_names),
+        "kendall": pd.DataFrame(kendall_matrix(matrix), index=judge_names, columns=judge_names),
+    }
+
+
+# ---------- 环境回归检测：两个运行环境指纹之间的速度/评分差异 ----------
+
+# 参与比较的指标：列名 -> (名称, 方向)，方向 1 表示越大越好，-1 表示越小越好
+REGRESSION_METRICS = {
+    'tokens_per_second': ("生成速度", 1),
+    'prompt_tps': ("预读速度", 1),
+    'ttft_ms': ("首字延迟", -1),
+    'score': ("评分", 1),
+}
+
+
+def permutation_test(a, b, n_perm=2000, seed=0):
+    """两组独立样本均值差的双侧置换检验，返回 p 值（样本不足时为 NaN）"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if len(a) < 2 or len(b) < 2:
+        return np.nan
+    rng = np.random.default_rng(seed)
+    pooled = np.concatenate([a, b])
+    observed = abs(a.mean() - b.mean())
+    extreme = 0
+    # 分块生成置换，控制 (置换次数 × 样本数) 的内存占用
+    chunk = max(1, int(2_000_000 // len(pooled)))
+    for start in range(0, n_perm, chunk):
+        perms = rng.permuted(np.tile(pooled, (min(chunk, n_perm - start), 1)), axis=1)
+        diffs = perms[:, :len(a)].mean(axis=1) - perms[:, len(a):].mean(axis=1)
+        extreme += int((np.abs(diffs) >= observed - 1e-12).sum())
+    return (extreme + 1) / (n_perm + 1)
+
+
+def paired_permutation_test(diffs, n_perm=2000, seed=0):
+    """配对差值的符号翻转置换检验（双侧），返回 p 值（样本不足时为 NaN）"""
+    diffs = np.asarray(diffs, dtype=float)
+    if len(diffs) < 2:
+        return np.nan
+    rng = np.random.default_rng(seed)
+    observed = abs(diffs.mean())
+    signs = rng.choice([-1.0, 1.0], size=(n_perm, len(diffs)))
+    extreme = int((np.abs((signs * diffs).mean(axis=1)) >= observed - 1e-12).sum())
+    return (extreme + 1) / (n_perm + 1)
+
+
+def compare_environments(baseline, candidate, alpha=0.05, min_change=0.05, min_pairs=5, n_perm=2000):
+    """
+    比较同一模型系列在两个运行环境下的各项指标
+
+    两个环境都跑过至少 min_pairs 个相同用例时，按用例取均值后做配对检验（消除用例难度和提示词长度的影响），
+    否则对全部记录做独立样本检验。有 case_hash 列时按 (用例, 实际发送内容哈希) 配对，
+    内容被修改或预检截断的运行不与完整运行配对。速度指标不含 cold_start 记录，评分只统计已评分 (>0) 的记录。
+
+    Args:
+        baseline / candidate: 记录 DataFrame，包含 case_id, cold_start 及 REGRESSION_METRICS 中的列（case_hash 可选）
+        alpha: 显著性水平
+        min_change: 相对变化至少达到该比例才标记为回归/改进
+
+    Returns:
+        DataFrame: metric, label, baseline_mean, candidate_mean, change, n_baseline, n_candidate,
+                   paired_cases, p_value, status (regression / improvement / unchanged / insufficient)
+    """
+    keys = ['case_id', 'case_hash'] if 'case_hash' in baseline and 'case_hash' in candidate else ['case_id']
+    rows = []
+    for metric, (label, direction) in REGRESSION_METRICS.items():
+        values = []
+        for df in (baseline, candidate):
+            valid = df[df[metric].notna() & (df[metric] > 0)]
+            if metric != 'score':
+                valid = valid[valid['cold_start'].fillna(0) == 0]
+            # 旧记录没有 case_hash，互相之间仍按用例配对
+            values.append(valid[keys + [metric]].fillna({'case_hash': ''}))
+        base, cand = values
+
+        base_cases = base.groupby(keys)[metric].mean()
+        cand_cases = cand.groupby(keys)[metric].mean()
+        common = base_cases.index.intersection(cand_cases.index)
+        if len(common) >= min_pairs:
+            base_mean = float(base_cases[common].mean())
+            cand_mean = float(cand_cases[common].mean())
+            p_value = paired_permutation_test((cand_cases[common] - base_cases[common]).to_numpy(), n_perm=n_perm)
+        else:
+            base_mean = float(base[metric].mean()) if len(base) else np.nan
+            cand_mean = float(cand[metric].mean()) if len(cand) else np.nan
+            p_value = permutation_test(base[metric], cand[metric], n_perm=n_perm)
+
+        change = cand_mean / base_mean - 1 if base_mean and not np.isnan(base_mean) else np.nan
+        if np.isnan(p_value) or np.isnan(change):
+            status = "insufficient"
+        elif p_value < alpha and abs(change) >= min_change:
+            status = "improvement" if change * direction > 0 else "regression"
+        else:
+            status = "unchanged"
+        rows.append({
+            'metric': metric, 'label': label, 'baseline_mean': base_mean, 'candidate_mean': cand_mean,
+            'change': change, 'n_baseline': len(base), 'n_candidate': len(cand),
+            'paired_cases': len(common) if len(common) >= min_pairs else 0,
+            'p_value': p_value, 'status': status,
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+合成大数据库生成器与查询耗时报告
+
+database.py 中的统计查询只在个人的小数据库上用过。这里按接近真实的分布生成 test_cases 和 eval_records
+（字段与 init_db 的表结构一致），用来提前了解 SQLite 层在数百个模型、数千个用例、数百万条记录下的表现：
+- 模型：本地 .gguf（系列 × 参数量 × 量化）和远端 provider/model 混合，调用次数按 Zipf 分布（少数模型占大部分记录），
+  每个模型有各自的能力、生成速度、预读速度，部分模型输出思维链
+- 用例：分类、难度、多文件源代码，提示词长度为对数正态分布
+- 记录：生成长度为长尾分布（部分达到 max_tokens 被截断），回答和思维链文本按 token 数生成，
+  五个评委带各自的偏差，少量记录未评分或评委失败，约 1% 的本地记录为冷启动
+
+生成后对每个 get_* 查询和可用的页面渲染 (streamlit AppTest) 计时，输出报告。
+
+注意：默认的文本长度接近真实回答，100 万条记录约占 2~3 GB 磁盘；可以用 --text-scale 缩小。
+
+用法:
+    python synthetic_db.py --db synthetic.db --records 1000000 --models 300 --cases 3000
+    python synthetic_db.py --db synthetic.db --report-only
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import warnings
+
+import numpy as np
+
+CATEGORIES = ["算法", "调试", "重构", "代码解释", "单元测试", "性能优化", "前端", "数据库", "并发", "脚本"]
+LOCAL_FAMILIES = ["qwen2.5-coder", "qwen3", "llama-3.1", "deepseek-coder-v2", "gemma-3", "mistral-small", "phi-4",
+                  "glm-4", "gpt-oss", "codestral", "yi-coder", "granite-code"]
+LOCAL_SIZES = ["1.5B", "3B", "7B", "8B", "14B", "20B", "27B", "32B", "70B"]
+QUANTS = ["Q2_K", "Q3_K_M", "Q4_K_M", "Q5_K_M", "Q6_K", "Q8_0", "IQ4_XS", "BF16"]
+PROVIDERS = ["openai", "anthropic", "google", "deepseek", "qwen", "mistralai", "x-ai", "meta-llama"]
+JUDGE_BIAS = [3.0, -2.0, 0.0, -1.0, 1.0]
+JUDGE_COMMENTS = ["逻辑正确，覆盖了主要边界情况。", "基本可用，但缺少错误处理。", "与参考答案思路一致。",
+                  "存在明显的逻辑错误。", "代码风格良好，解释清晰。", "未完成任务要求的修改。"]
+JUDGE_FAILURE = "评委调用在 3 次重试后仍然失败: 模拟失败"
+
+# 回答和思维链的文本来源（按偏移截取，避免为每条记录拼接字符串）
+_CODE_LINE = "    result = process_item(items[{i}], config=settings)  # 处理第 {i} 项\n"
+_COT_LINE = "首先分析第 {i} 步的输入和边界条件，然后确认修改不会影响其他调用方。\n"
+CHARS_PER_TOKEN = 3.2
+
+
+def _build_corpus(template, chars):
+    lines = []
+    size = 0
+    i = 0
+    while size < chars:
+        line = template.format(i=i)
+        lines.append(line)
+        size += len(line)
+        i += 1
+    return "".join(lines)
+
+
+def build_models(n_models, rng):
+    """生成模型列表及其特征（能力、速度、调用权重）"""
+    models = []
+    names = set()
+    while len(models) < n_models:
+        local = rng.random() < 0.6
+        if local:
+            name = f"{rng.choice(LOCAL_FAMILIES)}-{rng.choice(LOCAL_SIZES)}-instruct-{rng.choice(QUANTS)}.gguf"
+        else:
+            name = f"{rng.choice(PROVIDERS)}/{rng.choice(LOCAL_FAMILIES)}-{rng.integers(1, 9)}.{rng.integers(0, 10)}"
+        if name in names:
+            continue
+        names.add(name)
+        models.append({
+            "name": name,
+            "local": local,
+            "quality": rng.normal(0, 1),
+            "tps": rng.lognormal(np.log(35 if local else 80), 0.6),
+            "prompt_tps": rng.lognormal(np.log(900), 0.7) if local else 0.0,
+            "ttft_ms": 0.0 if local else rng.lognormal(np.log(800), 0.6),
+            "thinking": rng.random() < 0.3,
+        })
+    weights = 1 / np.arange(1, n_models + 1) ** 1.1
+    rng.shuffle(weights)
+    return models, weights / weights.sum()
+
+
+def build_cases(n_cases, rng, text_scale, corpus):
+    """生成测试用例（分类、难度、多文件源代码）"""
+    cases = []
+    for i in range(n_cases):
+        prompt_tokens = int(np.clip(rng.lognormal(np.log(3000), 0.9), 200, 120000))
+        n_files = int(rng.integers(1, 7))
+        file_chars = max(40, int(prompt_tokens * CHARS_PER_TOKEN * text_scale / n_files))
+        files = {}
+        for f in range(n_files):
+            offset = int(rng.integers(0, max(1, len(corpus) - file_chars)))
+            files[f"src/module_{i}_{f}.py"] = corpus[offset:offset + file_chars]
+        category = CATEGORIES[int(rng.integers(0, len(CATEGORIES)))]
+        cases.append({
+            "title": f"{category}-{i:05d}",
+            "category": category,
+            "source_code": json.dumps(files, ensure_ascii=False),
+            "prompt": f"用例 {i}：请根据上面的代码完成{category}任务，并说明修改理由。",
+            "reference_answer": corpus[:max(40, int(1200 * text_scale))],
+            "difficulty": rng.normal(0, 1),
+            "prompt_tokens": prompt_tokens,
+            "case_hash": hashlib.sha256(f"case-{i}".encode()).hexdigest(),
+        })
+    return cases
+
+
+def _record_rows(start, count, total, models, weights, cases, rng, text_scale, corpus, cot_corpus, max_tokens, t0,
+                 span_s):
+    """向量化生成一批记录（返回 executemany 的参数列表）"""
+    n_models = len(models)
+    model_idx = rng.choice(n_models, size=count, p=weights)
+    case_idx = rng.integers(0, len(cases), size=count)
+
+    quality = np.array([m["quality"] for m in models])[model_idx]
+    local = np.array([m["local"] for m in models])[model_idx]
+    thinking = np.array([m["thinking"] for m in models])[model_idx]
+    difficulty = np.array([c["difficulty"] for c in cases])[case_idx]
+    prompt_tokens = np.array([c["prompt_tokens"] for c in cases])[case_idx]
+
+    completion = np.clip(rng.lognormal(np.log(600), 0.9, count), 20, max_tokens).astype(int)
+    truncated = completion >= max_tokens
+    tps = np.array([m["tps"] for m in models])[model_idx] * rng.lognormal(0, 0.15, count)
+    prompt_tps = np.array([m["prompt_tps"] for m in models])[model_idx] * rng.lognormal(0, 0.2, count)
+    ttft = np.where(local, prompt_tokens / np.maximum(prompt_tps, 1) * 1000,
+                    np.array([m["ttft_ms"] for m in models])[model_idx] * rng.lognormal(0, 0.4, count))
+    cold = local & (rng.random(count) < 0.01)
+    ttft = np.where(cold, ttft + rng.uniform(5000, 60000, count), ttft)
+    total_ms = ttft + completion / tps * 1000
+
+    base = 55 + 12 * quality - 8 * difficulty
+    judge_scores = np.clip(np.rint(base[:, None] + np.array(JUDGE_BIAS)[None, :] + rng.normal(0, 12, (count, 5))), 1, 100)
+    failed = rng.random((count, 5)) < 0.01
+    unscored = rng.random(count) < 0.08
+    top2_run = rng.random(count) < 0.1
+    judge_scores[failed] = 0
+    judge_scores[unscored] = 0
+    judge_scores[~top2_run, 3] = np.nan
+    with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        valid = np.where(judge_scores > 0, judge_scores, np.nan)
+        eval_score = np.nan_to_num(np.nanmean(valid, axis=1), nan=0.0)
+
+    temperature = rng.choice([0.0, 0.7, 1.0], size=count, p=[0.7, 0.2, 0.1])
+    cot_chars = np.where(thinking, rng.lognormal(np.log(2000), 0.8, count) * text_scale, 0).astype(int)
+    response_chars = np.maximum(20, (completion * CHARS_PER_TOKEN * text_scale).astype(int))
+    offsets = rng.integers(0, len(corpus) // 2, size=count)
+    cot_offsets = rng.integers(0, len(cot_corpus) // 2, size=count)
+    comment_idx = rng.integers(0, len(JUDGE_COMMENTS), size=(count, 5))
+    created = t0 + (start + np.arange(count)) / max(1, total) * span_s
+
+    rows = []
+    for i in range(count):
+        case = cases[case_idx[i]]
+        model = models[model_idx[i]]
+        scores = []
+        for j in range(5):
+            score = judge_scores[i, j]
+            if np.isnan(score):
+                scores.extend([None, None])
+            elif unscored[i]:
+                scores.extend([0, "待评分"])
+            elif score == 0:
+                scores.extend([0, JUDGE_FAILURE])
+            else:
+                scores.extend([int(score), JUDGE_COMMENTS[comment_idx[i, j]]])
+        judges_run = None if unscored[i] else ",".join(
+            level for level, ran in zip(("gem", "opus", "gpt", "top2", "top"), [True, True, True, top2_run[i], True])
+            if ran)
+        offset = int(offsets[i])
+        cot = cot_corpus[cot_offsets[i]:cot_offsets[i] + cot_chars[i]] if cot_chars[i] else None
+        rows.append((
+            int(case_idx[i]) + 1, model["name"], float(temperature[i]),
+            corpus[offset:offset + response_chars[i]], cot,
+            int(prompt_tokens[i]), int(completion[i]), float(total_ms[i]), float(tps[i]), float(prompt_tps[i]),
+            131072 if model["local"] else 0, float(ttft[i]), "length" if truncated[i] else "stop", int(cold[i]),
+            f"synthetic-{(start + i) // 50:06d}", case["case_hash"],
+            f"{case['case_hash'][:32]}-{model_idx[i]}-{temperature[i]:g}", 0, judges_run,
+            float(eval_score[i]), "待评分" if unscored[i] else "综合评分",
+            *scores,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(created[i])),
+        ))
+    return rows
+
+
+RECORD_COLUMNS = [
+    "case_id", "model_name", "temperature", "local_response", "chain_of_thought",
+    "prompt_tokens", "completion_tokens", "total_time_ms", "tokens_per_second", "prompt_tps",
+    "max_context", "ttft_ms", "finish_reason", "cold_start",
+    "job_id", "case_hash", "run_fingerprint", "sample_index", "judges_run",
+    "eval_score", "eval_comment",
+    "eval_score_1", "eval_comment_1", "eval_score_2", "eval_comment_2", "eval_score_3", "eval_comment_3",
+    "eval_score_4", "eval_comment_4", "eval_score_5", "eval_comment_5",
+    "created_at",
+]
+
+
+def generate_database(db_path, n_records=1_000_000, n_models=300, n_cases=3000, text_scale=1.0, max_tokens=8192,
+                      seed=0, batch_size=20_000, progress=None):
+    """
+    生成合成数据库（已存在的 test_cases / eval_records 会被清空）
+
+    Args:
+        text_scale: 回答、思维链和源代码的长度倍数（1.0 接近真实长度）
+        progress: 可选回调 progress(written, total)
+    """
+    from init_db import init_db
+    init_db(db_path=db_path)
+
+    rng = np.random.default_rng(seed)
+    corpus = _build_corpus(_CODE_LINE, int(max_tokens * CHARS_PER_TOKEN * max(text_scale, 0.01)) * 2 + 4096)
+    cot_corpus = _build_corpus(_COT_LINE, int(40000 * max(text_scale, 0.01)) + 4096)
+    models, weights = build_models(n_models, rng)
+    cases = build_cases(n_cases, rng, text_scale, corpus)
+
+    conn = sqlite3.connect(db_path)
+    # 只影响生成过程：关闭同步写入加快批量插入
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("DELETE FROM eval_records")
+    conn.execute("DELETE FROM test_cases")
+    conn.executemany(
+        "INSERT INTO test_cases (id, title, category, source_code, prompt, reference_answer) VALUES (?, ?, ?, ?, ?, ?)",
+        [(i + 1, c["title"], c["category"], c["source_code"], c["prompt"], c["reference_answer"])
+         for i, c in enumerate(cases)]
+    )
+
+    insert_sql = (f"INSERT INTO eval_records ({', '.join(RECORD_COLUMNS)}) "
+                  f"VALUES ({', '.join(['?' for _ in RECORD_COLUMNS])})")
+    t0 = time.time() - 365 * 86400
+    written = 0
+    while written < n_records:
+        count = min(batch_size, n_records - written)
+        conn.executemany(insert_sql, _record_rows(written, count, n_records, models, weights, cases, rng, text_scale, corpus,
+                                                  cot_corpus, max_tokens, t0, 365 * 86400))
+        conn.commit()
+        written += count
+        if progress is not None:
+            progress(written, n_records)
+    conn.close()
+    return {"models": n_models, "cases": n_cases, "records": n_records,
+            "size_mb": os.path.getsize(db_path) / 1024 / 1024}
+
+
+def _sample_arguments():
+    """从数据库中取查询参数：记录最多的模型和用例、最近的记录 ID"""
+    from database import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    model = cursor.execute("SELECT model_name FROM eval_records GROUP BY model_name ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    case = cursor.execute("SELECT case_id FROM eval_records GROUP BY case_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    ids = [row[0] for row in cursor.execute("SELECT id FROM eval_records ORDER BY id DESC LIMIT 200")]
+    fingerprints = [row[0] for row in cursor.execute(
+        "SELECT run_fingerprint FROM eval_records ORDER BY id DESC LIMIT 200")]
+    conn.close()
+    return (model[0] if model else ""), (case[0] if case else 0), ids, fingerprints
+
+
+def query_benchmarks():
+    """需要计时的查询：名称 -> 无参调用"""
+    import database
+    model, case_id, ids, fingerprints = _sample_arguments()
+    return {
+        "get_all_test_cases": database.get_all_test_cases,
+        "get_all_models": database.get_all_models,
+        "get_stats": database.get_stats,
+        "get_eval_history()": database.get_eval_history,
+        "get_eval_history(case_id)": lambda: database.get_eval_history(case_id=case_id),
+        "get_eval_history(model_name)": lambda: database.get_eval_history(model_name=model),
+        "get_eval_record_by_id": lambda: database.get_eval_record_by_id(ids[0] if ids else 0),
+        "get_eval_records_by_ids(200)": lambda: database.get_eval_records_by_ids(ids),
+        "get_fingerprint_counts(200)": lambda: database.get_fingerprint_counts(fingerprints),
+        "get_model_latency_samples": lambda: database.get_model_latency_samples(model),
+        "get_model_summary_stats(全部)": database.get_model_summary_stats,
+        "get_model_summary_stats(本地模型)": lambda: database.get_model_summary_stats("本地模型"),
+        "get_model_detail_stats": lambda: database.get_model_detail_stats(model),
+        "get_case_summary_stats": database.get_case_summary_stats,
+        "get_case_model_ranking": lambda: database.get_case_model_ranking(case_id),
+        "get_model_speed_ranking": database.get_model_speed_ranking,
+        "get_sample_stats": database.get_sample_stats,
+        "get_leaderboard_stats": database.get_leaderboard_stats,
+        "count_filtered_records": lambda: database.count_filtered_records({"model_names": [model]}),
+        "get_run_environments": database.get_run_environments,
+    }
+
+
+# 页面渲染：(名称, 模块, 函数, 是否需要任务管理器)
+PAGE_RENDERS = [
+    ("用例管理", "modules.case_manager", "render_case_manager", False),
+    ("执行测试", "modules.test_runner", "render_test_runner", True),
+    ("历史记录", "modules.history", "render_history", False),
+    ("统计分析", "modules.stats", "render_stats", False),
+    ("运行日志", "modules.log_viewer", "render_log_viewer", True),
+    ("吞吐测试", "modules.throughput_view", "render_throughput_profiler", True),
+    ("回归对比", "modules.regression_view", "render_regression_tracker", False),
+]
+
+
+def time_page_render(db_path, module, function, needs_task_mgr, timeout=600):
+    """使用 streamlit AppTest 在无界面模式下渲染一个页面，返回 (耗时秒数, 异常信息)"""
+    from streamlit.testing.v1 import AppTest
+    args = "BackgroundTaskManager()" if needs_task_mgr else ""
+    script = (
+        "import database\n"
+        f"database.DB_PATH = {db_path!r}\n"
+        "from background_tasks import BackgroundTaskManager\n"
+        f"from {module} import {function}\n"
+        f"{function}({args})\n"
+    )
+    app = AppTest.from_string(script, default_timeout=timeout)
+    start = time.perf_counter()
+    app.run()
+    elapsed = time.perf_counter() - start
+    errors = [str(e.value) for e in app.exception] if app.exception else []
+    return elapsed, "; ".join(errors)
+
+
+def timing_report(db_path, rounds=3, pages=True):
+    """
+    对每个查询计时：cold 为清空缓存后的中位数耗时，warm 为紧接着再次调用（命中 st.cache_data 时接近 0）
+
+    Returns:
+        list[dict]: name、kind (query / page)、cold_ms、warm_ms、rows、error
+    """
+    import importlib.util
+
+    import database
+    database.DB_PATH = db_path
+    report = []
+    for name, query in query_benchmarks().items():
+        timings = []
+        result = None
+        error = ""
+        for _ in range(rounds):
+            database.clear_cache()
+            start = time.perf_counter()
+            try:
+                result = query()
+            except Exception as e:
+                error = str(e)
+                break
+            timings.append(time.perf_counter() - start)
+        warm_ms = None
+        if not error:
+            start = time.perf_counter()
+            query()
+            warm_ms = (time.perf_counter() - start) * 1000
+        report.append({
+            "name": name, "kind": "query",
+            "cold_ms": float(np.median(timings)) * 1000 if timings else None, "warm_ms": warm_ms,
+            "rows": len(result) if hasattr(result, "shape") else None, "error": error,
+        })
+
+    if pages:
+        for label, module, function, needs_task_mgr in PAGE_RENDERS:
+            if importlib.util.find_spec(module) is None:
+                report.append({"name": f"render: {label}", "kind": "page", "cold_ms": None, "warm_ms": None,
+                               "rows": None, "error": "页面模块不存在"})
+                continue
+            database.clear_cache()
+            cold_s, error = time_page_render(db_path, module, function, needs_task_mgr)
+            warm_s, _ = time_page_render(db_path, module, function, needs_task_mgr)
+            report.append({"name": f"render: {label}", "kind": "page", "cold_ms": cold_s * 1000,
+                           "warm_ms": warm_s * 1000, "rows": None, "error": error})
+    return report
+
+
+def print_report(report):
+    print(f"\n{'查询 / 页面':<36}{'cold (ms)':>12}{'warm (ms)':>12}{'行数':>10}  备注")
+    for row in sorted(report, key=lambda r: -(r["cold_ms"] or 0)):
+        cold = f"{row['cold_ms']:.1f}" if row["cold_ms"] is not None else "-"
+        warm = f"{row['warm_ms']:.1f}" if row["warm_ms"] is not None else "-"
+        rows = str(row["rows"]) if row["rows"] is not None else ""
+        print(f"{row['name']:<36}{cold:>12}{warm:>12}{rows:>10}  {row['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成大数据库生成器与查询耗时报告")
+    parser.add_argument("--db", default="synthetic.db", help="生成的数据库文件（不要指向正式的 eval_results.db）")
+    parser.add_argument("--records", type=int, default=1_000_000, help="评测记录数")
+    parser.add_argument("--models", type=int, default=300, help="模型数")
+    parser.add_argument("--cases", type=int, default=3000, help="测试用例数")
+    parser.add_argument("--text-scale", type=float, default=1.0, help="回答/思维链/源代码长度倍数，1.0 接近真实长度")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=3, help="每个查询的计时轮数")
+    parser.add_argument("--report-only", action="store_true", help="不重新生成，只对已有数据库计时")
+    parser.add_argument("--no-pages", action="store_true", help="不计时页面渲染")
+    parser.add_argument("--json", default=None, help="把报告保存为 JSON")
+    args = parser.parse_args()
+
+    if sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+    if os.path.basename(args.db) == "eval_results.db":
+        parser.error("请不要覆盖正式数据库 eval_results.db")
+
+    if not args.report_only:
+        start = time.time()
+
+        def show_progress(written, total):
+            elapsed = time.time() - start
+            print(f"\r已生成 {written}/{total} 条记录 ({elapsed:.0f}s)", end="", flush=True)
+
+        info = generate_database(args.db, args.records, args.models, args.cases, args.text_scale, seed=args.seed,
+                                 progress=show_progress)
+        print(f"\n生成完成：{info['models']} 个模型，{info['cases']} 个用例，{info['records']} 条记录，"
+              f"{info['size_mb']:.0f} MB，耗时 {time.time() - start:.0f}s")
+
+    report = timing_report(args.db, rounds=args.rounds, pages=not args.no_pages)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
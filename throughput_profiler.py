@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+端点吞吐测试：扫描 并发数 × 提示词长度
+
+用合成提示词（每个请求带不同的前缀，避免命中前缀缓存）通过 call_llm 的流式路径压测一个端点，
+每个测试点记录聚合吞吐 (所有流的 tokens/s)、单流生成速度、TTFT 分位数和预读速度，
+结果保存到 throughput_profiles 表，用于比较不同 -np / batch 参数和量化版本。
+
+测试请求不经过端点调度器（本地槽位调度和远端服务商整形），每个测试点的请求同时发出，
+测到的是端点本身的并发能力。本地端点的并发数超过槽位数时，多出的请求在服务端排队，
+聚合吞吐会在槽位数处趋于平稳，TTFT 包含服务端的排队时间。远端端点注意服务商的频率限制。
+
+用法:
+    python throughput_profiler.py --base http://10.0.0.114:8080/v1 --model your-model.gguf
+    python throughput_profiler.py --base http://10.0.0.114:8080/v1 --concurrency 1,2,4,8 \\
+        --prompt-lengths 1024,4096,16384 --max-tokens 256
+"""
+import argparse
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+import config
+from config_utils import get_list_setting, get_setting
+from event_log import debug
+from server_props import props_cache, count_tokens
+
+# 合成提示词的填充内容（类似代码的文本，分词结果接近真实用例）
+_FILLER_LINE = "def helper_{i}(values):\n    return sum(v * {i} for v in values if v % {m} == 0)\n"
+# 生成任务：让模型持续输出直到达到 max_tokens
+_TASK = "\n\n请忽略上面的代码，从 1 开始依次输出正整数，用英文逗号分隔，不要输出任何其他内容。"
+
+_line_tokens_cache = {}
+
+
+def _tokens_per_line(api_base):
+    """估算每行填充内容的 token 数（本地端点使用 /tokenize，按端点缓存）"""
+    if api_base not in _line_tokens_cache:
+        sample = "".join(_FILLER_LINE.format(i=i, m=i % 7 + 2) for i in range(100, 200))
+        _line_tokens_cache[api_base] = max(1.0, count_tokens(api_base, sample) / 100)
+    return _line_tokens_cache[api_base]
+
+
+def build_synthetic_prompt(api_base, target_tokens, nonce):
+    """
+    构造约 target_tokens 个 token 的合成提示词
+    nonce 放在最前面，保证每个请求的前缀都不同，测到的是完整的预读速度
+    """
+    lines = max(1, int(target_tokens / _tokens_per_line(api_base)))
+    body = "".join(_FILLER_LINE.format(i=i, m=i % 7 + 2) for i in range(lines))
+    return f"# benchmark run {nonce}\n{body}{_TASK}"
+
+
+def default_prompt_lengths(n_ctx, max_tokens):
+    """默认的提示词长度：从 1024 开始翻倍，直到 n_ctx（未知时最多 16384）"""
+    limit = (n_ctx or 16384) - max_tokens - 256
+    lengths = []
+    length = 1024
+    while length <= limit:
+        lengths.append(length)
+        length *= 2
+    if n_ctx and lengths and limit - lengths[-1] > lengths[-1] // 4:
+        lengths.append(limit)
+    return lengths or [max(256, limit)]
+
+
+def default_concurrency_levels(total_slots):
+    """默认的并发数：1, 2, 4 ... 直到槽位数的 2 倍（未知时为 4）"""
+    limit = max(1, total_slots) * 2 if total_slots else 4
+    levels = []
+    level = 1
+    while level < limit:
+        levels.append(level)
+        level *= 2
+    levels.append(limit)
+    return levels
+
+
+def run_profile_point(api_base, api_key, model_id, concurrency, prompt_tokens, max_tokens, cancel_token=None):
+    """
+    同时发出 concurrency 个请求，统计一个测试点
+
+    Returns:
+        dict: concurrency、prompt_tokens_target、prompt_tokens (实际平均值)、requests、errors、wall_time_ms、
+              aggregate_tps、per_stream_tps、ttft_ms_p50、ttft_ms_p95、prompt_tps、error
+    """
+    from llm_client import call_llm
+
+    results = [None] * concurrency
+    errors = []
+    timings = [None] * concurrency
+    prompts = [build_synthetic_prompt(api_base, prompt_tokens, uuid.uuid4().hex) for _ in range(concurrency)]
+    barrier = threading.Barrier(concurrency)
+
+    def worker(index):
+        try:
+            barrier.wait(timeout=30)
+        except threading.BrokenBarrierError:
+            pass
+        start = time.time()
+        try:
+            results[index] = call_llm("", prompts[index], api_base, api_key, model_id, full_prompt=prompts[index],
+                                      cancel_token=cancel_token, max_tokens=max_tokens, schedule=False)
+        except Exception as e:
+            errors.append(str(e))
+        timings[index] = (start, time.time())
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    done = [res for res in results if res is not None and res.get("finish_reason") != "cancelled"]
+    finished = [timing for timing in timings if timing is not None]
+    wall_s = max(end for _, end in finished) - min(start for start, _ in finished) if finished else 0.0
+    ttft = [res["ttft_ms"] for res in done if res.get("ttft_ms")]
+    point = {
+        "concurrency": concurrency,
+        "prompt_tokens_target": prompt_tokens,
+        "max_tokens": max_tokens,
+        "requests": concurrency,
+        "errors": concurrency - len(done),
+        "wall_time_ms": wall_s * 1000,
+        "prompt_tokens": float(np.mean([res["prompt_tokens"] for res in done])) if done else 0.0,
+        "completion_tokens": sum(res["completion_tokens"] for res in done),
+        "aggregate_tps": sum(res["completion_tokens"] for res in done) / wall_s if done and wall_s > 0 else 0.0,
+        "per_stream_tps": float(np.mean([res["tps"] for res in done])) if done else 0.0,
+        "ttft_ms_p50": float(np.percentile(ttft, 50)) if ttft else 0.0,
+        "ttft_ms_p95": float(np.percentile(ttft, 95)) if ttft else 0.0,
+        "prompt_tps": float(np.mean([res["prompt_tps"] for res in done if res["prompt_tps"]] or [0.0])),
+        "error": errors[0] if errors else "",
+    }
+    debug(f"吞吐测试点 并发={concurrency} 提示词={prompt_tokens}: 聚合 {point['aggregate_tps']:.1f} t/s, "
+          f"单流 {point['per_stream_tps']:.1f} t/s, TTFT p50 {point['ttft_ms_p50']:.0f} ms", model=model_id)
+    return point
+
+
+def run_throughput_sweep(api_base=None, api_key=None, model_id=None, concurrency_levels=None, prompt_lengths=None,
+                         max_tokens=None, cancel_token=None, on_point=None):
+    """
+    扫描所有 (提示词长度, 并发数) 组合，每个测试点完成后保存到数据库
+
+    Args:
+        concurrency_levels: 并发数列表，None 时读取 PROFILER_CONCURRENCY，仍为空则按槽位数生成
+        prompt_lengths: 提示词长度列表，None 时读取 PROFILER_PROMPT_LENGTHS，仍为空则从 1024 翻倍到 n_ctx
+        max_tokens: 每个请求的生成长度，None 时读取 PROFILER_MAX_TOKENS (256)
+        on_point: 可选回调 on_point(point, index, total)，每个测试点完成或跳过后调用
+
+    Returns:
+        str: 本次扫描的 run_id
+    """
+    from database import save_throughput_point
+    from warmup import warm_up_model
+
+    api_base = api_base or config.LOCAL_MODEL_URL
+    api_key = api_key or config.LOCAL_MODEL_KEY
+    model_id = model_id or config.LOCAL_MODEL_ID
+    max_tokens = max_tokens or get_setting("PROFILER_MAX_TOKENS", 256)
+
+    meta = props_cache.prefetch(api_base) or {}
+    n_ctx = meta.get("n_ctx", 0)
+    total_slots = meta.get("total_slots", 0)
+    concurrency_levels = concurrency_levels or [int(v) for v in get_list_setting("PROFILER_CONCURRENCY")] \
+        or default_concurrency_levels(total_slots)
+    prompt_lengths = prompt_lengths or [int(v) for v in get_list_setting("PROFILER_PROMPT_LENGTHS")] \
+        or default_prompt_lengths(n_ctx, max_tokens)
+
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    points = [(length, concurrency) for length in prompt_lengths for concurrency in concurrency_levels]
+
+    # 先预热，避免第一个测试点包含模型加载时间
+    warm_up_model(api_base, api_key, model_id, cancel_token)
+
+    for index, (length, concurrency) in enumerate(points):
+        if cancel_token is not None and cancel_token.cancelled:
+            break
+        if n_ctx and length + max_tokens > n_ctx:
+            point = {"concurrency": concurrency, "prompt_tokens_target": length, "skipped": True,
+                     "error": f"提示词 + 生成长度超过 n_ctx={n_ctx}"}
+        else:
+            point = run_profile_point(api_base, api_key, model_id, concurrency, length, max_tokens, cancel_token)
+            if cancel_token is not None and cancel_token.cancelled:
+                break
+            point.update({
+                "run_id": run_id,
+                "api_base": api_base,
+                "model_name": model_id,
+                "model_path": meta.get("model_path", ""),
+                "n_ctx": n_ctx,
+                "total_slots": total_slots,
+            })
+            save_throughput_point(point)
+        if on_point is not None:
+            on_point(point, index + 1, len(points))
+    return run_id
+
+
+def _parse_int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()] if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端点吞吐测试：扫描并发数 × 提示词长度")
+    parser.add_argument("--base", default=None, help="OpenAI 兼容地址，默认 LOCAL_MODEL_URL")
+    parser.add_argument("--key", default=None, help="API Key，默认 LOCAL_MODEL_KEY")
+    parser.add_argument("--model", default=None, help="模型 ID，默认 LOCAL_MODEL_ID")
+    parser.add_argument("--concurrency", default=None, help="并发数列表，逗号分隔，例如 1,2,4,8")
+    parser.add_argument("--prompt-lengths", default=None, help="提示词长度列表 (tokens)，例如 1024,4096,16384")
+    parser.add_argument("--max-tokens", type=int, default=None, help="每个请求的生成长度，默认 256")
+    args = parser.parse_args()
+
+    if sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    from init_db import init_db
+    init_db()
+
+    def print_point(point, index, total):
+        if point.get("skipped"):
+            print(f"[{index}/{total}] 并发 {point['concurrency']:>3} | 提示词 {point['prompt_tokens_target']:>6} | 跳过：{point['error']}")
+            return
+        print(f"[{index}/{total}] 并发 {point['concurrency']:>3} | 提示词 {point['prompt_tokens_target']:>6} | "
+              f"聚合 {point['aggregate_tps']:8.1f} t/s | 单流 {point['per_stream_tps']:7.1f} t/s | "
+              f"TTFT p50 {point['ttft_ms_p50']:8.0f} ms p95 {point['ttft_ms_p95']:8.0f} ms | "
+              f"预读 {point['prompt_tps']:8.1f} t/s | 失败 {point['errors']}")
+
+    run_id = run_throughput_sweep(args.base, args.key, args.model, _parse_int_list(args.concurrency),
+                                  _parse_int_list(args.prompt_lengths), args.max_tokens, on_point=print_point)
+    print(f"吞吐测试完成，结果已保存 (run_id: {run_id})")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ The actual implementations have been refactored into separate modules:
 - pages/test_runner.py   - render_test_runner
 - pages/history.py       - render_history
 - pages/stats.py         - render_stats
+- pages/log_viewer.py    - render_log_viewer
+- pages/throughput_view.py - render_throughput_profiler
+- pages/regression_view.py - render_regression_tracker
 """
 
 from modules.sidebar import render_sidebar
@@ -18,11 +21,28 @@ from modules.case_manager import render_case_manager
 from modules.test_runner import render_test_runner
 from modules.history import render_history
 from modules.stats import render_stats
+from modules.log_viewer import render_log_viewer
+from modules.throughput_view import render_throughput_profiler
+from modules.regression_view import render_regression_tracker
+from profiling import profiled
+
+# 开启 PROFILING 时记录每个页面的渲染耗时（每次 Streamlit 重新运行都会调用）
+render_sidebar = profiled()(render_sidebar)
+render_case_manager = profiled()(render_case_manager)
+render_test_runner = profiled()(render_test_runner)
+render_history = profiled()(render_history)
+render_stats = profiled()(render_stats)
+render_log_viewer = profiled()(render_log_viewer)
+render_throughput_profiler = profiled()(render_throughput_profiler)
+render_regression_tracker = profiled()(render_regression_tracker)
 
 __all__ = [
     'render_sidebar',
     'render_case_manager',
     'render_test_runner',
     'render_history',
-    'render_stats'
+    'render_stats',
+    'render_log_viewer',
+    'render_throughput_profiler',
+    'render_regression_tracker'
 ]
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+模型预热与加载检测
+
+本地 llama.cpp / llama-swap 上某个模型的第一次请求包含加载模型的时间，
+首个用例的 total_time_ms 偏大、prompt_tps 偏小，拉低了该模型的速度统计。
+- 任务开始时可以先向 (端点, 模型) 发送一个只生成 1 个 token 的预热请求
+- 每条记录生成后检查首字延迟是否异常（预读速度远低于该模型的正常水平），
+  异常的记录标记 cold_start，不计入速度统计
+"""
+import threading
+import time
+
+import numpy as np
+
+import config
+from config_utils import get_setting
+from event_log import debug
+from generation_budget import get_latency_profile
+from server_props import get_server_root
+
+# 预热请求的提示词（尽量短，只为触发模型加载）
+WARMUP_PROMPT = "ping"
+
+
+class ColdStartDetector:
+    """按 (端点, 模型) 记录预热状态和本次运行中的预读速度样本（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._warmed = {}
+        self._seen = set()
+        self._prompt_tps = {}
+
+    def reset(self):
+        """新任务开始时清空（模型可能在两次任务之间被卸载）"""
+        with self._lock:
+            self._warmed.clear()
+            self._seen.clear()
+            self._prompt_tps.clear()
+
+    def mark_warmed(self, api_base, model_name):
+        with self._lock:
+            self._warmed[(get_server_root(api_base), model_name)] = time.time()
+
+    def is_warmed(self, api_base, model_name):
+        with self._lock:
+            return (get_server_root(api_base), model_name) in self._warmed
+
+    @staticmethod
+    def _reference_prompt_tps(samples, model_name):
+        """正常预读速度：优先使用本次运行中的样本，不足时使用历史记录的中位数（会查询数据库，不要持锁调用）"""
+        if len(samples) >= 3:
+            return float(np.median(samples))
+        profile = get_latency_profile(model_name)
+        if profile["samples"] >= get_setting("ADAPTIVE_TIMEOUT_MIN_SAMPLES", 10):
+            return profile["prompt_tps_p50"]
+        return 0.0
+
+    def check(self, api_base, model_name, local_res, prefix_reused=False):
+        """
+        判断一次生成的首字延迟是否包含模型加载时间
+
+        prefix_reused 表示该请求可能命中前缀缓存（同组的第 2 个及之后的用例、同一用例的后续采样）。
+        服务端没有返回实际预读的 token 数（llama.cpp timings.prompt_n）时，这类请求的预读速度
+        按全部提示词 token 计算会虚高，不作为参考样本。
+
+        Returns:
+            tuple: (是否为冷启动, 原因说明)
+        """
+        key = (get_server_root(api_base), model_name)
+        ttft_s = (local_res.get("ttft_ms") or 0) / 1000
+        prompt_tps = local_res.get("prompt_tps") or 0
+        with self._lock:
+            first_request = key not in self._seen and key not in self._warmed
+            self._seen.add(key)
+            samples = list(self._prompt_tps.get(key, []))
+        reference = self._reference_prompt_tps(samples, model_name)
+
+        cold, reason = False, ""
+        if ttft_s >= get_setting("COLD_START_MIN_TTFT_S", 2.0):
+            factor = get_setting("COLD_START_FACTOR", 3.0)
+            if reference > 0 and prompt_tps > 0 and prompt_tps * factor < reference:
+                cold = True
+                reason = f"预读速度 {prompt_tps:.1f} t/s 低于正常水平 {reference:.1f} t/s 的 1/{factor:g}"
+            elif reference <= 0 and first_request:
+                cold = True
+                reason = f"未预热的首次请求，首字延迟 {ttft_s:.1f}s"
+
+        measured = local_res.get("prompt_n") is not None
+        if not cold and prompt_tps > 0 and (measured or not prefix_reused):
+            with self._lock:
+                self._prompt_tps.setdefault(key, []).append(prompt_tps)
+        return cold, reason
+
+
+# 全局共享实例
+cold_start_detector = ColdStartDetector()
+
+
+def warm_up_model(api_base, api_key, model_id, cancel_token=None):
+    """
+    发送预热请求（只生成 1 个 token），触发服务端加载模型
+
+    Returns:
+        dict: {"ok", "duration_ms", "ttft_ms", "error"}
+    """
+    from llm_client import call_llm
+    api_base = api_base or config.LOCAL_MODEL_URL
+    model_id = model_id or config.LOCAL_MODEL_ID
+    try:
+        res = call_llm("", WARMUP_PROMPT, api_base, api_key, model_id, full_prompt=WARMUP_PROMPT,
+                       cancel_token=cancel_token, max_tokens=1,
+                       first_token_timeout_s=get_setting("WARMUP_TIMEOUT_S", 600.0))
+    except Exception as e:
+        debug(f"预热请求失败: {e}", model=model_id)
+        return {"ok": False, "duration_ms": 0, "ttft_ms": 0, "error": str(e)}
+
+    cold_start_detector.mark_warmed(api_base, res["model_name"])
+    if res["model_name"] != model_id:
+        cold_start_detector.mark_warmed(api_base, model_id)
+    return {"ok": True, "duration_ms": res["duration_ms"], "ttft_ms": res["ttft_ms"], "error": ""}